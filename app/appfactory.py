@@ -22,11 +22,10 @@
 from flask import Flask
 from flask_cors import CORS
 from app.routes.airscan import airscan_bp
-from app.routes.devices import devices_bp
 from app.routes.initialize import init_bp
 from app.routes.spec import spec_bp
-from app.routes.docs import swaggerui_bp
 from app.routes.backend import backend_bp
+from app.utils import desanity, federation
 
 
 def create_app(cfg):
@@ -37,12 +36,39 @@ def create_app(cfg):
     """
     app = Flask(__name__)
     app.config.from_object(cfg)
+    desanity.configure(app.config)
+    federation.configure(app.config)
+    # a gateway has no devices of its own, its nodes run SANE
+    local = not federation.enabled
+    if app.config.get('DISCOVERY_BACKGROUND') and local:
+        desanity.start_discovery()
+    # a device host opens, parks and probes the devices it owns itself
+    if desanity.host is None and local:
+        desanity.start_warmup()
+        desanity.start_handle_pool()
+        desanity.start_health()
+    # a device host collects the jobs it runs itself
+    if app.config.get('JOB_GC_BACKGROUND') and desanity.host is None \
+            and local:
+        desanity.start_retention()
     api_routes = '/api/v1'
 
-    # register the route blueprints
-    app.register_blueprint(devices_bp, url_prefix=f"{api_routes}/devices")
+    # register the route blueprints, the ones a configuration does not
+    # use are not imported at all
+    # pylint: disable=import-outside-toplevel
+    # a gateway serves the devices of its nodes instead of its own
+    if federation.enabled:
+        from app.routes.gateway import gateway_bp
+        app.register_blueprint(gateway_bp,
+                               url_prefix=f"{api_routes}/devices")
+    else:
+        from app.routes.devices import devices_bp
+        app.register_blueprint(devices_bp,
+                               url_prefix=f"{api_routes}/devices")
     app.register_blueprint(init_bp, url_prefix=f"{api_routes}/init")
-    app.register_blueprint(swaggerui_bp, url_prefix=f"{api_routes}/docs")
+    if app.config.get('API_DOCS'):
+        from app.routes.docs import swaggerui_bp
+        app.register_blueprint(swaggerui_bp, url_prefix=f"{api_routes}/docs")
     app.register_blueprint(spec_bp, url_prefix=f"{api_routes}/spec")
     app.register_blueprint(airscan_bp, url_prefix=f"{api_routes}/airscan")
     app.register_blueprint(backend_bp, url_prefix=f"{api_routes}/backend")
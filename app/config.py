@@ -20,6 +20,10 @@
 
 
 # config ## {{{
+import os
+import tempfile
+
+
 class AppConfig:  # pylint: disable=too-few-public-methods
     """Application base configuration object."""
 
@@ -29,6 +33,44 @@ class AppConfig:  # pylint: disable=too-few-public-methods
     CONFIG = {
         "airscan": "./airscan.conf"
     }
+    SPOOL_DIR = os.path.join(tempfile.gettempdir(), "descry-spool")
+    SPOOL_FORMAT = "PNG"
+    ENCODER_WORKERS = os.cpu_count() or 1
+    ENCODER_MAX_PENDING = None
+    PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+    PREVIEW_SIZES = {
+        "thumbnail": 256,
+        "preview": 1024
+    }
+    REINIT_DEBOUNCE = 2.0
+    DISCOVERY_BACKGROUND = True
+    DISCOVERY_TTL = 300
+    DISCOVERY_MISSES = 2
+    DISCOVERY_CACHE = os.path.join(tempfile.gettempdir(),
+                                   "descry-devices.json")
+    API_DOCS = True
+    WARMUP_DEVICES = []
+    WARMUP_WORKERS = 4
+    HANDLE_IDLE_TIMEOUT = 300
+    HANDLE_SWEEP_INTERVAL = 30
+    HEALTH_INTERVAL = 30
+    HEALTH_MAX_INTERVAL = 600
+    DEVICE_HOST = None
+    DEVICE_HOST_AUTHKEY = None
+    FEDERATION_NODES = []
+    FEDERATION_TTL = 30
+    FEDERATION_TIMEOUT = 10
+    FEDERATION_POOL_SIZE = 4
+    FEDERATION_STREAM_TIMEOUT = 60
+    PROFILE_STORE = "memory"
+    JOB_STORE = "memory"
+    JOB_GC_BACKGROUND = True
+    JOB_GC_INTERVAL = 60
+    JOB_RETENTION_JOBS = 50
+    JOB_RETENTION_AGE = 7 * 24 * 60 * 60
+    JOB_RETENTION_BYTES = None
+    JOB_RETENTION_TOTAL_BYTES = 1024 * 1024 * 1024
+    JOB_RETENTION_TOTAL_JOBS = 500
 
 
 class DevConfig(AppConfig):  # pylint: disable=too-few-public-methods
@@ -51,6 +93,13 @@ class TestConfig(AppConfig):  # pylint: disable=too-few-public-methods
     CONFIG = {
         "airscan": "./airscan.conf"
     }
+    ENCODER_WORKERS = 0
+    REINIT_DEBOUNCE = 0
+    API_DOCS = False
+    HANDLE_IDLE_TIMEOUT = None
+    HEALTH_INTERVAL = None
+    DISCOVERY_BACKGROUND = False
+    JOB_GC_BACKGROUND = False
 
 
 class ProdConfig(AppConfig):  # pylint: disable=too-few-public-methods
@@ -62,6 +111,10 @@ class ProdConfig(AppConfig):  # pylint: disable=too-few-public-methods
     CONFIG = {
         "airscan": "/etc/sane.d/airscan.conf"
     }
+    SPOOL_DIR = "/var/spool/descry"
+    PROFILE_STORE = "redis"
+    JOB_STORE = "redis"
+    DISCOVERY_CACHE = "/var/cache/descry/devices.json"
 
 
 Configs = {
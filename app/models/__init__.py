@@ -12,15 +12,15 @@
 #  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
 #  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
 #  GNU General Public License for more details.                               #
-i###############################################################################
+###############################################################################
 
 # Commentary {{{
 """Models module init file."""
 # }}}
 
 # __init__ ## {{{
-from .devices import Devices
-from .deviceOptions import DeviceOptions
+from .device_config import DeviceConfig, DeviceConfigOption
+from .job_state import JobState
 
-__all__ = ["Devices", "DeviceOptions"]
+__all__ = ["DeviceConfig", "DeviceConfigOption", "JobState"]
 # }}}
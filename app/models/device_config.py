@@ -34,7 +34,7 @@ class DeviceConfigOption(EmbeddedJsonModel):
 class DeviceConfig(JsonModel):
     """JSON redis ORM for SANE device configuration."""
 
-    device_name: str = Field()
+    device_name: str = Field(index=True)
     common_name: str = Field(index=True)
     options: list[DeviceConfigOption] = Field()
 
@@ -0,0 +1,42 @@
+###############################################################################
+#  job_state.py for archivist descry microservice                             #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""ORM for scanning job state stored in redis."""
+# }}}
+
+# libraries {{{
+from typing import Optional
+from redis_om import JsonModel, Field
+# }}}
+
+
+# job_state {{{
+class JobState(JsonModel):
+    """JSON redis ORM for the state of a scanning job, keyed by job guid."""
+
+    device: str = Field(index=True)
+    job_number: int = Field(index=True, sortable=True)
+    status: int = Field()
+    priority: int = Field()
+    queued_date: str = Field()
+    start_date: Optional[str] = Field()
+    end_date: Optional[str] = Field()
+    error_str: Optional[str] = Field()
+    pages: int = Field()
+    spool: str = Field()
+
+# }}}
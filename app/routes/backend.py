@@ -20,7 +20,7 @@
 
 # libraries # {{{
 from flask import Blueprint, request
-from app.utils import desanity, DesanityException
+from app.utils import desanity, federation, DesanityException
 # }}}
 
 backend_bp = Blueprint('backend', __name__)
@@ -39,20 +39,98 @@ def get_backend():
         }, 500
 
 
-@backend_bp.route('/discover_device', methods=['GET'])
-def get_devices():
-    """Discover available devices to Descry."""
+@backend_bp.route('/pipeline', methods=['GET'])
+def get_pipeline():
+    """Get the queue depths of the scan pipeline stages."""
+    return desanity.pipeline_stats, 200
+
+
+@backend_bp.route('/retention', methods=['GET'])
+def get_retention():
+    """Get the job retention limits and the bytes reclaimed so far."""
+    return desanity.retention.stats, 200
+
+
+@backend_bp.route('/retention', methods=['POST'])
+def collect_jobs():
+    """Evict finished jobs outside the retention limits now."""
+    return desanity.collect_jobs(), 200
+
+
+@backend_bp.route('/warmup', methods=['GET'])
+def get_warmup():
+    """Get the per device timings of the boot time warm up."""
+    return desanity.warmup.serialize_json(), 200
+
+
+@backend_bp.route('/handles', methods=['GET'])
+def get_handles():
+    """Get the idle handle policy and the handle hits and misses."""
+    return desanity.handle_stats, 200
+
+
+@backend_bp.route('/handles', methods=['POST'])
+def park_handles():
+    """Park the handles idle for longer than the timeout now."""
+    return {
+        'parked': desanity.park_idle_handles()
+    }, 200
+
+
+@backend_bp.route('/health', methods=['GET'])
+def get_health():
+    """Get the cached reachability of every device."""
     try:
-        devices = desanity.refresh_devices()
+        return desanity.device_health(), 200
+    except DesanityException as ex:
         return {
-            "devices": list(map(lambda dev: dev.name, devices))
-        }, 200
+            'ErrorMessage': f'Error getting device health: {ex}'
+        }, 500
+
+
+@backend_bp.route('/health', methods=['POST'])
+def probe_devices():
+    """Probe every device now."""
+    try:
+        return desanity.probe_devices(), 200
     except DesanityException as ex:
         return {
-            'ErrorMessage': f'Error discovering devices: {ex}'
+            'ErrorMessage': f'Error probing devices: {ex}'
         }, 500
 
 
+@backend_bp.route('/federation', methods=['GET'])
+def get_federation():
+    """Get the federated nodes, their devices and pooled connections."""
+    return federation.stats, 200
+
+
+@backend_bp.route('/discover_device', methods=['GET'])
+def get_devices():
+    """Return the cached discovery result, refreshing it when stale."""
+    discovery = desanity.discovery
+    if discovery.stale:
+        discovery.trigger()
+
+    state = discovery.serialize_json()
+    return {
+        "devices": list(map(lambda dev: dev['name'], state['devices'])),
+        "refreshed_at": state['refreshed_at'],
+        "stale": state['stale'],
+        "running": state['running']
+    }, 200
+
+
+@backend_bp.route('/discover_device', methods=['POST'])
+def trigger_discovery():
+    """Start a device discovery in the background."""
+    desanity.discovery.trigger()
+
+    return {
+        "triggered": True
+    }, 202
+
+
 @backend_bp.route('/discover_device', methods=['PUT'])
 def configure_device():
     """Configure a new Descry device."""
@@ -19,11 +19,18 @@
 # }}}
 
 # libraries # {{{
+import os
+import json
 import base64
 from io import BytesIO
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, send_file
 from app.utils import desanity, DesanityUnknownDev, DesanityException
-from app.utils import DesanityDeviceBusy
+from app.utils import DesanityDeviceBusy, DesanityUnknownJob
+from app.utils import DesanityUnknownPage, DesanityJobFinished
+from app.utils import DesanityUnknownOption, DesanityOptionInvalidValue
+from app.utils import DesanityOptionUnsettable
+from app.utils import DesanityUnknownProfile, ScanPriority
+from app.utils import PENDING_STATUSES, DesanityNoCompatibleDevice
 # }}}
 
 devices_bp = Blueprint('devices', __name__)
@@ -45,9 +52,12 @@ def get_devices():
     """
     # try to get the devices throw a internal server error if it fails
     try:
+        # reachability comes from the background prober, not from SANE
+        health = desanity.device_health()
         devices = list(map(lambda dev: {
             'name': dev.name,
-            'guid': dev.guid
+            'guid': dev.guid,
+            'health': health.get(dev.guid)
         }, desanity.devices))
     except DesanityException as ex:
         return {
@@ -78,7 +88,7 @@ def get_device(guid):
         dev = get_device_by_guid(guid)
         print('got dev?')
         return dev.serialize_json(), 200
-    except StopIteration:
+    except DesanityUnknownDev:
         return {
             'ErrorMsg': f'Unabled to find resource {guid}'
         }, 404
@@ -110,8 +120,8 @@ def open_device(guid):
     """
     try:
         dev = get_device_by_guid(guid)
-        dev.enable()
-    except StopIteration:
+        restored = desanity.enable_device(dev)
+    except DesanityUnknownDev:
         return {
             'ErrMsg': f'Sane device {guid} not found'
         }, 404
@@ -122,7 +132,8 @@ def open_device(guid):
 
     return {
         'device': guid,
-        'status': 'enabled'
+        'status': 'enabled',
+        'profile': restored['profile'] if restored else None
     }, 201
 
 
@@ -138,11 +149,11 @@ def close_device(guid):
     try:
         dev = get_device_by_guid(guid)
         dev.disable()
-    except StopIteration:
+    except DesanityUnknownDev:
         return {
             'ErrMsg': f'Sane device {guid} not found'
         }, 404
-    except DesanityUnknownDev as ex:
+    except DesanityException as ex:
         return {
             'ErrMsg': f'Internal Server Error {str(ex)}'
         }, 500
@@ -173,9 +184,10 @@ def get_device_option(guid):
         dev = get_device_by_guid(guid)
         return {
             'device': guid,
+            'version': dev.options_version,
             'options': dev.options
         }, 200
-    except StopIteration:
+    except DesanityUnknownDev:
         return {
             'ErrMsg': f'Sane device {guid} not found'
         }, 404
@@ -209,20 +221,295 @@ def set_device_option(guid):
         opt = req['option']
         value = req['value']
 
-        dev.set_option(opt, value)
+        delta = dev.set_option(opt, value) or {}
         return {
-            'status': 'updated'
+            'device': guid,
+            'status': 'updated',
+            **delta
         }, 200
-    except StopIteration:
+    except DesanityUnknownDev:
         return {
             'ErrMsg': f'Sane device {guid} not found'
         }, 404
+    except (DesanityUnknownOption, DesanityOptionInvalidValue,
+            DesanityOptionUnsettable) as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 400
+    except DesanityException as ex:
+        return {
+            'ErrMsg': f'Internal Server Error {str(ex)}'
+        }, 500
+
+
+@devices_bp.route('/<string:guid>/options', methods=['PATCH'])
+def set_device_options(guid):
+    """
+    Set several scanning device options at once.
+
+    ---
+    parameters:
+      - name: guid
+        id: path
+        description: guid of the device
+        required: True
+        type: string
+    response:
+      200:
+        description: the options delta, per option errors and the options
+    """
+    req = request.get_json(silent=True)
+    if not isinstance(req, dict) or not isinstance(req.get('options'), dict):
+        return {
+            'ErrMsg': 'Invalid request'
+        }, 400
+
+    try:
+        dev = get_device_by_guid(guid)
+        delta = dev.set_options(req['options'])
+        if delta is None:
+            return {
+                'ErrMsg': f'Sane device {guid} is not enabled'
+            }, 409
+
+        return {
+            'device': guid,
+            **delta,
+            'options': dev.options
+        }, 200
     except DesanityUnknownDev:
         return {
-            'ErrMsg': f'Unknown scanner device {guid}'
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityException as ex:
+        return {
+            'ErrMsg': f'Internal Server Error {str(ex)}'
         }, 500
 
 
+@devices_bp.route('/<string:guid>/profiles', methods=['GET'])
+def get_profiles(guid):
+    """
+    List the scan profiles of a device.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: the scan profiles of the device
+      404:
+        description: Device not found
+    """
+    try:
+        dev = get_device_by_guid(guid)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+
+    return {
+        'device': guid,
+        'profiles': [profile.serialize_json()
+                     for profile in desanity.profiles.list(dev.name)]
+    }, 200
+
+
+@devices_bp.route('/<string:guid>/profiles/<string:name>', methods=['GET'])
+def get_profile(guid, name):
+    """
+    Get a scan profile of a device.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: the scan profile
+      404:
+        description: Device or profile not found
+    """
+    try:
+        dev = get_device_by_guid(guid)
+        return desanity.profiles.get(dev.name, name).serialize_json(), 200
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityUnknownProfile:
+        return {
+            'ErrMsg': f'Scan profile {name} not found'
+        }, 404
+
+
+@devices_bp.route('/<string:guid>/profiles/<string:name>', methods=['PUT'])
+def save_profile(guid, name):
+    """
+    Create or replace a scan profile of a device.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: the saved scan profile
+      400:
+        description: The request has no options object
+      404:
+        description: Device not found
+    """
+    req = request.get_json(silent=True)
+    if not isinstance(req, dict) or not isinstance(req.get('options'), dict):
+        return {
+            'ErrMsg': 'Invalid request'
+        }, 400
+
+    try:
+        dev = get_device_by_guid(guid)
+        profile = desanity.save_profile(dev, name, req['options'])
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityException as ex:
+        return {
+            'ErrMsg': f'Internal Server Error {str(ex)}'
+        }, 500
+
+    return profile.serialize_json(), 200
+
+
+@devices_bp.route('/<string:guid>/profiles/<string:name>', methods=['DELETE'])
+def delete_profile(guid, name):
+    """
+    Delete a scan profile of a device.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: Profile deleted
+      404:
+        description: Device or profile not found
+    """
+    try:
+        dev = get_device_by_guid(guid)
+        desanity.profiles.delete(dev.name, name)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityUnknownProfile:
+        return {
+            'ErrMsg': f'Scan profile {name} not found'
+        }, 404
+
+    return {
+        'device': guid,
+        'profile': name,
+        'status': 'deleted'
+    }, 200
+
+
+@devices_bp.route('/<string:guid>/profiles/<string:name>/apply',
+                  methods=['PUT'])
+def apply_profile(guid, name):
+    """
+    Apply a scan profile to a device as a single batch of options.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: the options delta, per option errors and the options
+      404:
+        description: Device or profile not found
+      409:
+        description: Device is not enabled
+    """
+    try:
+        dev = get_device_by_guid(guid)
+        delta = desanity.apply_profile(dev, name)
+        if delta is None:
+            return {
+                'ErrMsg': f'Sane device {guid} is not enabled'
+            }, 409
+
+        return {
+            'device': guid,
+            **delta,
+            'options': dev.options
+        }, 200
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityUnknownProfile:
+        return {
+            'ErrMsg': f'Scan profile {name} not found'
+        }, 404
+    except DesanityException as ex:
+        return {
+            'ErrMsg': f'Internal Server Error {str(ex)}'
+        }, 500
+
+
+@devices_bp.route('/scan', methods=['POST'])
+def dispatch_scan():
+    """
+    Scan on the least loaded device supporting the required capabilities.
+
+    ---
+    tags:
+      - devices
+    parameters:
+      - name: requirements
+        in: body
+        description: option values the device must support, set for the job
+        required: true
+        type: object
+    responses:
+      202:
+        description: The chosen device, job resource and queue position
+      400:
+        description: Invalid request or unknown priority
+      409:
+        description: No enabled device supports the requirements
+    """
+    req = request.get_json(silent=True)
+    if not isinstance(req, dict) or \
+       not isinstance(req.get('requirements'), dict) or \
+       not isinstance(req.get('options', {}), dict):
+        return {
+            'ErrMsg': 'Invalid request'
+        }, 400
+
+    try:
+        priority = ScanPriority[str(req.get('priority', 'normal')).upper()]
+    except KeyError:
+        return {
+            'ErrMsg': f"Unknown priority {req['priority']}"
+        }, 400
+
+    try:
+        dev, job, position = desanity.dispatch_scan(req['requirements'],
+                                                    priority,
+                                                    req.get('options'))
+    except DesanityNoCompatibleDevice as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 409
+
+    return {
+        'device': dev.guid,
+        'jobId': job.job_number,
+        'job_url': job_url(dev.guid, job.job_number),
+        'queue_position': position
+    }, 202
+
+
 @devices_bp.route('/<string:guid>/scan', methods=['GET'])
 def scan(guid):
     """
@@ -237,45 +524,363 @@ def scan(guid):
         description: id of the device to scan with
         required: true
         type: string
+      - name: profile
+        in: query
+        description: scan profile applied before scanning
+        required: false
+        type: string
+      - name: priority
+        in: query
+        description: queue priority, one of high, normal or low
+        required: false
+        type: string
     responses:
       202:
-        description: Return the job resource handler for the scanning job
+        description: The job resource handler and its queue position
+      400:
+        description: Unknown priority
       404:
-        description: Device not found
-      503:
-        description: Device is busy
+        description: Device or profile not found
+      409:
+        description: Device is not enabled
     """
+    profile = request.args.get('profile')
+    try:
+        priority = ScanPriority[request.args.get('priority',
+                                                 'normal').upper()]
+    except KeyError:
+        return {
+            'ErrMsg': f"Unknown priority {request.args['priority']}"
+        }, 400
+
     try:
         dev = get_device_by_guid(guid)
-        job = dev.scan()
-    except StopIteration:
+        scan_profile = None
+        if profile is not None:
+            scan_profile = desanity.profiles.get(dev.name, profile)
+        job, position = dev.scan(priority, scan_profile and
+                                 scan_profile.options)
+    except DesanityUnknownDev:
         return {
             'ErrMsg': f'Sane device {guid} not found'
         }, 404
-    except DesanityDeviceBusy:
+    except DesanityUnknownProfile:
+        return {
+            'ErrMsg': f'Scan profile {profile} not found'
+        }, 404
+
+    if job is None:
         return {
-            "ErrMsg": f"Sane device {guid} is busy"
-        }, 503
+            'ErrMsg': f'Sane device {guid} is not enabled'
+        }, 409
+
+    if scan_profile is not None:
+        desanity.profiles.mark_used(scan_profile)
 
     return {
         'jobId': job.job_number,
-        'job_url': job_url(guid, job.job_number)
+        'job_url': job_url(guid, job.job_number),
+        'queue_position': position
     }, 202
 
 
+@devices_bp.route('/<string:guid>/queue', methods=['GET'])
+def get_queue(guid):
+    """
+    Get the scan queue of a device.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: Queue depth, wait times and the queued jobs
+      404:
+        description: Device not found
+    """
+    try:
+        dev = get_device_by_guid(guid)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+
+    return {
+        'device': guid,
+        **dev.queue_stats,
+        'jobs': [job.guid for job in dev.queued_jobs]
+    }, 200
+
+
 @devices_bp.route('/<string:guid>/jobs', methods=['GET'])
-def get_job(guid):
+def get_jobs(guid):
     """
+    List the jobs of a device, from every API worker.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: The guids of the jobs of the device
+      404:
+        description: Device not found
+    """
+    try:
+        get_device_by_guid(guid)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+
+    return {
+        'jobs': [state['guid'] for state in desanity.get_job_states(guid)]
+    }, 200
+
+
+@devices_bp.route('/<string:guid>/jobs/<string:job_id>', methods=['GET'])
+def get_job(guid, job_id):
+    """
+    Get the status of a job, from any API worker.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: The status, pages and dates of the job
+      404:
+        description: Job not found
+    """
+    state = desanity.get_job_state(guid, job_id)
+    if state is None:
+        return {
+            'ErrMsg': f'Unknown job {job_id}'
+        }, 404
+
+    return state, 200
+
+
+@devices_bp.route('/<string:guid>/jobs/<string:job_id>/pages/<int:number>',
+                  methods=['GET'])
+def get_job_page(guid, job_id, number):
+    """
+    Download an encoded page of a scanning job.
+
+    Supports byte range requests so interrupted downloads can be resumed.
+    ---
+    tags:
+      - devices
+    parameters:
+      - name: guid
+        in: path
+        description: id of the device the job ran on
+        required: true
+        type: string
+      - name: job_id
+        in: path
+        description: guid or job number of the job
+        required: true
+        type: string
+      - name: number
+        in: path
+        description: page number, starting at 1
+        required: true
+        type: integer
+    responses:
+      200:
+        description: The encoded page
+      206:
+        description: The requested byte range of the encoded page
+      404:
+        description: Device, job or page not found
+      416:
+        description: Requested range not satisfiable
     """
     try:
         dev = get_device_by_guid(guid)
+        page = dev.get_job(job_id).get_page(number)
+    except DesanityUnknownDev:
         return {
-            'jobs': list(map(lambda job: job.guid, dev.jobs))
-        }, 200
-    except:
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except (DesanityUnknownJob, DesanityUnknownPage) as ex:
         return {
-            'fuck': 'holy shit'
-        }, 500
+            'ErrMsg': str(ex)
+        }, 404
+
+    resp = send_file(page.path, mimetype=page.mimetype, conditional=True,
+                     download_name=f'{job_id}-{os.path.basename(page.path)}')
+    # werkzeug only advertises ranges on partial responses, let clients
+    # know up front that an interrupted download can be resumed
+    resp.headers['Accept-Ranges'] = 'bytes'
+
+    return resp
+
+
+@devices_bp.route('/<string:guid>/jobs/<string:job_id>/pages/<int:number>/'
+                  '<string:size>', methods=['GET'])
+def get_job_page_preview(guid, job_id, number, size):
+    """
+    Get a cached thumbnail or preview rendering of a job page.
+
+    ---
+    tags:
+      - devices
+    parameters:
+      - name: size
+        in: path
+        description: rendering size, thumbnail or preview by default
+        required: true
+        type: string
+    responses:
+      200:
+        description: JPEG rendering of the page
+      404:
+        description: Device, job, page or size not found
+    """
+    try:
+        dev = get_device_by_guid(guid)
+        job = dev.get_job(job_id)
+        data = desanity.previews.get(job, job.get_page(number), size)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except (DesanityUnknownJob, DesanityUnknownPage) as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 404
+    except KeyError:
+        return {
+            'ErrMsg': f'Unknown preview size {size}'
+        }, 404
+
+    return Response(data, mimetype=desanity.previews.MIMETYPE,
+                    headers={'Cache-Control': 'private, max-age=3600'})
+
+
+@devices_bp.route('/<string:guid>/jobs/<string:job_id>', methods=['DELETE'])
+def delete_job(guid, job_id):
+    """
+    Delete a finished job, its spooled pages and cached previews.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: Job deleted
+      404:
+        description: Device or job not found
+      409:
+        description: Job is still running
+    """
+    try:
+        dev = get_device_by_guid(guid)
+        job = desanity.delete_job(dev, job_id)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityUnknownJob as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 404
+    except DesanityDeviceBusy as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 409
+
+    return {
+        'job': job.guid,
+        'status': 'deleted'
+    }, 200
+
+
+@devices_bp.route('/<string:guid>/jobs/<string:job_id>/live', methods=['GET'])
+def stream_job_progress(guid, job_id):
+    """
+    Stream the live acquisition progress of a scanning job.
+
+    Sends server sent events as scanlines are read from the device and as
+    each page lands in the spool, ending once the job finishes.
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: A text/event-stream of progress events
+      404:
+        description: Device or job not found
+    """
+    try:
+        dev = get_device_by_guid(guid)
+        job = dev.get_job(job_id)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityUnknownJob as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 404
+
+    def events():
+        version = None
+        while True:
+            new_version, progress = job.progress.wait(version, timeout=15)
+            if new_version == version:
+                # keep idle connections from being dropped by proxies
+                yield ': keep-alive\n\n'
+                continue
+
+            version = new_version
+            yield f'event: progress\ndata: {json.dumps(progress)}\n\n'
+            if progress['status'] not in PENDING_STATUSES:
+                return
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@devices_bp.route('/<string:guid>/jobs/<string:job_id>/abort',
+                  methods=['PUT'])
+def abort_job(guid, job_id):
+    """
+    Abort a queued scanning job or the acquisition of a running one.
+
+    ---
+    tags:
+      - devices
+    responses:
+      202:
+        description: Abort requested, the job stops at the next scanline
+      404:
+        description: Device or job not found
+      409:
+        description: Job is no longer running
+    """
+    try:
+        dev = get_device_by_guid(guid)
+        dev.abort_job(job_id)
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityUnknownJob as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 404
+    except DesanityJobFinished as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 409
+
+    return {
+        'job': job_id,
+        'status': 'aborting'
+    }, 202
 
 
 def image2base64str(image, fmt="JPEG"):
@@ -292,4 +897,4 @@ def job_url(device_name, job_number):
 
 def get_device_by_guid(guid):
     """Return a DesanityDevice by guid."""
-    return next(dev for dev in desanity.devices if dev.guid == guid)
+    return desanity.get_device_by_guid(guid)
@@ -0,0 +1,130 @@
+###############################################################################
+#  gateway.py for archivist descry microservices                              #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Module DocuString ## {{{
+"""Routes serving the devices of federated Descry nodes.
+
+Registered in place of the device routes when FEDERATION_NODES is set.
+"""
+# }}}
+
+# libraries # {{{
+from flask import Blueprint, Response, request
+from app.utils import federation, DesanityUnknownDev
+from app.utils import DesanityNodeUnavailable
+# }}}
+
+gateway_bp = Blueprint('gateway', __name__)
+
+# request headers passed on to the owning node
+FORWARD_HEADERS = ('Accept', 'Content-Type', 'Range', 'If-Range',
+                   'If-None-Match', 'If-Modified-Since', 'Last-Event-ID')
+
+
+@gateway_bp.route('', methods=['GET'])
+def get_devices():
+    """
+    Retrieve the devices of every federated node.
+
+    ---
+    tags:
+      - devices
+    responses:
+      200:
+        description: A list of devices and the node owning each
+    """
+    return {
+        'devices': [{
+            'name': dev['name'],
+            'guid': dev['guid'],
+            'node': dev['node']
+        } for dev in federation.devices()]
+    }, 200
+
+
+@gateway_bp.route('/scan', methods=['POST'])
+def pool_scan():
+    """
+    Queue a scan on the first node with a compatible device.
+
+    ---
+    tags:
+      - devices
+    responses:
+      202:
+        description: The scan was queued on a node
+      409:
+        description: No node has an enabled device supporting the scan
+      502:
+        description: No node could be reached
+    """
+    try:
+        resp = federation.dispatch(request.get_data(), forward_headers())
+    except DesanityNodeUnavailable as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 502
+
+    return relay(resp)
+
+
+@gateway_bp.route('/<string:guid>', methods=['GET', 'PUT', 'PATCH', 'POST',
+                                             'DELETE'])
+@gateway_bp.route('/<string:guid>/<path:path>',
+                  methods=['GET', 'PUT', 'PATCH', 'POST', 'DELETE'])
+def forward_device(guid, path=None):
+    """
+    Forward a device request to the node owning the device.
+
+    ---
+    tags:
+      - devices
+    responses:
+      404:
+        description: Device not found on any node
+      502:
+        description: The node owning the device could not be reached
+    """
+    node_path = f'/devices/{guid}' + (f'/{path}' if path else '')
+    if request.query_string:
+        node_path += '?' + request.query_string.decode('latin-1')
+
+    try:
+        resp = federation.forward(guid, request.method, node_path,
+                                  request.get_data() or None,
+                                  forward_headers())
+    except DesanityUnknownDev:
+        return {
+            'ErrMsg': f'Sane device {guid} not found'
+        }, 404
+    except DesanityNodeUnavailable as ex:
+        return {
+            'ErrMsg': str(ex)
+        }, 502
+
+    return relay(resp)
+
+
+def forward_headers():
+    """Return the request headers forwarded to a node."""
+    return {name: request.headers[name] for name in FORWARD_HEADERS
+            if name in request.headers}
+
+
+def relay(resp):
+    """Stream a node response back to the client."""
+    return Response(resp.iter_content(), status=resp.status,
+                    headers=resp.headers, direct_passthrough=True)
@@ -19,7 +19,6 @@
 # }}}
 
 # Spec routes {{{
-import yaml
 from flask import Blueprint
 
 spec_bp = Blueprint('spec', __name__, url_prefix='/spec')
@@ -28,6 +27,9 @@ spec_bp = Blueprint('spec', __name__, url_prefix='/spec')
 @spec_bp.route('', methods=['GET'])
 def get_spec():
     """Get the microservice speification."""
+    # yaml is only needed once the spec is asked for
+    import yaml  # pylint: disable=import-outside-toplevel
+
     with open("openapi.yml", "r", encoding='utf-8') as yaml_in:
         yaml_def = yaml.safe_load(yaml_in)
         return yaml_def, 200
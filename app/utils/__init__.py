@@ -24,15 +24,25 @@ from .desanityDevice import DesanityDevice
 from .desanityExceptions import DesanityUnknownDev, DesanityException
 from .desanityExceptions import DesanityDeviceBusy, DesanitySaneException
 from .desanityExceptions import DesanityUnknownOption
+from .desanityExceptions import DesanityUnknownJob, DesanityUnknownPage
+from .desanityExceptions import DesanityJobFinished, DesanityUnknownProfile
+from .desanityExceptions import DesanityNoCompatibleDevice
+from .desanityExceptions import DesanityHostUnavailable
+from .desanityExceptions import DesanityNodeUnavailable
+from .desanityFederation import federation
 from .desanityExceptions import DesanityOptionInvalidValue
 from .desanityExceptions import DesanityOptionUnsettable
 from .desanityExceptions import SaneException
 from .desanityDevice import DevStatus, DevParams
-from .desanityJobs import JobStatus
+from .desanityJobs import JobStatus, ScanPriority, PENDING_STATUSES
 
 __all__ = ['desanity', 'DesanityUnknownDev', 'DesanityException',
            "DesanityDevice", "DesanityDeviceBusy", "DevStatus",
            "DesanityUnknownOption", "DesanityOptionInvalidValue",
            "DesanityOptionUnsettable", "SaneException", "JobStatus",
-           "DevParams", "DesanitySaneException"]
+           "DevParams", "DesanitySaneException", "DesanityUnknownJob",
+           "DesanityUnknownPage", "DesanityJobFinished",
+           "DesanityUnknownProfile", "ScanPriority", "PENDING_STATUSES",
+           "DesanityNoCompatibleDevice", "DesanityHostUnavailable",
+           "DesanityNodeUnavailable", "federation"]
 # }}}
@@ -25,11 +25,39 @@ a singleton object.
 
 # libraires {{{
 import configparser
-import sane
+from threading import Lock
 from flask import current_app
-from .desanityDevice import DesanityDevice
-from .desanityExceptions import DesanityUnknownDev, SaneException
+from .desanityDevice import DesanityDevice, DevStatus
+from .desanityExceptions import SaneException, DesanityException
 from .desanityExceptions import DesanitySaneException
+from .desanityExceptions import DesanityNoCompatibleDevice
+from .desanityJobs import ScanPriority
+from .desanitySpool import DEFAULT_SPOOL_DIR, DEFAULT_SPOOL_FORMAT
+from .desanityEncoder import DesanityEncoder
+from .desanityPreviews import DesanityPreviewCache
+from .desanityPreviews import DEFAULT_PREVIEW_CACHE_BYTES
+from .desanityRegistry import DesanityRegistry
+from .desanityDiscovery import DesanityDiscovery, DEFAULT_DISCOVERY_TTL
+from .desanityDiscovery import DEFAULT_DISCOVERY_CACHE
+from .desanityDiscovery import DEFAULT_DISCOVERY_MISSES
+from .desanitySingleFlight import DesanitySingleFlight
+from .desanityJobStore import DesanityMemoryJobStore, DesanityRedisJobStore
+from .desanityRetention import DesanityRetention, DEFAULT_RETENTION_JOBS
+from .desanityRetention import DEFAULT_RETENTION_AGE, DEFAULT_GC_INTERVAL
+from .desanityProfiles import DesanityProfiles, DesanityProfile
+from .desanityProfiles import DesanityMemoryProfileStore
+from .desanityProfiles import DesanityRedisProfileStore
+from .desanityHost import DesanityHostClient
+from .desanityWarmup import DesanityWarmup, DEFAULT_WARMUP_WORKERS
+from .desanityHandles import DesanityHandlePool, DEFAULT_HANDLE_SWEEP_INTERVAL
+from .desanityHealth import DesanityHealth, DEFAULT_HEALTH_INTERVAL
+from .desanityHealth import DEFAULT_HEALTH_MAX_INTERVAL
+
+try:
+    import sane
+except ImportError:
+    # gateways and device host clients run without python-sane
+    sane = None
 # }}}
 
 
@@ -39,62 +67,432 @@ class Desanity():
 
     sane_version: str
     sene_devices: list
-    _devices: []
+    _registry: DesanityRegistry
 
     def __init__(self) -> None:
         """Construct for the Desanity object."""
-        self._devices = []
-        self.initialize()
+        self._registry = DesanityRegistry()
+        self._discovery_lock = Lock()
+        self._backend_lock = Lock()
+        self._dispatch_lock = Lock()
+        self._flights = DesanitySingleFlight()
+        self._reinit_debounce = 0
+        self._spool_dir = DEFAULT_SPOOL_DIR
+        self._spool_format = DEFAULT_SPOOL_FORMAT
+        self._encoder = DesanityEncoder(0)
+        self._previews = DesanityPreviewCache()
+        self._discovery = DesanityDiscovery(self.refresh_devices)
+        self._discovery_misses = DEFAULT_DISCOVERY_MISSES
+        self._missed = {}
+        self._profiles = DesanityProfiles()
+        self._job_store = DesanityMemoryJobStore()
+        self._host = None
+        self._retention = DesanityRetention(on_evict=self._job_evicted)
+        self._warmup = DesanityWarmup(self.enable_device)
+        self._handles = DesanityHandlePool()
+        self._health = DesanityHealth(None, listed=self._listed_devices)
+        # SANE is initialized on first device access, not on import
+        self._sane_version = None
 
     @property
     def sane_version(self) -> str:
         """Return the version of the SANE object."""
+        self._ensure_initialized()
         return self._sane_version
 
     @property
     def devices(self) -> list:
         """Return the list of devices from SANE."""
-        return self._devices
+        self._ensure_initialized()
+        return self._registry.devices
+
+    @property
+    def discovery(self) -> DesanityDiscovery:
+        """Return the background device discovery."""
+        return self._discovery
+
+    @property
+    def previews(self) -> DesanityPreviewCache:
+        """Return the page thumbnail and preview cache."""
+        return self._previews
+
+    @property
+    def retention(self) -> DesanityRetention:
+        """Return the finished job retention collector."""
+        return self._retention
+
+    @property
+    def warmup(self) -> DesanityWarmup:
+        """Return the boot time device warm up."""
+        return self._warmup
+
+    @property
+    def handles(self) -> DesanityHandlePool:
+        """Return the idle handle pool."""
+        return self._handles
+
+    @property
+    def handle_stats(self) -> dict:
+        """Return the idle handle policy and the handle hits and misses."""
+        return self._handles.serialize_json(self._local_devices())
+
+    @property
+    def health(self) -> DesanityHealth:
+        """Return the background device health prober."""
+        return self._health
+
+    @property
+    def profiles(self) -> DesanityProfiles:
+        """Return the scan profile cache."""
+        return self._profiles
+
+    @property
+    def host(self) -> DesanityHostClient:
+        """Return the device host client, None when SANE runs in process."""
+        return self._host
+
+    @property
+    def pipeline_stats(self) -> dict:
+        """Return the queue depths of the scan pipeline stages."""
+        return {
+            'acquiring': sum(1 for dev in self._registry.devices
+                             if dev.status == DevStatus.SCANNING),
+            'encoder': self._encoder.stats
+        }
+
+    def configure(self, config):
+        """Apply the application configuration to desanity.
+
+        Keyword arguments:
+        config -- flask configuration mapping
+        """
+        self._spool_dir = config.get('SPOOL_DIR', self._spool_dir)
+        self._spool_format = config.get('SPOOL_FORMAT', self._spool_format)
+        self._reinit_debounce = config.get('REINIT_DEBOUNCE',
+                                           self._reinit_debounce)
+
+        workers = config.get('ENCODER_WORKERS', self._encoder.workers)
+        self._encoder.shutdown()
+        self._encoder = DesanityEncoder(workers,
+                                        config.get('ENCODER_MAX_PENDING'))
+
+        self._previews = DesanityPreviewCache(
+            config.get('PREVIEW_CACHE_BYTES', DEFAULT_PREVIEW_CACHE_BYTES),
+            config.get('PREVIEW_SIZES'))
+
+        self._discovery_misses = config.get('DISCOVERY_MISSES',
+                                            self._discovery_misses)
+        self._discovery.stop()
+        self._discovery = DesanityDiscovery(
+            self.refresh_devices,
+            config.get('DISCOVERY_TTL', DEFAULT_DISCOVERY_TTL),
+            config.get('DISCOVERY_CACHE', DEFAULT_DISCOVERY_CACHE))
+
+        self._retention.stop()
+        self._retention = DesanityRetention(
+            config.get('JOB_RETENTION_JOBS', DEFAULT_RETENTION_JOBS),
+            config.get('JOB_RETENTION_AGE', DEFAULT_RETENTION_AGE),
+            config.get('JOB_RETENTION_BYTES'),
+            config.get('JOB_RETENTION_TOTAL_BYTES'),
+            config.get('JOB_RETENTION_TOTAL_JOBS'),
+            config.get('JOB_GC_INTERVAL', DEFAULT_GC_INTERVAL),
+            self._job_evicted)
+
+        self._warmup = DesanityWarmup(
+            self.enable_device, config.get('WARMUP_DEVICES'),
+            config.get('WARMUP_WORKERS', DEFAULT_WARMUP_WORKERS))
+
+        self._handles.stop()
+        self._handles = DesanityHandlePool(
+            config.get('HANDLE_IDLE_TIMEOUT'),
+            config.get('HANDLE_SWEEP_INTERVAL',
+                       DEFAULT_HANDLE_SWEEP_INTERVAL))
+
+        self._health.stop()
+        self._health = DesanityHealth(
+            config.get('HEALTH_INTERVAL', DEFAULT_HEALTH_INTERVAL),
+            config.get('HEALTH_MAX_INTERVAL', DEFAULT_HEALTH_MAX_INTERVAL),
+            listed=self._listed_devices)
+
+        if config.get('JOB_STORE') == 'redis':
+            self._job_store = DesanityRedisJobStore()
+        else:
+            self._job_store = DesanityMemoryJobStore()
+
+        if config.get('DEVICE_HOST'):
+            self._host = DesanityHostClient(config['DEVICE_HOST'],
+                                            config.get('DEVICE_HOST_AUTHKEY'))
+            # the devices of the process are now proxies for the host's
+            self._delete_devices()
+        else:
+            self._host = None
+
+        if config.get('PROFILE_STORE') == 'redis':
+            self._profiles = DesanityProfiles(DesanityRedisProfileStore())
+        else:
+            self._profiles = DesanityProfiles(DesanityMemoryProfileStore())
 
     def initialize(self):
         """Initialize SANE engine.
 
+        Called on first device access, calling it again tears down and
+        reinitializes the backend. Concurrent calls share a single teardown
+        and init of the backend, and calls within REINIT_DEBOUNCE seconds
+        of a successful init reuse its result.
+
         returns: A string
         raises: DesanitySaneException
                 If a sane error occurs.
         """
-        # clean up the sane backend state
-        self._delete_devices()
-        sane.exit()
-
-        try:
-            self._sane_version = sane.init()
-        except SaneException as ex:
-            raise DesanitySaneException(str(ex)) from ex
-        return self.sane_version
+        return self._flights.do('initialize', self._initialize,
+                                self._reinit_debounce)
 
     def refresh_devices(self):
-        """Refresh/get the list of sane devices."""
-        try:
-            devices = sane.get_devices()
-        except SaneException as ex:
-            raise DesanitySaneException(str(ex)) from ex
-
-        self._delete_devices()
-        self._devices = list(map(lambda dev_info:
-                                 DesanityDevice(dev_info[0], dev_info[1],
-                                                dev_info[2], dev_info[3]),
-                                 devices))
-        return self._devices
+        """Refresh/get the list of sane devices.
+
+        Diffs the SANE device list against the registry so devices that
+        are still present keep their guid, state, jobs and open handles.
+        Only devices that appeared are created and only devices that
+        disappeared are closed. Concurrent calls share one discovery.
+        """
+        self._ensure_initialized()
+        return self._flights.do('refresh_devices', self._refresh_devices)
+
+    def _ensure_initialized(self):
+        """Initialize SANE unless it is or a device host owns it."""
+        if self._sane_version is None and self._host is None:
+            self.initialize()
+
+    def _initialize(self):
+        """Tear down and initialize the SANE backend."""
+        if self._host is not None:
+            with self._discovery_lock:
+                self._registry.clear()
+            self._sane_version = self._host.call('initialize')
+            return self.sane_version
+
+        if sane is None:
+            raise DesanitySaneException('python-sane is not installed')
+
+        with self._backend_lock:
+            # clean up the sane backend state, devices restored from the
+            # discovery cache before the first init hold no handles
+            if self._sane_version is not None:
+                self._delete_devices()
+            sane.exit()
+
+            try:
+                self._sane_version = sane.init()
+            except SaneException as ex:
+                raise DesanitySaneException(str(ex)) from ex
+        return self.sane_version
+
+    def _refresh_devices(self):
+        """Query SANE for devices and diff them into the registry."""
+        if self._host is not None:
+            return self._sync_devices(
+                [(dev['name'], dev['vendor'], dev['model'],
+                  dev['device_type'])
+                 for dev in self._host.call('devices', refresh=True)])
+
+        with self._backend_lock:
+            try:
+                devices = sane.get_devices()
+            except SaneException as ex:
+                raise DesanitySaneException(str(ex)) from ex
+
+        return self._sync_devices(devices)
+
+    def start_discovery(self):
+        """Restore the persisted discovery result and start discovery."""
+        if len(self._registry) == 0:
+            self._sync_devices([(dev['name'], dev['vendor'], dev['model'],
+                                 dev['device_type'])
+                                for dev in self._discovery.load()])
+
+        self._discovery.start()
+
+    def start_warmup(self):
+        """Open the configured devices concurrently in the background."""
+        self._warmup.start(self._warmup_devices)
+
+    def _warmup_devices(self):
+        """Return the devices to pick the warm up devices from."""
+        return self.devices or self.refresh_devices()
+
+    def start_handle_pool(self):
+        """Start parking the handles of idle devices."""
+        self._handles.start(self._local_devices)
+
+    def park_idle_handles(self):
+        """Park the handles idle for longer than the timeout now."""
+        return self._handles.sweep(self._local_devices())
+
+    def start_health(self):
+        """Start probing the devices in the background."""
+        self._health.start(self._local_devices)
+
+    def probe_devices(self):
+        """Probe every device now.
+
+        returns: the health of every device by guid
+        """
+        if self._host is not None:
+            return self._host.call('probe')
+
+        self._health.probe(self._local_devices(), force=True)
+        return self._health.serialize_json()
+
+    def device_health(self):
+        """Return the cached health of every device by guid.
+
+        Served from the prober cache, no SANE call is made.
+        """
+        if self._host is not None:
+            return self._host.call('health')
+
+        return self._health.serialize_json()
+
+    def _listed_devices(self):
+        """Return the names of the last discovery and when it ran."""
+        refreshed_at = self._discovery.refreshed_at
+        if refreshed_at is None:
+            return None
+
+        return {dev['name'] for dev in self._discovery.devices}, refreshed_at
+
+    def _local_devices(self):
+        """Return the devices whose handles this process holds."""
+        return [dev for dev in self._registry.devices
+                if isinstance(dev, DesanityDevice)]
+
+    def start_retention(self):
+        """Start evicting finished jobs outside the retention limits."""
+        self._retention.start(lambda: self._registry.devices)
+
+    def collect_jobs(self):
+        """Evict finished jobs outside the retention limits now."""
+        return self._retention.collect(self._registry.devices)
+
+    def get_job_states(self, device_guid):
+        """Return the shared state of every job of a device."""
+        if self._host is not None:
+            # the host runs the jobs, its job store knows them
+            return self._host.call('job_states', guid=device_guid)
+
+        return self._job_store.list(device_guid)
+
+    def get_job_state(self, device_guid, job_id):
+        """Return the shared state of a job by guid or job number.
+
+        Answers for jobs running in any API worker sharing the job store.
+
+        returns: the job state or None if unknown
+        """
+        if self._host is not None:
+            return self._host.call('job_state', guid=device_guid,
+                                   job_id=job_id)
+
+        state = self._job_store.get(job_id)
+        if state is None and job_id.isdigit():
+            state = self._job_store.find(device_guid, int(job_id))
+
+        if state is None or state['device'] != device_guid:
+            return None
+
+        return state
+
+    def delete_job(self, device, job_id):
+        """Delete a job of device along with its spool and previews."""
+        job = device.delete_job(job_id)
+        self._job_evicted(job)
+        return job
+
+    def _job_evicted(self, job):
+        """Drop the cached previews of a removed job."""
+        self._previews.invalidate(job.guid)
 
     def get_device(self, device_name):
         """Return the open Desanity Device."""
-        try:
-            ret = next((d for d in self._devices if d.name == device_name))
-        except StopIteration as ex:
-            raise DesanityUnknownDev(f'Unknown device {device_name}') from ex
+        self._ensure_initialized()
+        return self._registry.get_by_name(device_name)
+
+    def get_device_by_guid(self, guid):
+        """Return the Desanity Device registered under guid."""
+        self._ensure_initialized()
+        return self._registry.get_by_guid(guid)
 
-        return ret
+    def enable_device(self, device):
+        """Open a device and restore the last profile applied to it.
+
+        returns: the restored profile delta or None
+        raises: DesanitySaneException
+        """
+        device.enable()
+
+        profile = self._profiles.last_used(device.name)
+        if profile is None:
+            return None
+
+        return self.apply_profile(device, profile.name)
+
+    def save_profile(self, device, name, options):
+        """Save a named set of option values for a device."""
+        profile = DesanityProfile(name, device.name, options)
+        self._profiles.save(profile)
+        return profile
+
+    def apply_profile(self, device, name):
+        """Apply a profile to a device as a single batch.
+
+        returns: the options delta, see DesanityDevice.set_options
+        raises: DesanityUnknownProfile
+        """
+        profile = self._profiles.get(device.name, name)
+        delta = device.set_options(profile.options)
+        if delta is not None:
+            delta['profile'] = profile.name
+            self._profiles.mark_used(profile)
+
+        return delta
+
+    def dispatch_scan(self, requirements, priority=ScanPriority.NORMAL,
+                      options=None):
+        """Queue a scan on the least loaded device that can run it.
+
+        Keyword arguments:
+        requirements -- option values the device must support, like
+                        source, resolution and mode, set for the job
+        priority -- ScanPriority of the job
+        options -- further option values set for the job
+
+        returns: the chosen device, the job and its queue position
+        raises: DesanityNoCompatibleDevice
+        """
+        self._ensure_initialized()
+        # warm the option caches first, supports only reads the cache and
+        # no worker call may run under the dispatch lock
+        for dev in self._registry.devices:
+            if dev.enabled:
+                try:
+                    dev.options  # pylint: disable=pointless-statement
+                except DesanityException:
+                    pass
+
+        # choosing and queueing together keeps concurrent dispatches from
+        # piling onto the device that looked idle to both of them
+        with self._dispatch_lock:
+            candidates = [dev for dev in self._registry.devices
+                          if dev.supports(requirements)]
+            if not candidates:
+                raise DesanityNoCompatibleDevice(
+                    f'No enabled device supports {requirements}')
+
+            device = min(candidates, key=lambda dev: dev.load)
+            job, position = device.scan(priority,
+                                        {**requirements, **(options or {})})
+
+        return device, job, position
 
     def add_device_by_url(self, device_name, device_url, device_type):
         """Add a device configuration by url.
@@ -142,10 +540,64 @@ class Desanity():
             }
         }
 
+    def _sync_devices(self, devices):
+        """Diff SANE device info tuples into the registry.
+
+        A device SANE no longer reports is kept until it has been missing
+        from DISCOVERY_MISSES refreshes in a row, as network scanners drop
+        out of a single discovery now and then, and is never closed while
+        it has queued or running jobs.
+        """
+        with self._discovery_lock:
+            known = {dev.name: dev for dev in self._registry.devices}
+            found = [known.pop(dev_info[0], None) or
+                     self._new_device(dev_info)
+                     for dev_info in devices]
+
+            self._missed = {name: self._missed.get(name, 0) + 1
+                            for name in known}
+            missing = [dev for dev in known.values()
+                       if self._missed[dev.name] >= self._discovery_misses
+                       and not (isinstance(dev, DesanityDevice)
+                                and dev.load)]
+            for dev in missing:
+                del self._missed[dev.name]
+                del known[dev.name]
+
+            found.extend(known.values())
+            self._registry.replace(found)
+
+        self._close_devices(missing)
+
+        return found
+
+    def _new_device(self, dev_info):
+        """Return a device for a SANE device info tuple."""
+        if self._host is not None:
+            return self._host.device(dev_info)
+
+        return DesanityDevice(dev_info[0], dev_info[1], dev_info[2],
+                              dev_info[3], self._spool_dir,
+                              self._spool_format, self._encoder,
+                              self._job_store)
+
     def _delete_devices(self):
         """Close and remove all existing devices."""
-        map(lambda dev: dev.disable(), self._devices)
-        self._devices = []
+        with self._discovery_lock:
+            removed = self._registry.clear()
+            self._missed = {}
+
+        self._close_devices(removed)
+
+    @staticmethod
+    def _close_devices(devices):
+        """Close the SANE handle of every enabled device.
+
+        Devices of a device host are left for the host to close.
+        """
+        for dev in devices:
+            if isinstance(dev, DesanityDevice) and dev.enabled:
+                dev.disable()
 
 
 desanity = Desanity()
@@ -0,0 +1,140 @@
+###############################################################################
+#  desanityConstraints.py for the desanity microservice                       #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Local validation of SANE option values.
+
+Validators are compiled once from the parsed option descriptors so an
+invalid value is rejected before it travels to the scanner. Ranges are
+quantized to their step and lists are checked for membership.
+"""
+# }}}
+
+# libraries {{{
+from .desanityExceptions import DesanityOptionInvalidValue
+# }}}
+
+# desanity constraints {{{
+TYPE_BOOL = 0
+TYPE_INT = 1
+TYPE_FIXED = 2
+TYPE_STRING = 3
+
+_TRUE = ('1', 'true', 'yes', 'on')
+_FALSE = ('0', 'false', 'no', 'off')
+
+
+def _coerce(name, value, to_type):
+    """Return value converted to to_type."""
+    try:
+        if to_type is bool:
+            if isinstance(value, str):
+                if value.lower() in _TRUE:
+                    return True
+                if value.lower() in _FALSE:
+                    return False
+                raise ValueError(value)
+            return bool(value)
+        number = value
+        if to_type is int and isinstance(value, str):
+            # "300.0" is accepted, "300.7" is not truncated
+            number = float(value)
+        if to_type is int and isinstance(number, float) and \
+           not number.is_integer():
+            raise ValueError(value)
+        return to_type(number)
+    except (TypeError, ValueError) as ex:
+        raise DesanityOptionInvalidValue(
+            f'Invalid value {value!r} for option {name}') from ex
+
+
+def _type_of(option):
+    """Return the python type values of the option are coerced to."""
+    return {
+        TYPE_BOOL: bool,
+        TYPE_INT: int,
+        TYPE_FIXED: float,
+        TYPE_STRING: str
+    }.get(option['type'])
+
+
+def _range_validator(name, to_type, constraint):
+    """Return a validator quantizing values to the range step."""
+    low, high, step = constraint['min'], constraint['max'], constraint['step']
+
+    def validate(value):
+        value = _coerce(name, value, to_type)
+        if not low <= value <= high:
+            raise DesanityOptionInvalidValue(
+                f'Value {value} for option {name} is outside {low}..{high}')
+        if step:
+            value = min(low + round((value - low) / step) * step, high)
+        return to_type(value)
+
+    return validate
+
+
+def _list_validator(name, to_type, constraint):
+    """Return a validator checking values are in the word or value list."""
+    allowed = frozenset(constraint)
+
+    def validate(value):
+        value = _coerce(name, value, to_type)
+        if value not in allowed:
+            raise DesanityOptionInvalidValue(
+                f'Value {value!r} for option {name} is not one of '
+                f'{list(constraint)}')
+        return value
+
+    return validate
+
+
+def _type_validator(name, to_type):
+    """Return a validator that only coerces the value type."""
+    def validate(value):
+        return _coerce(name, value, to_type)
+
+    return validate
+
+
+def compile_validator(name, option):
+    """Compile a validator for a parsed option.
+
+    The validator returns the value converted, and quantized for ranges,
+    ready to be written to the device or raises DesanityOptionInvalidValue.
+
+    Keyword arguments:
+    name -- name of the option
+    option -- option descriptor as parsed by DesanityDevice
+    """
+    constraint = option.get('constraints')
+    to_type = _type_of(option)
+
+    if isinstance(constraint, list) and constraint:
+        # list values know their type better than the descriptor does
+        to_type = type(constraint[0])
+        if to_type is int and option['type'] == TYPE_FIXED:
+            to_type = float
+        return _list_validator(name, to_type, constraint)
+
+    if to_type is None:
+        return lambda value: value
+
+    if isinstance(constraint, dict) and to_type in (int, float):
+        return _range_validator(name, to_type, constraint)
+
+    return _type_validator(name, to_type)
+# }}}
@@ -19,15 +19,32 @@
 # }}}
 
 # libraries {{{
-from threading import Thread
+import os
+import time
+from threading import Lock
 from enum import IntEnum
 from datetime import datetime
 import uuid
-import sane
+from concurrent.futures import wait
 from .desanityExceptions import DesanityDeviceBusy, DesanityDeviceNotEnabled
 from .desanityExceptions import DesanityUnknownOption, SaneException
-from .desanityExceptions import DesanitySaneException
-from .desanityJobs import DesanityJob
+from .desanityExceptions import DesanityOptionInvalidValue
+from .desanityExceptions import DesanityOptionUnsettable
+from .desanityExceptions import DesanityJobFinished
+from .desanityExceptions import DesanitySaneException, DesanityUnknownJob
+from .desanityJobs import DesanityJob, ScanPriority, PENDING_STATUSES
+from .desanityQueue import DesanityScanQueue
+from .desanityJobStore import DesanityMemoryJobStore, job_state
+from .desanitySpool import DEFAULT_SPOOL_DIR, DEFAULT_SPOOL_FORMAT
+from .desanityEncoder import DesanityEncoder
+from .desanityConstraints import compile_validator
+from .desanityWorker import DesanityDeviceWorker
+
+try:
+    import sane
+except ImportError:
+    # gateways and device host clients run without python-sane
+    sane = None
 # }}}
 
 # desanity device {{{
@@ -53,6 +70,20 @@ class DevStatus(IntEnum):
     ERROR = 4
 
 
+# namespace for deriving stable device guids from SANE device names
+DEVICE_NAMESPACE = uuid.UUID('5f0a6f3c-1d2e-4b8a-9c47-6a3e2d1b0c9f')
+
+
+# options that commonly make SANE reload the others, written first in
+# batches. Options seen reloading on a device are learned as well.
+RELOAD_OPTIONS = ('source', 'mode', 'resolution')
+
+
+def device_guid(name):
+    """Return the deterministic guid of the SANE device name."""
+    return str(uuid.uuid5(DEVICE_NAMESPACE, name))
+
+
 class DesanityDevice():
     """Wrapper for a SANE device."""
 
@@ -61,19 +92,67 @@ class DesanityDevice():
     _model = None
     _device_type = None
     _guid = None
-    _options = {}
+    _options = None
+    _options_lock = None
+    _options_version = 0
+    _reload_options = None
+    _validators = None
     _sane_device = None
     _status = DevStatus.DISABLED
-    _jobs = []
+    _jobs = None
+    _jobs_lock = None
     _current_job = None
-
-    def __init__(self, name, vendor, model, device_type):
-        """Initialize a DesanityDevice."""
-        self._guid = str(uuid.uuid4())
+    _spool_dir = DEFAULT_SPOOL_DIR
+    _spool_format = DEFAULT_SPOOL_FORMAT
+    _encoder = None
+    _job_store = None
+    _queue = None
+    _worker = None
+    _last_job_number = 0
+    _parked = False
+    _parked_values = None
+    _last_used = 0
+    _handle_hits = 0
+    _handle_misses = 0
+    _handle_parks = 0
+
+    def __init__(self, name, vendor, model, device_type,
+                 spool_dir=DEFAULT_SPOOL_DIR,
+                 spool_format=DEFAULT_SPOOL_FORMAT, encoder=None,
+                 job_store=None):
+        """Initialize a DesanityDevice.
+
+        Keyword arguments:
+        name, vendor, model, device_type -- SANE device information
+        spool_dir -- directory job spools are created in
+        spool_format -- image format pages are spooled as
+        encoder -- DesanityEncoder pages are encoded with
+        job_store -- store job state is published to
+        """
+        self._guid = device_guid(name)
         self._name = name
         self._vendor = vendor
         self._model = model
         self._device_type = device_type
+        self._spool_dir = spool_dir
+        self._spool_format = spool_format
+        self._encoder = encoder or DesanityEncoder(0)
+        self._job_store = job_store or DesanityMemoryJobStore()
+        self._options = None
+        self._options_lock = Lock()
+        self._options_version = 0
+        self._reload_options = set()
+        self._validators = {}
+        self._jobs = []
+        self._jobs_lock = Lock()
+        self._queue = DesanityScanQueue()
+        self._worker = DesanityDeviceWorker(f'desanity-device-{self._guid}')
+        self._parked = False
+        self._parked_values = None
+        self._last_used = time.monotonic()
+        self._handle_hits = 0
+        self._handle_misses = 0
+        self._handle_parks = 0
 
     @property
     def name(self):
@@ -107,22 +186,52 @@ class DesanityDevice():
 
     @property
     def enabled(self):
-        """Return whether the device is opened."""
-        return self._sane_device is not None
+        """Return whether the device is opened, its handle may be parked."""
+        return self._sane_device is not None or self._parked
+
+    @property
+    def parked(self):
+        """Return whether the idle handle is closed until next used."""
+        return self._parked
+
+    @property
+    def handle_stats(self):
+        """Return the state of the handle and how often it was reopened.
+
+        A hit is an operation finding the handle open, a miss one that
+        had to reopen a parked handle.
+        """
+        return {
+            'open': self._sane_device is not None,
+            'parked': self._parked,
+            'idle': time.monotonic() - self._last_used,
+            'hits': self._handle_hits,
+            'misses': self._handle_misses,
+            'parks': self._handle_parks
+        }
 
     @property
     def sane_device(self):
         """Return the SANE device."""
         return self._sane_device
 
+    @property
+    def worker(self):
+        """Return the worker owning the SANE handle."""
+        return self._worker
+
     @property
     def parameters(self):
         """Return the SANE device properties."""
-        if self._sane_device is None:
+        if not self.enabled:
             raise DesanityDeviceNotEnabled()
 
+        return self._worker.call(self._read_parameters)
+
+    def _read_parameters(self):
+        """Read the parameters from the handle, on the worker."""
         try:
-            parameters = self._sane_device.get_parameters()
+            parameters = self._use_handle().get_parameters()
         except SaneException as ex:
             raise DesanitySaneException() from ex
 
@@ -137,67 +246,501 @@ class DesanityDevice():
 
     @property
     def options(self):
-        """Return the options available for the device."""
-        if self._sane_device is None:
-            raise DesanityDeviceNotEnabled()
+        """Return the options available for the device.
 
-        # parse the option tuples
-        options = list(self._sane_device.opt.keys())
+        Descriptors and values are read from the handle once and cached
+        until an option is set or the device is reopened.
+        """
+        # the cached dict is never mutated so it is safe to hand out
+        options = self._options
+        if options is not None:
+            return options
 
-        for opt in options:
-            if opt == '':
-                continue
+        return self._worker.call(self._locked_load_options)
 
-            self._parse_option(opt)
+    def _locked_load_options(self):
+        """Load the options under the options lock, on the worker."""
+        if self.enabled:
+            self._use_handle()
 
-        return self._options
+        with self._options_lock:
+            return self._load_options()
+
+    @property
+    def options_version(self):
+        """Return the version of the cached options."""
+        return self._options_version
 
     @property
     def jobs(self):
-        """Return the list of running and completed jobs on the device."""
-        return self._jobs
+        """Return the list of running and completed jobs, newest first."""
+        with self._jobs_lock:
+            return list(self._jobs)
+
+    @property
+    def queue_stats(self):
+        """Return the depth and wait times of the scan queue."""
+        stats = self._queue.stats
+        stats['running'] = self._current_job.guid \
+            if self._status == DevStatus.SCANNING else None
+        return stats
+
+    def get_job(self, job_id):
+        """Return a job by its guid or job number."""
+        try:
+            return next(job for job in self.jobs
+                        if job_id in (job.guid, str(job.job_number)))
+        except StopIteration as ex:
+            raise DesanityUnknownJob(f'Unknown job {job_id}') from ex
+
+    def delete_job(self, job_id):
+        """Remove a finished job and its spooled pages from the device."""
+        job = self.get_job(job_id)
+        if job.status in PENDING_STATUSES:
+            raise DesanityDeviceBusy(f'Job {job_id} is still running')
+
+        self.evict_job(job)
+        return job
+
+    def evict_job(self, job):
+        """Remove a job and its spooled pages, returning whether it was held.
+
+        Used by retention, which only hands over finished jobs.
+        """
+        with self._jobs_lock:
+            if job not in self._jobs:
+                return False
+            self._jobs.remove(job)
+
+        self._job_store.delete(job.guid)
+        job.delete()
+        return True
 
     def enable(self):
-        """Open the sane device."""
+        """Open the sane device on its worker."""
+        try:
+            self._worker.call(self._open)
+        except DesanitySaneException:
+            if self._sane_device is None:
+                self._worker.stop()
+            raise
+
+    def park(self, idle_timeout):
+        """Close the handle if it has not been used for idle_timeout seconds.
+
+        The device stays enabled, its option values are kept and written
+        back when the next operation reopens the handle.
+
+        returns: whether the handle was closed
+        """
+        if self._sane_device is None or self.load or \
+           time.monotonic() - self._last_used < idle_timeout:
+            return False
+
+        return self._worker.call(self._park, idle_timeout)
+
+    def probe(self):
+        """Check an open handle answers a cheap SANE call, on its worker.
+
+        Devices without an open handle, disabled or parked, are neither
+        opened nor reopened, opening one costs a scanner session.
+
+        returns: seconds the SANE call took, None without an open handle
+        raises: DesanitySaneException
+        """
+        if self._sane_device is None:
+            return None
+
+        return self._worker.call(self._probe)
+
+    def disable(self):
+        """Close the sane device and stop its worker.
+
+        Jobs still queued are aborted and the running one is asked to
+        stop before the handle is closed, so closing does not wait for
+        the queue to be scanned.
+        """
+        job = self._queue.pop()
+        while job is not None:
+            job.mark_aborted()
+            job = self._queue.pop()
+
+        job = self._current_job
+        if self._status == DevStatus.SCANNING and job is not None:
+            try:
+                job.abort()
+            except DesanityJobFinished:
+                pass
+
+        self._worker.call(self._close)
+        self._worker.stop()
+
+    def _open(self):
+        """Open the SANE handle, on the worker."""
+        if sane is None:
+            raise DesanitySaneException('python-sane is not installed')
+
         try:
             self._sane_device = sane.open(self.name)
+            self._invalidate_options()
             self._status = DevStatus.ENABLED
+            self._last_used = time.monotonic()
         except SaneException as ex:
             raise DesanitySaneException(str(ex)) from ex
 
-    def disable(self):
-        """Close the sane device."""
-        self._sane_device.close()
-        self._options = {}
+    def _close(self):
+        """Close the SANE handle, on the worker."""
+        if self._sane_device is not None:
+            self._sane_device.close()
+        self._invalidate_options()
         self._status = DevStatus.DISABLED
         self._sane_device = None
+        self._parked = False
+        self._parked_values = None
 
-    def set_option(self, option_name, value):
-        """Set a SANE device option."""
+    def _probe(self):
+        """Time a cheap SANE call, on the worker."""
         if self._sane_device is None:
-            return
+            # parked or closed while the probe was queued
+            return None
 
-        keys = list(self.options)
-        if option_name not in keys:
-            raise DesanityUnknownOption(f"Option {option_name} not found for"
-                                        "device {device_name}")
+        began = time.monotonic()
+        try:
+            self._sane_device.get_parameters()
+        except SaneException as ex:
+            raise DesanitySaneException(str(ex)) from ex
+
+        return time.monotonic() - began
+
+    def _park(self, idle_timeout):
+        """Close an idle handle keeping its option values, on the worker."""
+        if self._sane_device is None or self.load or \
+           time.monotonic() - self._last_used < idle_timeout:
+            return False
+
+        with self._options_lock:
+            values = {name: opt['value'] for name, opt
+                      in self._load_options().items()
+                      if self._sane_device[name].is_settable()}
 
         try:
-            setattr(self._sane_device, option_name, value)
+            self._sane_device.close()
+        except SaneException:
+            # the handle is given up either way
+            pass
+        self._sane_device = None
+        self._parked_values = values
+        self._parked = True
+        self._handle_parks += 1
+        return True
+
+    def _use_handle(self):
+        """Return the handle, reopening it if parked, on the worker.
+
+        raises: DesanityDeviceNotEnabled, DesanitySaneException
+        """
+        if self._parked:
+            self._reopen()
+            self._handle_misses += 1
+        elif self._sane_device is None:
+            raise DesanityDeviceNotEnabled()
+        else:
+            self._handle_hits += 1
+
+        self._last_used = time.monotonic()
+        return self._sane_device
+
+    def _reopen(self):
+        """Reopen a parked handle and write its option values back.
+
+        The cached options stay valid unless a value could not be written
+        back, then they are read again from the handle.
+        """
+        try:
+            handle = sane.open(self.name)
         except SaneException as ex:
-            raise DesanitySaneException from ex
+            raise DesanitySaneException(str(ex)) from ex
 
-    def scan(self):
-        """Use the SANE device to perform a scan."""
-        if self._sane_device is None:
+        values = self._parked_values
+        restored = True
+        for option_name in self._write_order(values):
+            try:
+                setattr(handle, option_name, values[option_name])
+            except (SaneException, AttributeError, TypeError, ValueError):
+                restored = False
+
+        self._sane_device = handle
+        self._parked = False
+        self._parked_values = None
+        if not restored:
+            self._invalidate_options()
+
+    def set_option(self, option_name, value):
+        """Set a SANE device option.
+
+        Only the option set is read back from the handle unless SANE asks
+        for the options to be reloaded. Returns the options delta, see
+        _refresh_options.
+        """
+        if not self.enabled:
+            return None
+
+        return self._worker.call(self._set_option, option_name, value)
+
+    def _set_option(self, option_name, value):
+        """Set a SANE device option, on the worker."""
+        if not self.enabled:
             return None
 
-        if self.status not in (DevStatus.ENABLED, DevStatus.COMPLETED):
-            raise DesanityDeviceBusy()
+        self._use_handle()
+        with self._options_lock:
+            return self._refresh_options(self._write_option(option_name,
+                                                            value))
+
+    def set_options(self, values):
+        """Set several SANE device options at once.
+
+        Options SANE reloads the others for, like source and mode, are
+        written first so the remaining values apply to the options they
+        leave active. A failing option is reported in the returned
+        errors and does not stop the rest of the batch.
+
+        Keyword arguments:
+        values -- dict of option names to values
+        """
+        if not self.enabled:
+            return None
+
+        return self._worker.call(self._set_options, values)
+
+    def _set_options(self, values):
+        """Set several SANE device options, on the worker."""
+        if not self.enabled:
+            return None
+
+        self._use_handle()
+        return self._write_options(values)
+
+    def _write_options(self, values):
+        """Write a batch of option values to an open handle."""
+        base = self._options_version
+        changed = {}
+        removed = set()
+        errors = {}
+
+        with self._options_lock:
+            for option_name in self._write_order(values):
+                try:
+                    delta = self._refresh_options(
+                        self._write_option(option_name, values[option_name]))
+                except (DesanityUnknownOption, DesanityOptionInvalidValue,
+                        DesanityOptionUnsettable,
+                        DesanitySaneException) as ex:
+                    errors[option_name] = str(ex)
+                    continue
+
+                for name in delta['removed']:
+                    changed.pop(name, None)
+                    removed.add(name)
+                for name, opt in delta['changed'].items():
+                    removed.discard(name)
+                    changed[name] = opt
+
+            return {
+                'base_version': base,
+                'version': self._options_version,
+                'changed': changed,
+                'removed': sorted(removed),
+                'errors': errors
+            }
+
+    def _write_order(self, values):
+        """Return the option names in the order they should be written."""
+        def priority(option_name):
+            if option_name in RELOAD_OPTIONS:
+                return RELOAD_OPTIONS.index(option_name)
+            if option_name in self._reload_options:
+                return len(RELOAD_OPTIONS)
+            return len(RELOAD_OPTIONS) + 1
+
+        # sorted is stable so the rest keep the order they were sent in
+        return sorted(values, key=priority)
+
+    def _write_option(self, option_name, value):
+        """Write an option to the handle, returning the affected names.
+
+        The caller must hold the options lock.
+        """
+        if option_name not in self._load_options():
+            raise DesanityUnknownOption(f"Option {option_name} not "
+                                        f"found for device {self.name}")
+
+        if not isinstance(value, (list, tuple)):
+            # array values are left for the device to check
+            value = self._validators[option_name](value)
+
+        # python-sane rebuilds its option dict when set_option returns
+        # INFO_RELOAD_OPTIONS, which is the only way that flag surfaces
+        sane_options = self._sane_device.opt
+        try:
+            setattr(self._sane_device, option_name, value)
+        except SaneException as ex:
+            self._drop_options()
+            raise DesanitySaneException(str(ex)) from ex
+        except AttributeError as ex:
+            # python-sane refuses read only and inactive options
+            raise DesanityOptionUnsettable(
+                f"Option {option_name} can not be set on device "
+                f"{self.name}: {ex}") from ex
+        except (TypeError, ValueError) as ex:
+            raise DesanityOptionInvalidValue(
+                f"Invalid value {value!r} for option {option_name}: "
+                f"{ex}") from ex
+
+        if self._sane_device.opt is sane_options:
+            return [option_name]
+
+        self._reload_options.add(option_name)
+        return set(self._options) | set(self._sane_device.opt.keys())
+
+    def _load_options(self):
+        """Return the cached options, parsing them if needed.
+
+        The caller must hold the options lock.
+        """
+        if self._sane_device is None:
+            raise DesanityDeviceNotEnabled()
+
+        if self._options is None:
+            options = {}
+            for opt in list(self._sane_device.opt.keys()):
+                parsed = self._parse_option(opt)
+                if parsed is not None:
+                    options[opt] = parsed
+            self._options = options
+            self._validators = {name: compile_validator(name, opt)
+                                for name, opt in options.items()}
+
+        return self._options
+
+    def _refresh_options(self, names):
+        """Re-read the named options, returning what changed.
+
+        The cached dict is replaced rather than mutated so readers holding
+        the previous one are not affected. The caller must hold the
+        options lock.
+        """
+        base = self._options_version
+        options = dict(self._options)
+        changed = {}
+        removed = []
+
+        for name in names:
+            parsed = self._parse_option(name) \
+                if name in self._sane_device.opt else None
+
+            if parsed is None:
+                if options.pop(name, None) is not None:
+                    removed.append(name)
+                    self._validators.pop(name, None)
+            elif parsed != options.get(name):
+                options[name] = changed[name] = parsed
+                self._validators[name] = compile_validator(name, parsed)
+
+        if changed or removed:
+            self._options = options
+            self._options_version += 1
+
+        return {
+            'base_version': base,
+            'version': self._options_version,
+            'changed': changed,
+            'removed': sorted(removed)
+        }
+
+    def _invalidate_options(self):
+        """Drop the cached option descriptors."""
+        with self._options_lock:
+            self._drop_options()
+
+    def _drop_options(self):
+        """Drop the cached options, the caller must hold the lock."""
+        self._options = None
+        self._validators = {}
+        self._options_version += 1
+
+    def scan(self, priority=ScanPriority.NORMAL, options=None):
+        """Queue a scan on the SANE device.
+
+        Jobs run back to back on a device worker, highest priority first
+        and in submission order within a priority.
+
+        Keyword arguments:
+        priority -- ScanPriority of the job
+        options -- option values set on the device right before scanning
+
+        returns: the job and its position in the queue
+        """
+        if not self.enabled:
+            return None, None
 
-        job = self._get_next_job()
+        job = self._get_next_job(priority, options)
+        position = self._queue.put(job, job.priority)
+        self._dispatch()
 
-        Thread(target=self._start_scan, args=(job,)).start()
+        return job, position
+
+    @property
+    def load(self):
+        """Return the number of queued and running jobs on the device."""
+        return len(self._queue) + \
+            (1 if self._status == DevStatus.SCANNING else 0)
+
+    @property
+    def queued_jobs(self):
+        """Return the queued jobs in the order they will run."""
+        return self._queue.jobs
+
+    def supports(self, requirements):
+        """Return whether every required option value can be set.
+
+        Checked against the cached options and their validators only, it
+        never calls the worker; a device whose options are not loaded yet
+        supports nothing.
+
+        Keyword arguments:
+        requirements -- dict of option names to required values
+        """
+        options = self._options
+        if not self.enabled or options is None:
+            return False
+
+        with self._options_lock:
+            try:
+                for option_name, value in requirements.items():
+                    validator = self._validators.get(option_name)
+                    if option_name not in options or validator is None:
+                        return False
+                    validator(value)
+            except DesanityOptionInvalidValue:
+                return False
+
+        return True
+
+    def queue_position(self, job):
+        """Return the position of a queued job, None if not queued."""
+        return self._queue.position(job)
+
+    def abort_job(self, job_id):
+        """Abort a queued or running job.
+
+        raises: DesanityUnknownJob, DesanityJobFinished
+        """
+        job = self.get_job(job_id)
+        if self._queue.remove(job):
+            job.mark_aborted()
+        else:
+            job.abort()
 
         return job
 
@@ -211,31 +754,138 @@ class DesanityDevice():
                 'guid': self.guid,
             }
 
+    def _dispatch(self):
+        """Have the worker run the next queued job.
+
+        Every queued job submits one run, each run takes the job first in
+        the queue at that time, so commands submitted meanwhile are served
+        between jobs.
+        """
+        self._worker.submit(self._run_next)
+
+    def _run_next(self):
+        """Run the job first in the queue, on the worker."""
+        job = self._queue.pop(self._claim)
+        if job is None:
+            # aborted while queued
+            return
+
+        try:
+            self._use_handle()
+            if job.options:
+                self._write_options(job.options)
+        except Exception as ex:  # pylint: disable=broad-except
+            # nobody reads the Future of a run, the job carries the error
+            if not job.progress.aborted:
+                job.mark_error(str(ex) or type(ex).__name__)
+                self._status = DevStatus.COMPLETED
+                return
+
+        if job.progress.aborted:
+            # disabled or aborted while the handle was being prepared
+            job.mark_aborted()
+            self._status = DevStatus.COMPLETED
+            return
+
+        try:
+            self._start_scan(job)
+        except Exception:  # pylint: disable=broad-except
+            # the job recorded the error, keep serving the queue
+            return
+
+    def _claim(self, job):
+        """Make a job popped off the queue the running one.
+
+        Called under the queue lock, so disable either pops the job itself
+        or finds it running and aborts it.
+        """
+        self._current_job = job
+        self._status = DevStatus.SCANNING
+
     def _start_scan(self, job):
         """Private method to begin a scan asyncronously."""
         try:
+            self._current_job = job
             self._status = DevStatus.SCANNING
-            pages = self._sane_device.multi_scan()
+            job.mark_started()
+            # hand each page to the encoder as it arrives so page N is
+            # compressed while page N+1 is still being read
+            pages = []
+            try:
+                for image in self._acquire(job):
+                    pages.append(self._encoder.submit(job, image))
+            finally:
+                # the pages in flight land before the job can end
+                wait(pages)
             for page in pages:
-                job.add_image(page)
+                page.result()
+
+            if job.progress.aborted:
+                job.mark_aborted()
+            else:
+                job.mark_complete()
         except Exception as ex:
-            job.mark_error(str(ex))
-            raise ex
+            if not job.progress.aborted:
+                job.mark_error(str(ex))
+                raise ex
+            job.mark_aborted()
         finally:
             self._status = DevStatus.COMPLETED
-            job.mark_complete()
-
-    def _get_next_job(self):
-        """Return the next available job number for the device."""
-        # if len(self._jobs) == self._max_saved_jobs:
-        #     self._jobs.pop()
-
-        new_job = DesanityJob(int(datetime.timestamp(datetime.now())))
-
-        self._jobs.insert(0, new_job)
-        self._current_job = new_job
-
-        return self._current_job
+            self._last_used = time.monotonic()
+
+    def _acquire(self, job):
+        """Read pages through the SANE read loop, reporting progress.
+
+        Mirrors the sane multi_scan iterator, but hands snap a progress
+        callback so every scanline read is reported on the job as it
+        arrives and an abort can cancel the page mid acquisition.
+        """
+        def progress(lines, total_lines):
+            job.progress.update(lines, total_lines)
+            if job.progress.aborted:
+                # the next sane_read returns cancelled and snap raises
+                self._sane_device.cancel()
+
+        page = 0
+        try:
+            while not job.progress.aborted:
+                try:
+                    self._sane_device.start()
+                except SaneException as ex:
+                    if str(ex) == 'Document feeder out of documents':
+                        return
+                    raise
+
+                page += 1
+                job.progress.begin_page(page)
+                yield self._sane_device.snap(True, progress=progress)
+        finally:
+            self._sane_device.cancel()
+
+    def _get_next_job(self, priority=ScanPriority.NORMAL, options=None):
+        """Return a new job with the next available job number."""
+        with self._jobs_lock:
+            # queued jobs can be submitted within the same second
+            self._last_job_number = max(
+                int(datetime.timestamp(datetime.now())),
+                self._last_job_number + 1)
+            new_job = DesanityJob(self._last_job_number,
+                                  os.path.join(self._spool_dir, self._guid),
+                                  self._spool_format, priority, options,
+                                  self._publish_job)
+            self._jobs.insert(0, new_job)
+
+        self._publish_job(new_job)
+        return new_job
+
+    def _publish_job(self, job):
+        """Publish the state of a job to the job store."""
+        try:
+            self._job_store.save(job_state(self._guid, job))
+        except Exception:  # pylint: disable=broad-except
+            # the local job stays authoritative, a store outage must not
+            # fail the scan, the next change publishes the state again
+            pass
 
     def _parse_constraints(self, opt):
         """Return the constraits for the given option."""
@@ -255,26 +905,25 @@ class DesanityDevice():
         return constraints
 
     def _parse_option(self, opt_name):
-        """Parse device option."""
+        """Return the parsed device option, None if it is inactive."""
         if opt_name == '':
-            return
+            return None
 
         opt = self._sane_device[opt_name]
 
         if not opt.is_active():
-            return
+            return None
 
-        self._options[opt_name] = {}
-        self._options[opt_name]['name'] = opt.name
-        self._options[opt_name]['value'] = getattr(self._sane_device,
-                                                   opt_name)
-        self._options[opt_name]['py_name'] = opt.py_name
-        self._options[opt_name]['type'] = opt.type
-        self._options[opt_name]['unit'] = opt.unit
-        self._options[opt_name]['size'] = opt.size
-        self._options[opt_name]['desc'] = opt.desc
-        constraints = self._parse_constraints(opt.constraint)
-        self._options[opt_name]['constraints'] = constraints
+        return {
+            'name': opt.name,
+            'value': getattr(self._sane_device, opt_name),
+            'py_name': opt.py_name,
+            'type': opt.type,
+            'unit': opt.unit,
+            'size': opt.size,
+            'desc': opt.desc,
+            'constraints': self._parse_constraints(opt.constraint)
+        }
 
     def _parse_name_value(self, opt):
         """Parse the property name and value from the option."""
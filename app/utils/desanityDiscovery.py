@@ -0,0 +1,219 @@
+###############################################################################
+#  desanityDiscovery.py for the desanity microservice                         #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Background device discovery.
+
+SANE discovery can take many seconds with network backends enabled, so it
+runs off the request threads. The last result is cached with a time to
+live and persisted to disk so a restarted node can answer immediately.
+"""
+# }}}
+
+# libraries {{{
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+# }}}
+
+# desanity discovery {{{
+DEFAULT_DISCOVERY_TTL = 300
+DEFAULT_DISCOVERY_MISSES = 2
+DEFAULT_DISCOVERY_CACHE = os.path.join(tempfile.gettempdir(),
+                                       'descry-devices.json')
+
+
+class DesanityDiscovery():
+    """TTL cached device discovery refreshed in the background."""
+
+    def __init__(self, refresh, ttl=DEFAULT_DISCOVERY_TTL,
+                 cache_path=DEFAULT_DISCOVERY_CACHE):
+        """Initialize discovery.
+
+        Keyword arguments:
+        refresh -- callable running discovery and returning the devices
+        ttl -- seconds before a discovery result is considered stale
+        cache_path -- file the last discovery result is persisted to
+        """
+        self._refresh = refresh
+        self._ttl = ttl
+        self._cache_path = cache_path
+        self._lock = Lock()
+        self._wake = Event()
+        self._stopped = Event()
+        self._thread = None
+        self._running = False
+        self._devices = []
+        self._refreshed_at = None
+        self._error = None
+
+    @property
+    def devices(self):
+        """Return the last discovered devices as json objects."""
+        with self._lock:
+            return list(self._devices)
+
+    @property
+    def stale(self):
+        """Return whether the last discovery result outlived its ttl."""
+        with self._lock:
+            return self._refreshed_at is None or \
+                datetime.now() - self._refreshed_at > \
+                timedelta(seconds=self._ttl)
+
+    @property
+    def refreshed_at(self):
+        """Return when the cached result was discovered, None if never."""
+        with self._lock:
+            return self._refreshed_at
+
+    @property
+    def running(self):
+        """Return whether a discovery is in flight."""
+        return self._running
+
+    def load(self):
+        """Load the persisted discovery result, returning its devices."""
+        try:
+            with open(self._cache_path, encoding='utf-8') as cache_fp:
+                cache = json.load(cache_fp)
+            devices = list(cache['devices'])
+            refreshed_at = datetime.fromisoformat(cache['refreshed_at'])
+        except (IOError, ValueError, KeyError, TypeError):
+            # a missing or malformed cache is a cache miss
+            return []
+
+        with self._lock:
+            self._devices = devices
+            self._refreshed_at = refreshed_at
+
+        return self.devices
+
+    def start(self):
+        """Start the background discovery loop."""
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, daemon=True,
+                                  name='desanity-discovery')
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background discovery loop."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        self._stopped.set()
+        self._wake.set()
+        if thread is not None:
+            thread.join()
+
+    def trigger(self):
+        """Request a discovery without waiting for it to finish."""
+        with self._lock:
+            if self._thread is not None:
+                self._wake.set()
+                return
+            if self._running:
+                return
+            self._running = True
+
+        Thread(target=self.refresh, daemon=True,
+               name='desanity-discovery').start()
+
+    def refresh(self):
+        """Run a discovery now, caching and persisting the result."""
+        self._running = True
+        try:
+            devices = [dev.serialize_json() for dev in self._refresh()]
+        except Exception as ex:  # pylint: disable=broad-except
+            # keep serving the last result, the error is reported
+            with self._lock:
+                self._error = str(ex) or type(ex).__name__
+            return
+        finally:
+            self._running = False
+
+        with self._lock:
+            self._devices = devices
+            self._refreshed_at = datetime.now()
+            self._error = None
+
+        try:
+            self._persist()
+        except IOError:
+            # the in memory result is still good, only restarts lose it
+            pass
+
+    def serialize_json(self):
+        """Return the discovery state as a json object."""
+        with self._lock:
+            refreshed_at = self._refreshed_at
+            error = self._error
+
+        return {
+            'devices': self.devices,
+            'refreshed_at': refreshed_at.isoformat() if refreshed_at
+            else None,
+            'stale': self.stale,
+            'running': self.running,
+            'error': error
+        }
+
+    def _run(self):
+        """Discovery loop, refreshes once stale or when triggered."""
+        while not self._stopped.is_set():
+            if self._wake.is_set() or self.stale:
+                self._wake.clear()
+                try:
+                    self.refresh()
+                except Exception as ex:  # pylint: disable=broad-except
+                    # an unexpected error must not end discovery for good
+                    with self._lock:
+                        self._error = str(ex) or type(ex).__name__
+            self._wake.wait(self._next_refresh())
+
+    def _next_refresh(self):
+        """Return the seconds until the cached result goes stale."""
+        with self._lock:
+            if self._refreshed_at is None or self._error is not None:
+                # retry failed discoveries once per ttl, not in a hot loop
+                return self._ttl
+
+            age = datetime.now() - self._refreshed_at
+            return max(self._ttl - age.total_seconds(), 0)
+
+    def _persist(self):
+        """Write the last discovery result to the cache file."""
+        with self._lock:
+            cache = {
+                'devices': self._devices,
+                'refreshed_at': self._refreshed_at.isoformat()
+            }
+
+        cache_dir = os.path.dirname(self._cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        tmp_path = f'{self._cache_path}.tmp'
+        with open(tmp_path, encoding='utf-8', mode='w') as cache_fp:
+            json.dump(cache, cache_fp)
+        os.replace(tmp_path, self._cache_path)
+# }}}
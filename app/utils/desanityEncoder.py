@@ -0,0 +1,145 @@
+###############################################################################
+#  desanityEncoder.py for the desanity microservice                           #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Page encoding pool.
+
+Compresses acquired pages in a bounded pool of worker processes so the
+scanning thread can go straight back to reading the next page from the
+device. At most max_pending pages are held between acquisition and the
+spool, further submissions block the scanning thread until a slot frees.
+"""
+# }}}
+
+# libraries {{{
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Lock, Semaphore
+# }}}
+
+# desanity encoder {{{
+# forking a process that runs device worker threads can copy locks held
+# by those threads into the children
+START_METHOD = 'forkserver' \
+    if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def encode_page(image, fmt, path):
+    """Encode image to path, run inside the pool worker processes."""
+    image.save(path, format=fmt)
+
+
+class DesanityEncoder():
+    """Bounded process pool encoding pages into job spools."""
+
+    def __init__(self, workers, max_pending=None):
+        """Initialize the encoder.
+
+        Keyword arguments:
+        workers -- number of encoding processes, 0 encodes inline
+        max_pending -- pages allowed between acquisition and the spool
+        """
+        self._workers = workers
+        self._max_pending = max_pending or max(workers * 2, 1)
+        self._slots = Semaphore(self._max_pending)
+        self._pool = None
+        self._lock = Lock()
+        self._waiting = 0
+        self._encoding = 0
+        self._completed = 0
+        self._failed = 0
+
+    @property
+    def workers(self):
+        """Return the number of encoding processes."""
+        return self._workers
+
+    @property
+    def stats(self):
+        """Return the queue depth of each encoding stage."""
+        with self._lock:
+            return {
+                'workers': self._workers,
+                'max_pending': self._max_pending,
+                'waiting': self._waiting,
+                'encoding': self._encoding,
+                'completed': self._completed,
+                'failed': self._failed
+            }
+
+    def submit(self, job, image):
+        """Queue image for encoding into job.
+
+        Returns a future resolving to the committed page handle. Blocks
+        while the pool already holds max_pending pages.
+        """
+        number, path = job.reserve_page()
+        width, height, mode = image.width, image.height, image.mode
+        page = Future()
+
+        self._count('_waiting', 1)
+        self._slots.acquire()  # pylint: disable=consider-using-with
+        self._count('_waiting', -1)
+        self._count('_encoding', 1)
+
+        def committed(encoded):
+            self._slots.release()
+            self._count('_encoding', -1)
+            try:
+                encoded.result()
+                page.set_result(job.commit_page(number, path, width,
+                                                height, mode))
+                self._count('_completed', 1)
+            except Exception as ex:  # pylint: disable=broad-except
+                page.set_exception(ex)
+                self._count('_failed', 1)
+
+        if self._workers == 0:
+            encoded = Future()
+            try:
+                encode_page(image, job.spool.format, path)
+                encoded.set_result(None)
+            except Exception as ex:  # pylint: disable=broad-except
+                encoded.set_exception(ex)
+            committed(encoded)
+        else:
+            self._get_pool().submit(encode_page, image, job.spool.format,
+                                    path).add_done_callback(committed)
+
+        return page
+
+    def shutdown(self):
+        """Wait for pending pages and stop the worker processes."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _get_pool(self):
+        """Return the process pool, starting it on first use."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self._workers,
+                    mp_context=multiprocessing.get_context(START_METHOD))
+            return self._pool
+
+    def _count(self, counter, delta):
+        """Adjust one of the stage counters."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + delta)
+# }}}
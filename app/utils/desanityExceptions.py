@@ -19,8 +19,13 @@
 # }}}
 
 # Desanity Exceptions {{{
-import sane
-SaneException = sane._sane.error
+try:
+    import sane
+    SaneException = sane._sane.error
+except ImportError:
+    # gateways and device host clients run without python-sane
+    class SaneException(Exception):
+        """Stands in for the python-sane error when it is missing."""
 
 
 class DesanityException(Exception):
@@ -31,6 +36,14 @@ class DesanitySaneException(DesanityException):
     """Sane Error."""
 
 
+class DesanityHostUnavailable(DesanityException):
+    """The device host cannot be reached."""
+
+
+class DesanityNodeUnavailable(DesanityException):
+    """A federated Descry node cannot be reached."""
+
+
 class DesanityUnknownDev(DesanityException):
     """Unknown device referenced."""
 
@@ -53,4 +66,24 @@ class DesanityOptionUnsettable(DesanityException):
 
 class DesanityUnknownOption(DesanityException):
     """Option does not exist for sane device."""
+
+
+class DesanityUnknownProfile(DesanityException):
+    """Scan profile does not exist for sane device."""
+
+
+class DesanityNoCompatibleDevice(DesanityException):
+    """No enabled device supports the required capabilities."""
+
+
+class DesanityUnknownJob(DesanityException):
+    """Job does not exist for sane device."""
+
+
+class DesanityUnknownPage(DesanityException):
+    """Page does not exist for scanning job."""
+
+
+class DesanityJobFinished(DesanityException):
+    """Scanning job is no longer running."""
 # }}}
@@ -0,0 +1,434 @@
+###############################################################################
+#  desanityFederation.py for the desanity microservice                        #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Federation of Descry nodes behind a gateway.
+
+A gateway aggregates the device registries of many Descry nodes into one
+/devices namespace and forwards device requests to the node owning the
+device. Node registries are cached with a time to live, a node that
+cannot be reached keeps serving its last known devices. Requests go over
+pooled keep-alive HTTP connections, one pool per node.
+"""
+# }}}
+
+# libraries {{{
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from http.client import RemoteDisconnected
+from threading import Lock
+from urllib.parse import urlsplit
+from .desanityExceptions import DesanityUnknownDev, DesanityNodeUnavailable
+from .desanitySingleFlight import DesanitySingleFlight
+# }}}
+
+# desanity federation {{{
+DEFAULT_FEDERATION_TTL = 30
+DEFAULT_NODE_TIMEOUT = 10
+DEFAULT_NODE_POOL_SIZE = 4
+# streamed bodies, like live job progress, go quiet between events, nodes
+# send a keep-alive every 15 seconds
+DEFAULT_STREAM_TIMEOUT = 60
+NODE_CHUNK_SIZE = 64 * 1024
+
+# connection level headers that are not forwarded between hops
+HOP_HEADERS = frozenset(('connection', 'keep-alive', 'proxy-authenticate',
+                         'proxy-authorization', 'te', 'trailers',
+                         'transfer-encoding', 'upgrade', 'host'))
+
+# errors of a connection the node closed while it sat idle in the pool
+STALE_ERRORS = (RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                ConnectionAbortedError)
+
+
+class DesanityNodeResponse():
+    """Streamed response of a node, its connection returns to the pool."""
+
+    def __init__(self, pool, conn, response):
+        """Initialize the response of a pooled connection."""
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+
+    @property
+    def status(self):
+        """Return the HTTP status of the response."""
+        return self._response.status
+
+    @property
+    def headers(self):
+        """Return the end to end headers of the response."""
+        return [(name, value) for name, value in self._response.getheaders()
+                if name.lower() not in HOP_HEADERS]
+
+    def read(self):
+        """Return the whole body, releasing the connection."""
+        try:
+            return self._response.read()
+        finally:
+            self.close()
+
+    def json(self):
+        """Return the body decoded as json."""
+        return json.loads(self.read() or b'null')
+
+    def iter_content(self):
+        """Yield the body as it arrives, releasing the connection after.
+
+        Reads wait up to the stream timeout of the pool rather than the
+        request timeout.
+        """
+        try:
+            self._pool.streaming(self._conn)
+            while True:
+                chunk = self._response.read1(NODE_CHUNK_SIZE)
+                if not chunk:
+                    # read1 leaves a fully read body open, read marks it
+                    # closed so the connection can be reused
+                    self._response.read()
+                    return
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        """Return the connection to its pool, once."""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn, self._response)
+
+
+class DesanityNodePool():
+    """Keep-alive HTTP connections to one Descry node."""
+
+    def __init__(self, url, size=DEFAULT_NODE_POOL_SIZE,
+                 timeout=DEFAULT_NODE_TIMEOUT,
+                 stream_timeout=DEFAULT_STREAM_TIMEOUT):
+        """Initialize the pool.
+
+        Keyword arguments:
+        url -- base url of the node api, like http://scan1:5000/api/v1
+        size -- idle connections kept open
+        timeout -- seconds to wait on the node
+        stream_timeout -- seconds to wait between the chunks of a
+                          streamed body
+        """
+        parts = urlsplit(url)
+        self._url = url.rstrip('/')
+        self._connection = HTTPSConnection if parts.scheme == 'https' \
+            else HTTPConnection
+        self._netloc = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self._size = size
+        self._timeout = timeout
+        self._stream_timeout = stream_timeout
+        self._lock = Lock()
+        self._idle = []
+        self._created = 0
+        self._reused = 0
+
+    @property
+    def url(self):
+        """Return the base url of the node."""
+        return self._url
+
+    @property
+    def stats(self):
+        """Return the connections opened and reused."""
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'created': self._created,
+                'reused': self._reused
+            }
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request to the node.
+
+        Keyword arguments:
+        method -- HTTP method
+        path -- path under the node api, with any query string
+        body -- request body bytes
+        headers -- dict of request headers
+
+        returns: DesanityNodeResponse, read or closed to release it
+        raises: DesanityNodeUnavailable
+        """
+        conn, reused = self._acquire()
+        sent = False
+        try:
+            conn.request(method, self._prefix + path, body=body,
+                         headers=headers or {})
+            sent = True
+            return DesanityNodeResponse(self, conn, conn.getresponse())
+        except (HTTPException, OSError) as ex:
+            conn.close()
+            # only a request that never reached the node is retried, on a
+            # connection the node closed while idle. Device GETs and PUTs
+            # queue scans and open devices, so none is safe to send twice
+            if not reused or sent or not isinstance(ex, STALE_ERRORS):
+                raise DesanityNodeUnavailable(
+                    f'Node {self._url} unavailable: {ex}') from ex
+
+        conn = self._new()
+        try:
+            return self._send(conn, method, path, body, headers)
+        except (HTTPException, OSError) as ex:
+            conn.close()
+            raise DesanityNodeUnavailable(
+                f'Node {self._url} unavailable: {ex}') from ex
+
+    def streaming(self, conn):
+        """Wait on a connection up to the stream timeout from now on."""
+        if conn.sock is not None:
+            conn.sock.settimeout(self._stream_timeout)
+
+    def release(self, conn, response):
+        """Return a connection to the pool if it can be reused."""
+        with self._lock:
+            if response.isclosed() and not response.will_close and \
+               len(self._idle) < self._size:
+                self._idle.append(conn)
+                return
+
+        conn.close()
+
+    def close(self):
+        """Close the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for conn in idle:
+            conn.close()
+
+    def _send(self, conn, method, path, body, headers):
+        """Send a request on conn and return its response."""
+        conn.request(method, self._prefix + path, body=body,
+                     headers=headers or {})
+        return DesanityNodeResponse(self, conn, conn.getresponse())
+
+    def _acquire(self):
+        """Return an idle connection or a new one, and if it was reused."""
+        with self._lock:
+            if self._idle:
+                self._reused += 1
+                conn = self._idle.pop()
+                if conn.sock is not None:
+                    # it may have carried a stream
+                    conn.sock.settimeout(self._timeout)
+                return conn, True
+
+        return self._new(), False
+
+    def _new(self):
+        """Open a new connection to the node."""
+        with self._lock:
+            self._created += 1
+
+        return self._connection(self._netloc, timeout=self._timeout)
+
+
+class DesanityFederation():
+    """Aggregated device registry of a set of Descry nodes."""
+
+    def __init__(self, nodes=None, ttl=DEFAULT_FEDERATION_TTL,
+                 timeout=DEFAULT_NODE_TIMEOUT,
+                 pool_size=DEFAULT_NODE_POOL_SIZE,
+                 stream_timeout=DEFAULT_STREAM_TIMEOUT):
+        """Initialize the federation.
+
+        Keyword arguments:
+        nodes -- base urls of the node apis
+        ttl -- seconds a node registry is cached
+        timeout -- seconds to wait on a node
+        pool_size -- idle connections kept open per node
+        stream_timeout -- seconds to wait between the chunks of a
+                          streamed body
+        """
+        self._lock = Lock()
+        self._flights = DesanitySingleFlight()
+        self._setup(nodes, ttl, timeout, pool_size, stream_timeout)
+
+    @property
+    def enabled(self):
+        """Return whether the gateway has nodes to federate."""
+        return bool(self._pools)
+
+    @property
+    def stats(self):
+        """Return the nodes, their devices, errors and connections."""
+        with self._lock:
+            return {
+                'ttl': self._ttl,
+                'nodes': [{
+                    'url': pool.url,
+                    'devices': len(self._registries[pool.url]),
+                    'error': self._errors.get(pool.url),
+                    'connections': pool.stats
+                } for pool in self._pools]
+            }
+
+    def configure(self, config):
+        """Apply the application configuration to the federation.
+
+        Keyword arguments:
+        config -- flask configuration mapping
+        """
+        self.close()
+        with self._lock:
+            self._setup(config.get('FEDERATION_NODES'),
+                        config.get('FEDERATION_TTL', DEFAULT_FEDERATION_TTL),
+                        config.get('FEDERATION_TIMEOUT',
+                                   DEFAULT_NODE_TIMEOUT),
+                        config.get('FEDERATION_POOL_SIZE',
+                                   DEFAULT_NODE_POOL_SIZE),
+                        config.get('FEDERATION_STREAM_TIMEOUT',
+                                   DEFAULT_STREAM_TIMEOUT))
+
+    def close(self):
+        """Close the connections to every node."""
+        for pool in self._pools:
+            pool.close()
+
+    def devices(self):
+        """Return the devices of every node, each with its node url."""
+        with self._lock:
+            fresh = self._refreshed is not None and \
+                time.monotonic() - self._refreshed < self._ttl
+
+        if not fresh:
+            self.refresh()
+
+        with self._lock:
+            return [dict(dev) for pool in self._pools
+                    for dev in self._registries[pool.url]]
+
+    def refresh(self):
+        """Fetch the registries of every node, concurrent calls share one."""
+        return self._flights.do('refresh', self._refresh)
+
+    def owner(self, guid):
+        """Return the node pool owning a device.
+
+        raises: DesanityUnknownDev
+        """
+        with self._lock:
+            pool = self._owners.get(guid)
+            # a guid no node knew at the last refresh stays unknown until
+            # the registries expire, instead of refreshing on every request
+            unknown = guid in self._unknown and \
+                time.monotonic() - self._refreshed < self._ttl
+
+        if pool is None and not unknown:
+            # the device may have appeared since the registries were cached
+            self.refresh()
+            with self._lock:
+                pool = self._owners.get(guid)
+                if pool is None:
+                    self._unknown.add(guid)
+
+        if pool is None:
+            raise DesanityUnknownDev(f'Unknown device {guid}')
+
+        return pool
+
+    def forward(self, guid, method, path, body=None, headers=None):
+        """Send a device request to the node owning the device.
+
+        returns: DesanityNodeResponse
+        raises: DesanityUnknownDev, DesanityNodeUnavailable
+        """
+        return self.owner(guid).request(method, path, body, headers)
+
+    def dispatch(self, body, headers=None):
+        """Offer a pool scan to the nodes until one queues it.
+
+        Nodes are tried in their configured order, a node answering 409
+        has no compatible device and the next one is tried.
+
+        returns: DesanityNodeResponse of the node that took the scan, or
+                 the last refusal
+        raises: DesanityNodeUnavailable if no node could be reached
+        """
+        response = None
+        for pool in self._pools:
+            try:
+                response = pool.request('POST', '/devices/scan', body,
+                                        headers)
+            except DesanityNodeUnavailable:
+                continue
+
+            if response.status != 409:
+                return response
+            response.read()
+
+        if response is None:
+            raise DesanityNodeUnavailable('No node could be reached')
+
+        return response
+
+    def _setup(self, nodes, ttl, timeout, pool_size, stream_timeout):
+        """Set the nodes and forget their registries."""
+        self._pools = [DesanityNodePool(url, pool_size, timeout,
+                                        stream_timeout)
+                       for url in nodes or []]
+        self._ttl = ttl
+        self._registries = {pool.url: [] for pool in self._pools}
+        self._errors = {}
+        self._owners = {}
+        self._unknown = set()
+        self._refreshed = None
+
+    def _refresh(self):
+        """Fetch every node registry and rebuild the owner index."""
+        with ThreadPoolExecutor(max_workers=len(self._pools) or 1) as pool:
+            results = list(pool.map(self._fetch, self._pools))
+
+        with self._lock:
+            for node, (devices, error) in zip(self._pools, results):
+                if error is None:
+                    self._registries[node.url] = devices
+                    self._errors.pop(node.url, None)
+                else:
+                    # keep serving the last known devices of the node
+                    self._errors[node.url] = error
+
+            self._owners = {dev['guid']: node for node in self._pools
+                            for dev in self._registries[node.url]}
+            self._unknown = set()
+            self._refreshed = time.monotonic()
+
+        return len(self._owners)
+
+    @staticmethod
+    def _fetch(pool):
+        """Return the devices of a node and the error fetching them."""
+        try:
+            response = pool.request('GET', '/devices')
+            if response.status != 200:
+                response.read()
+                return None, f'HTTP {response.status}'
+            devices = response.json()['devices']
+        except (DesanityNodeUnavailable, ValueError, KeyError) as ex:
+            return None, str(ex)
+
+        return [{**dev, 'node': pool.url} for dev in devices], None
+
+
+federation = DesanityFederation()
+# }}}
@@ -0,0 +1,136 @@
+###############################################################################
+#  desanityHandles.py for the desanity microservice                           #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Idle SANE handle pool.
+
+An enabled device holds its SANE handle, and with it a scanner session,
+until it is disabled. The pool parks the handles of devices left idle
+longer than a timeout, the devices stay enabled and reopen their handle
+with the same option values on the next operation. Hits and misses count
+the operations finding the handle open and those paying to reopen it.
+"""
+# }}}
+
+# libraries {{{
+from threading import Event, Lock, Thread
+# }}}
+
+# desanity handle pool {{{
+DEFAULT_HANDLE_SWEEP_INTERVAL = 30
+
+
+class DesanityHandlePool():
+    """Sweeper parking the handles of idle devices."""
+
+    def __init__(self, idle_timeout=None,
+                 interval=DEFAULT_HANDLE_SWEEP_INTERVAL):
+        """Initialize the pool.
+
+        Keyword arguments:
+        idle_timeout -- seconds a handle is kept open unused, None to keep
+                        handles open until the device is disabled
+        interval -- seconds between background sweeps
+        """
+        self._idle_timeout = idle_timeout
+        self._interval = interval
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+        self._sweeps = 0
+        self._parked = 0
+        self._errors = {}
+
+    @property
+    def idle_timeout(self):
+        """Return the seconds a handle is kept open unused."""
+        return self._idle_timeout
+
+    def serialize_json(self, devices):
+        """Return the pool policy and the handle counters of devices."""
+        handles = [dict(dev.handle_stats, guid=dev.guid) for dev in devices]
+        hits = sum(handle['hits'] for handle in handles)
+        misses = sum(handle['misses'] for handle in handles)
+
+        with self._lock:
+            return {
+                'idle_timeout': self._idle_timeout,
+                'sweeps': self._sweeps,
+                'parked': self._parked,
+                'open': sum(1 for handle in handles if handle['open']),
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': hits / (hits + misses) if hits + misses
+                else None,
+                'devices': handles,
+                'errors': dict(self._errors)
+            }
+
+    def start(self, devices):
+        """Start parking idle handles in the background.
+
+        Keyword arguments:
+        devices -- callable returning the devices to sweep
+        """
+        with self._lock:
+            if self._thread is not None or self._idle_timeout is None:
+                return
+
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, args=(devices,),
+                                  daemon=True, name='desanity-handles')
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background sweeper."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        self._stopped.set()
+        if thread is not None:
+            thread.join()
+
+    def sweep(self, devices):
+        """Park the handles idle for longer than the timeout.
+
+        A device failing to park keeps its handle and its error is kept
+        until it parks, the other devices are still swept.
+
+        returns: the number of handles parked
+        """
+        if self._idle_timeout is None:
+            return 0
+
+        parked = 0
+        errors = {}
+        for dev in devices:
+            try:
+                parked += 1 if dev.park(self._idle_timeout) else 0
+            except Exception as ex:  # pylint: disable=broad-except
+                errors[dev.guid] = str(ex) or type(ex).__name__
+
+        with self._lock:
+            self._sweeps += 1
+            self._parked += parked
+            self._errors = errors
+
+        return parked
+
+    def _run(self, devices):
+        """Sweeper loop."""
+        while not self._stopped.wait(self._interval):
+            self.sweep(devices())
+# }}}
@@ -0,0 +1,211 @@
+###############################################################################
+#  desanityHealth.py for the desanity microservice                            #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Background device health probes.
+
+DevStatus only reflects the local state of a device. Each device is
+probed in the background and its reachability and probe latency are
+cached so listings answer without touching SANE. Open handles are asked
+for their parameters, devices without one, disabled or parked, are never
+opened for a probe, they are reachable while the last discovery lists
+them. A device failing its probe is probed again after an interval
+doubling with every failure, up to a maximum, and back to the base
+interval once it answers.
+"""
+# }}}
+
+# libraries {{{
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+# }}}
+
+# desanity health {{{
+DEFAULT_HEALTH_INTERVAL = 30
+DEFAULT_HEALTH_MAX_INTERVAL = 600
+DEFAULT_HEALTH_WORKERS = 4
+
+
+class DesanityHealth():
+    """Cached reachability of devices, probed in the background."""
+
+    def __init__(self, interval=DEFAULT_HEALTH_INTERVAL,
+                 max_interval=DEFAULT_HEALTH_MAX_INTERVAL,
+                 workers=DEFAULT_HEALTH_WORKERS, listed=None):
+        """Initialize the prober.
+
+        Keyword arguments:
+        interval -- seconds between probes of a reachable device, None
+                    to disable background probes
+        max_interval -- longest backoff between probes of an unreachable
+                        device
+        workers -- devices probed at once
+        listed -- callable returning the names listed by the last
+                  discovery and when it ran, None if there was none
+        """
+        self._interval = interval
+        self._max_interval = max_interval
+        self._workers = workers
+        self._listed = listed
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+        self._health = {}
+
+    def status(self, guid):
+        """Return the cached health of a device, None if never probed."""
+        with self._lock:
+            entry = self._health.get(guid)
+            return self._serialize(entry) if entry is not None else None
+
+    def serialize_json(self):
+        """Return the cached health of every probed device by guid."""
+        with self._lock:
+            return {guid: self._serialize(entry)
+                    for guid, entry in self._health.items()}
+
+    def start(self, devices):
+        """Start probing in the background.
+
+        Keyword arguments:
+        devices -- callable returning the devices to probe
+        """
+        with self._lock:
+            if self._thread is not None or self._interval is None:
+                return
+
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, args=(devices,),
+                                  daemon=True, name='desanity-health')
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background prober."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        self._stopped.set()
+        if thread is not None:
+            thread.join()
+
+    def probe(self, devices, force=False):
+        """Probe the devices that are due, or every device if forced.
+
+        returns: the number of devices probed
+        """
+        now = datetime.now()
+        with self._lock:
+            due = [dev for dev in devices if force or
+                   dev.guid not in self._health or
+                   self._health[dev.guid]['next_probe'] <= now]
+            # forget the devices that are gone
+            known = {dev.guid for dev in devices}
+            self._health = {guid: entry for guid, entry
+                            in self._health.items() if guid in known}
+
+        if due:
+            with ThreadPoolExecutor(max_workers=self._workers,
+                                    thread_name_prefix='desanity-health') \
+                    as pool:
+                list(pool.map(self._probe, due))
+
+        return len(due)
+
+    def _probe(self, dev):
+        """Probe a device and schedule its next probe."""
+        source, seen, latency, error = self._check(dev)
+
+        now = datetime.now()
+        with self._lock:
+            entry = self._health.setdefault(dev.guid, {
+                'reachable': None,
+                'latency': None,
+                'last_seen': None,
+                'error': None,
+                'failures': 0
+            })
+            entry['last_probe'] = now
+            entry['source'] = source
+            if error is not None:
+                entry['reachable'] = False
+                entry['error'] = error
+                entry['failures'] += 1
+            elif seen is not None:
+                entry['reachable'] = True
+                entry['error'] = None
+                entry['failures'] = 0
+                entry['last_seen'] = max(seen, entry['last_seen'] or seen)
+                if latency is not None:
+                    entry['latency'] = latency
+            # otherwise nothing is known, the last state is kept
+
+            entry['next_probe'] = now + timedelta(
+                seconds=self._backoff(entry['failures']))
+
+    def _check(self, dev):
+        """Return how a device was checked, when seen, latency and error."""
+        if dev.load:
+            # a device scanning is reachable, probing would wait on the scan
+            return 'busy', datetime.now(), None, None
+
+        try:
+            latency = dev.probe()
+        except Exception as ex:  # pylint: disable=broad-except
+            return 'handle', None, None, str(ex) or type(ex).__name__
+
+        if latency is not None:
+            return 'handle', datetime.now(), latency, None
+
+        listing = self._listed() if self._listed is not None else None
+        if listing is None:
+            return None, None, None, None
+
+        names, discovered_at = listing
+        if dev.name not in names:
+            return 'discovery', None, None, 'Not listed by the last discovery'
+
+        return 'discovery', discovered_at, None, None
+
+    def _backoff(self, failures):
+        """Return the seconds until the next probe after failures."""
+        interval = self._interval or DEFAULT_HEALTH_INTERVAL
+        return min(interval * 2 ** failures,
+                   max(self._max_interval, interval))
+
+    @staticmethod
+    def _serialize(entry):
+        """Return a health entry as a json object."""
+        def isoformat(date):
+            return date.isoformat() if date is not None else None
+
+        return {
+            'reachable': entry['reachable'],
+            'source': entry['source'],
+            'latency': entry['latency'],
+            'error': entry['error'],
+            'failures': entry['failures'],
+            'last_seen': isoformat(entry['last_seen']),
+            'last_probe': isoformat(entry['last_probe']),
+            'next_probe': isoformat(entry['next_probe'])
+        }
+
+    def _run(self, devices):
+        """Prober loop, probing right away then every interval."""
+        while not self._stopped.is_set():
+            self.probe(devices())
+            self._stopped.wait(self._interval)
+# }}}
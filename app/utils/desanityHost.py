@@ -0,0 +1,617 @@
+###############################################################################
+#  desanityHost.py for the desanity microservice                              #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Out of process SANE device host.
+
+SANE handles cannot be shared between processes and a stuck or crashing
+driver takes its process down with it. The device host is the one process
+owning the SANE handles, it serves device commands over a local
+multiprocessing connection. HTTP workers talk to it through
+DesanityHostClient and see its devices as DesanityRemoteDevices, so any
+number of stateless workers share the scanners and a driver fault only
+costs the host.
+
+Pages are read straight from the shared spool directory, job state comes
+from the host or the shared job store.
+
+Commands are pickled, so clients always authenticate. A host started
+without an authkey generates one and shares it through a file next to
+its socket, readable by its own user only, like the socket itself.
+"""
+# }}}
+
+# libraries {{{
+import os
+import secrets
+import tempfile
+from datetime import datetime
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+from threading import Lock, Thread, local
+from . import desanityExceptions
+from .desanityExceptions import DesanityException, DesanityHostUnavailable
+from .desanityExceptions import DesanityUnknownPage
+from .desanityJobs import JobStatus, ScanPriority
+from .desanityJobStore import job_state
+from .desanitySpool import DesanitySpool
+from .desanityDevice import DevStatus, device_guid
+# }}}
+
+# desanity host {{{
+DEFAULT_HOST_ADDRESS = os.path.join(tempfile.gettempdir(), 'descry-host.sock')
+
+
+def _authkey(key):
+    """Return the IPC authkey as bytes, config values may be strings."""
+    return key.encode('utf-8') if isinstance(key, str) else key
+
+
+def authkey_path(address):
+    """Return the file the generated authkey of a host is shared through."""
+    return f'{address}.key'
+
+
+class DesanityHost():
+    """Serves the devices of a Desanity over a local IPC channel."""
+
+    def __init__(self, desanity, address=DEFAULT_HOST_ADDRESS, authkey=None):
+        """Initialize the host.
+
+        Keyword arguments:
+        desanity -- Desanity owning the SANE backend and its devices
+        address -- unix socket path, or (host, port), to listen on
+        authkey -- shared secret clients authenticate with, None to
+                   generate one, see authkey_path
+        """
+        self._desanity = desanity
+        self._address = address
+        self._authkey = _authkey(authkey)
+        self._generated = False
+        self._listener = None
+        self._thread = None
+        self._lock = Lock()
+
+    @property
+    def address(self):
+        """Return the address the host listens on."""
+        return self._listener.address if self._listener else self._address
+
+    def start(self):
+        """Listen and accept clients in a background thread."""
+        with self._lock:
+            if self._listener is not None:
+                return
+
+            self._listen()
+            self._thread = Thread(target=self._accept, daemon=True,
+                                  name='desanity-host')
+            self._thread.start()
+
+    def serve_forever(self):
+        """Listen and accept clients in the calling thread."""
+        with self._lock:
+            self._listen()
+
+        self._accept()
+
+    def stop(self):
+        """Stop accepting clients."""
+        with self._lock:
+            listener, self._listener = self._listener, None
+
+        if listener is not None:
+            listener.close()
+
+        if self._generated and os.path.exists(authkey_path(self._address)):
+            os.unlink(authkey_path(self._address))
+
+    def handle(self, command, kwargs):
+        """Run a command against the devices and return its result.
+
+        raises: DesanityException
+        """
+        handler = getattr(self, f'_do_{command}', None)
+        if handler is None:
+            raise DesanityException(f'Unknown host command {command}')
+
+        return handler(**kwargs)
+
+    def _listen(self):
+        """Open the listener, the lock must be held."""
+        unix_socket = isinstance(self._address, str)
+        if self._authkey is None:
+            self._authkey = self._generate_authkey()
+
+        if unix_socket and os.path.exists(self._address):
+            # left behind by a host that did not shut down cleanly
+            os.unlink(self._address)
+
+        self._listener = Listener(self._address, authkey=self._authkey)
+        if unix_socket:
+            os.chmod(self._address, 0o600)
+
+    def _generate_authkey(self):
+        """Generate an authkey, shared through a file only we can read."""
+        if not isinstance(self._address, str):
+            raise DesanityException('DEVICE_HOST_AUTHKEY is required for a '
+                                    'device host listening on TCP')
+
+        key = secrets.token_hex(32)
+        path = authkey_path(self._address)
+        if os.path.exists(path):
+            os.unlink(path)
+
+        key_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(key_fd, 'w', encoding='utf-8') as key_fp:
+            key_fp.write(key)
+
+        self._generated = True
+        return _authkey(key)
+
+    def _accept(self):
+        """Accept clients, serving each on its own thread."""
+        while True:
+            listener = self._listener
+            if listener is None:
+                return
+
+            try:
+                conn = listener.accept()
+            except (OSError, AuthenticationError):
+                # closed by stop, or a client failing authentication
+                if self._listener is None:
+                    return
+                continue
+
+            Thread(target=self._serve, args=(conn,), daemon=True,
+                   name='desanity-host-client').start()
+
+    def _serve(self, conn):
+        """Answer the commands of a client until it disconnects."""
+        with conn:
+            while True:
+                try:
+                    command, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    reply = ('ok', self.handle(command, kwargs))
+                except DesanityException as ex:
+                    reply = ('error', type(ex).__name__, str(ex))
+                except Exception as ex:  # pylint: disable=broad-except
+                    # keep driver faults from taking the host down
+                    reply = ('error', 'DesanitySaneException', str(ex))
+
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def _device(self, guid):
+        """Return a device of the host by guid."""
+        return self._desanity.get_device_by_guid(guid)
+
+    def _do_initialize(self):
+        return self._desanity.initialize()
+
+    def _do_devices(self, refresh=False):
+        if refresh:
+            self._desanity.refresh_devices()
+
+        return [dev.serialize_json() for dev in self._desanity.devices]
+
+    def _do_job_states(self, guid):
+        return self._desanity.get_job_states(guid)
+
+    def _do_job_state(self, guid, job_id):
+        return self._desanity.get_job_state(guid, job_id)
+
+    def _do_health(self):
+        return self._desanity.device_health()
+
+    def _do_probe(self):
+        return self._desanity.probe_devices()
+
+    def _do_status(self, guid):
+        return int(self._device(guid).status)
+
+    def _do_enable(self, guid):
+        self._device(guid).enable()
+
+    def _do_disable(self, guid):
+        self._device(guid).disable()
+
+    def _do_options(self, guid):
+        dev = self._device(guid)
+        return {
+            'version': dev.options_version,
+            'options': dev.options
+        }
+
+    def _do_set_option(self, guid, name, value):
+        return self._device(guid).set_option(name, value)
+
+    def _do_set_options(self, guid, values):
+        return self._device(guid).set_options(values)
+
+    def _do_parameters(self, guid):
+        return self._device(guid).parameters
+
+    def _do_supports(self, guid, requirements):
+        return self._device(guid).supports(requirements)
+
+    def _do_load(self, guid):
+        return self._device(guid).load
+
+    def _do_scan(self, guid, priority, options):
+        dev = self._device(guid)
+        job, position = dev.scan(priority, options)
+        if job is None:
+            return None
+
+        return {
+            'job': job_state(dev.guid, job),
+            'position': position
+        }
+
+    def _do_queue(self, guid):
+        dev = self._device(guid)
+        return {
+            'stats': dev.queue_stats,
+            'jobs': [job_state(dev.guid, job) for job in dev.queued_jobs]
+        }
+
+    def _do_jobs(self, guid):
+        dev = self._device(guid)
+        return [job_state(dev.guid, job) for job in dev.jobs]
+
+    def _do_job(self, guid, job_id):
+        dev = self._device(guid)
+        return job_state(dev.guid, dev.get_job(job_id))
+
+    def _do_progress(self, guid, job_id, version, timeout):
+        return self._device(guid).get_job(job_id).progress.wait(version,
+                                                                timeout)
+
+    def _do_abort_job(self, guid, job_id):
+        dev = self._device(guid)
+        return job_state(dev.guid, dev.abort_job(job_id))
+
+    def _do_delete_job(self, guid, job_id):
+        dev = self._device(guid)
+        return job_state(dev.guid, dev.delete_job(job_id))
+
+
+class DesanityHostClient():
+    """Client side of the device host IPC channel."""
+
+    def __init__(self, address=DEFAULT_HOST_ADDRESS, authkey=None):
+        """Initialize the client.
+
+        Keyword arguments:
+        address -- address the device host listens on
+        authkey -- shared secret of the device host, None to read the key
+                   generated by the host, see authkey_path
+        """
+        self._address = address
+        self._authkey = _authkey(authkey)
+        # a connection per thread keeps replies from interleaving
+        self._local = local()
+
+    def call(self, command, **kwargs):
+        """Run a command on the device host and return its result.
+
+        raises: DesanityHostUnavailable if the host cannot be reached,
+                the DesanityException raised by the command otherwise
+        """
+        try:
+            conn = self._connection()
+            conn.send((command, kwargs))
+            reply = conn.recv()
+        except (EOFError, OSError, AuthenticationError) as ex:
+            # drop the broken connection, the next call reconnects
+            self._local.conn = None
+            raise DesanityHostUnavailable(
+                f'Device host {self._address} unavailable: {ex}') from ex
+
+        if reply[0] == 'ok':
+            return reply[1]
+
+        exc = getattr(desanityExceptions, reply[1], None)
+        if not (isinstance(exc, type) and issubclass(exc, DesanityException)):
+            exc = DesanityException
+        raise exc(reply[2])
+
+    def device(self, dev_info):
+        """Return a DesanityRemoteDevice for a SANE device info tuple."""
+        return DesanityRemoteDevice(self, *dev_info)
+
+    def _connection(self):
+        """Return the connection of the calling thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self._address,
+                          authkey=self._authkey or self._read_authkey())
+            self._local.conn = conn
+
+        return conn
+
+    def _read_authkey(self):
+        """Return the authkey the host generated, read on each connect.
+
+        raises: OSError if the host has not shared a key
+        """
+        if not isinstance(self._address, str):
+            raise OSError('DEVICE_HOST_AUTHKEY is required for a device '
+                          'host listening on TCP')
+
+        with open(authkey_path(self._address), encoding='utf-8') as key_fp:
+            return _authkey(key_fp.read().strip())
+
+
+class DesanityRemoteJob():
+    """Read only view of a job running on the device host."""
+
+    def __init__(self, client, device_guid_, state):
+        """Initialize the job view from its published state."""
+        self._client = client
+        self._device_guid = device_guid_
+        self._state = state
+        self._progress = DesanityRemoteProgress(self)
+
+    @property
+    def guid(self):
+        """Return the guid of the job."""
+        return self._state['guid']
+
+    @property
+    def job_number(self):
+        """Return the job number."""
+        return self._state['job_number']
+
+    @property
+    def status(self):
+        """Return the job status."""
+        return JobStatus(self._state['status'])
+
+    @property
+    def priority(self):
+        """Return the ScanPriority of the job."""
+        return ScanPriority(self._state['priority'])
+
+    @property
+    def queued_date(self):
+        """Return when the job was queued."""
+        return self._date('queued_date')
+
+    @property
+    def start_date(self):
+        """Return when the acquisition of the job started."""
+        return self._date('start_date')
+
+    @property
+    def end_date(self):
+        """Return when the job finished."""
+        return self._date('end_date')
+
+    @property
+    def error_str(self):
+        """Return the error of the job."""
+        return self._state['error_str']
+
+    @property
+    def progress(self):
+        """Return the live progress of the job."""
+        return self._progress
+
+    @property
+    def spool(self):
+        """Return the spool of the job, read from the shared spool dir."""
+        return DesanitySpool.load(self._state['spool'])
+
+    @property
+    def pages(self):
+        """Return the spooled pages of the job."""
+        return self.spool.pages
+
+    def get_page(self, number):
+        """Return the page handle for page number, starting at 1."""
+        try:
+            return next(page for page in self.pages if page.number == number)
+        except (OSError, StopIteration) as ex:
+            raise DesanityUnknownPage(f'Page {number} not found for job '
+                                      f'{self.guid}') from ex
+
+    def serialize_json(self):
+        """Serialize the job in json format."""
+        return dict(self._state)
+
+    def _date(self, name):
+        """Return a published date as a datetime."""
+        date = self._state[name]
+        return datetime.fromisoformat(date) if date is not None else None
+
+
+class DesanityRemoteProgress():
+    """Live progress of a job on the device host."""
+
+    def __init__(self, job):
+        """Initialize the progress of a remote job."""
+        self._job = job
+
+    def wait(self, version, timeout=None):
+        """Block on the host until the progress moves past version."""
+        # pylint: disable=protected-access
+        return tuple(self._job._client.call(
+            'progress', guid=self._job._device_guid, job_id=self._job.guid,
+            version=version, timeout=timeout))
+
+
+class DesanityRemoteDevice():
+    """Proxy for a device owned by the device host.
+
+    Mirrors the DesanityDevice interface the API uses, every SANE call is
+    made by the host.
+    """
+
+    def __init__(self, client, name, vendor, model, device_type):
+        """Initialize a remote device.
+
+        Keyword arguments:
+        client -- DesanityHostClient of the host owning the device
+        name, vendor, model, device_type -- SANE device information
+        """
+        self._client = client
+        self._name = name
+        self._vendor = vendor
+        self._model = model
+        self._device_type = device_type
+        self._guid = device_guid(name)
+
+    @property
+    def name(self):
+        """Return the name of the device."""
+        return self._name
+
+    @property
+    def vendor(self):
+        """Return the vendor of the device."""
+        return self._vendor
+
+    @property
+    def model(self):
+        """Return the model of the device."""
+        return self._model
+
+    @property
+    def device_type(self):
+        """Return the type of the device."""
+        return self._device_type
+
+    @property
+    def guid(self):
+        """Return the guid of the device."""
+        return self._guid
+
+    @property
+    def status(self):
+        """Return the status of the device."""
+        return DevStatus(self._call('status'))
+
+    @property
+    def enabled(self):
+        """Return whether the device is opened on the host."""
+        return self.status != DevStatus.DISABLED
+
+    @property
+    def parameters(self):
+        """Return the SANE device parameters."""
+        return self._call('parameters')
+
+    @property
+    def options(self):
+        """Return the options available for the device."""
+        return self._call('options')['options']
+
+    @property
+    def options_version(self):
+        """Return the version of the options cached by the host."""
+        return self._call('options')['version']
+
+    @property
+    def jobs(self):
+        """Return the jobs of the device, newest first."""
+        return [self._job(state) for state in self._call('jobs')]
+
+    @property
+    def queue_stats(self):
+        """Return the depth and wait times of the scan queue."""
+        return self._call('queue')['stats']
+
+    @property
+    def queued_jobs(self):
+        """Return the queued jobs in the order they will run."""
+        return [self._job(state) for state in self._call('queue')['jobs']]
+
+    @property
+    def load(self):
+        """Return the number of queued and running jobs on the device."""
+        return self._call('load')
+
+    def enable(self):
+        """Open the device on the host."""
+        self._call('enable')
+
+    def disable(self):
+        """Close the device on the host."""
+        self._call('disable')
+
+    def set_option(self, option_name, value):
+        """Set a SANE device option, returning the options delta."""
+        return self._call('set_option', name=option_name, value=value)
+
+    def set_options(self, values):
+        """Set several SANE device options at once."""
+        return self._call('set_options', values=values)
+
+    def supports(self, requirements):
+        """Return whether every required option value can be set."""
+        return self._call('supports', requirements=requirements)
+
+    def scan(self, priority=ScanPriority.NORMAL, options=None):
+        """Queue a scan on the host, returning the job and its position."""
+        result = self._call('scan', priority=priority, options=options)
+        if result is None:
+            return None, None
+
+        return self._job(result['job']), result['position']
+
+    def get_job(self, job_id):
+        """Return a job by its guid or job number."""
+        return self._job(self._call('job', job_id=job_id))
+
+    def abort_job(self, job_id):
+        """Abort a queued or running job."""
+        return self._job(self._call('abort_job', job_id=job_id))
+
+    def delete_job(self, job_id):
+        """Remove a finished job and its spooled pages."""
+        return self._job(self._call('delete_job', job_id=job_id))
+
+    def evict_job(self, job):  # pylint: disable=unused-argument
+        """Leave eviction to the retention of the host."""
+        return False
+
+    def serialize_json(self):
+        """Return the device as a json object."""
+        return {
+                'name': self.name,
+                'vendor': self.vendor,
+                'model': self.model,
+                'device_type': self.device_type,
+                'guid': self.guid,
+            }
+
+    def _call(self, command, **kwargs):
+        """Run a command for this device on the host."""
+        return self._client.call(command, guid=self.guid, **kwargs)
+
+    def _job(self, state):
+        """Return a view of a host job from its state."""
+        return DesanityRemoteJob(self._client, self.guid, state)
+# }}}
@@ -0,0 +1,148 @@
+###############################################################################
+#  desanityJobStore.py for the desanity microservice                          #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Shared scanning job state.
+
+Devices publish the state of their jobs, status, pages and dates, to a
+job store as it changes so any API worker can answer status queries for
+jobs running in another worker. The redis store keeps one JobState per
+job keyed by its guid, the memory store stands in for it in a single
+process and in tests.
+"""
+# }}}
+
+# libraries {{{
+from threading import Lock
+# }}}
+
+# desanity job store {{{
+
+
+def job_state(device_guid, job):
+    """Return the shared state of a job as a json object."""
+    def isoformat(date):
+        return date.isoformat() if date is not None else None
+
+    return {
+        'guid': job.guid,
+        'device': device_guid,
+        'job_number': job.job_number,
+        'status': int(job.status),
+        'priority': int(job.priority),
+        'queued_date': isoformat(job.queued_date),
+        'start_date': isoformat(job.start_date),
+        'end_date': isoformat(job.end_date),
+        'error_str': job.error_str,
+        'pages': len(job.pages),
+        'spool': job.spool.path
+    }
+
+
+class DesanityMemoryJobStore():
+    """Job store kept in process memory."""
+
+    def __init__(self):
+        """Initialize the memory store."""
+        self._lock = Lock()
+        self._states = {}
+
+    def save(self, state):
+        """Store the state of a job, replacing its previous state."""
+        with self._lock:
+            self._states[state['guid']] = dict(state)
+
+    def get(self, guid):
+        """Return the state of a job by guid, None if unknown."""
+        with self._lock:
+            state = self._states.get(guid)
+            return dict(state) if state is not None else None
+
+    def find(self, device_guid, job_number):
+        """Return the state of a device job by number, None if unknown."""
+        with self._lock:
+            return next((dict(state) for state in self._states.values()
+                         if state['device'] == device_guid and
+                         state['job_number'] == job_number), None)
+
+    def list(self, device_guid):
+        """Return the states of the jobs of a device, newest first."""
+        with self._lock:
+            return sorted((dict(state) for state in self._states.values()
+                           if state['device'] == device_guid),
+                          key=lambda state: state['job_number'], reverse=True)
+
+    def delete(self, guid):
+        """Remove the state of a job."""
+        with self._lock:
+            self._states.pop(guid, None)
+
+
+class DesanityRedisJobStore():
+    """Job store persisting job state as redis JobState models."""
+
+    def __init__(self):
+        """Initialize the redis store.
+
+        redis_om is only imported here so it is only needed when job
+        state is kept in redis, the connection is taken from REDIS_OM_URL.
+        """
+        # pylint: disable=import-outside-toplevel
+        from redis_om import Migrator, NotFoundError
+        from app.models import JobState
+
+        self._model = JobState
+        self._not_found = NotFoundError
+        Migrator().run()
+
+    def save(self, state):
+        """Store the state of a job, replacing its previous state."""
+        fields = dict(state)
+        self._model(pk=fields.pop('guid'), **fields).save()
+
+    def get(self, guid):
+        """Return the state of a job by guid, None if unknown."""
+        try:
+            return self._state(self._model.get(guid))
+        except self._not_found:
+            return None
+
+    def find(self, device_guid, job_number):
+        """Return the state of a device job by number, None if unknown."""
+        try:
+            return self._state(self._model.find(
+                (self._model.device == device_guid) &
+                (self._model.job_number == job_number)).first())
+        except self._not_found:
+            return None
+
+    def list(self, device_guid):
+        """Return the states of the jobs of a device, newest first."""
+        return [self._state(model) for model in
+                self._model.find(self._model.device == device_guid)
+                .sort_by('-job_number').all()]
+
+    def delete(self, guid):
+        """Remove the state of a job."""
+        self._model.delete(guid)
+
+    @staticmethod
+    def _state(model):
+        """Return a JobState as a job state json object."""
+        state = model.dict()
+        state['guid'] = state.pop('pk')
+        return state
+# }}}
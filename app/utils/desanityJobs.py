@@ -19,9 +19,14 @@
 # }}}
 
 # libraries {{{
+import os
 import uuid
+from threading import Condition
 from enum import IntEnum
 from datetime import datetime
+from .desanitySpool import DesanitySpool, DEFAULT_SPOOL_DIR
+from .desanitySpool import DEFAULT_SPOOL_FORMAT
+from .desanityExceptions import DesanityUnknownPage, DesanityJobFinished
 # }}}
 
 # desanity job {{{
@@ -33,6 +38,120 @@ class JobStatus(IntEnum):
     STARTED = 0
     COMPLETED = 1
     ERROR = 2
+    ABORTED = 3
+    QUEUED = 4
+
+
+# statuses of a job that has not finished yet
+PENDING_STATUSES = (JobStatus.QUEUED, JobStatus.STARTED)
+
+
+class ScanPriority(IntEnum):
+    """Priority classes of queued scanning jobs."""
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class DesanityJobProgress():
+    """Live acquisition progress of a scanning job.
+
+    Updated from the SANE read loop as scanlines arrive. Readers block in
+    wait until something observable changes rather than polling the job.
+    """
+
+    # notify readers roughly once per percent of a page, or every
+    # LINE_STEP lines when the backend does not know the page length
+    LINE_STEP = 64
+
+    def __init__(self):
+        """Initialize the job progress."""
+        self._cond = Condition()
+        self._version = 0
+        self._status = JobStatus.QUEUED
+        self._page = 0
+        self._pages = 0
+        self._lines = 0
+        self._total_lines = -1
+        self._aborted = False
+
+    @property
+    def aborted(self):
+        """Return whether an abort of the job was requested."""
+        return self._aborted
+
+    def begin_page(self, page):
+        """Start reporting on a newly acquired page."""
+        with self._cond:
+            self._page = page
+            self._lines = 0
+            self._total_lines = -1
+            self._notify()
+
+    def update(self, lines, total_lines):
+        """Record the scanlines read so far, called from the read loop."""
+        step = max(total_lines // 100, 1) if total_lines > 0 \
+            else self.LINE_STEP
+
+        with self._cond:
+            previous = self._lines
+            self._lines = lines
+            self._total_lines = total_lines
+            if lines // step != previous // step:
+                self._notify()
+
+    def end_page(self):
+        """Record that the current page has been spooled."""
+        with self._cond:
+            self._pages += 1
+            self._notify()
+
+    def start(self):
+        """Record that the acquisition of the job has started."""
+        with self._cond:
+            self._status = JobStatus.STARTED
+            self._notify()
+
+    def finish(self, status):
+        """Record the final status of the job."""
+        with self._cond:
+            self._status = status
+            self._notify()
+
+    def abort(self):
+        """Request that the acquisition stop as soon as possible."""
+        with self._cond:
+            if self._status not in PENDING_STATUSES:
+                raise DesanityJobFinished('Job is no longer running')
+
+            self._aborted = True
+            self._notify()
+
+    def wait(self, version, timeout=None):
+        """Block until the progress moves past version.
+
+        Returns the current version and a snapshot of the progress.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != version, timeout)
+            return self._version, self.serialize_json()
+
+    def serialize_json(self):
+        """Serialize the job progress in json format."""
+        return {
+            'status': self._status,
+            'aborted': self._aborted,
+            'page': self._page,
+            'pages': self._pages,
+            'lines': self._lines,
+            'total_lines': self._total_lines
+        }
+
+    def _notify(self):
+        """Bump the version and wake waiting readers, lock must be held."""
+        self._version += 1
+        self._cond.notify_all()
 
 
 class DesanityJob():
@@ -40,18 +159,41 @@ class DesanityJob():
 
     _guid = None
     _job_number = None
-    _images = []
+    _spool = None
     _start_date = None
     _end_date = None
     _job_status = None
     _error_str = None
+    _progress = None
+    _queued_date = None
+    _priority = ScanPriority.NORMAL
+    _options = None
+    _listener = None
+
+    def __init__(self, job_number, spool_dir=DEFAULT_SPOOL_DIR,
+                 spool_format=DEFAULT_SPOOL_FORMAT,
+                 priority=ScanPriority.NORMAL, options=None, listener=None):
+        """Initiatlize the Job.
 
-    def __init__(self, job_number):
-        """Initiatlize the Job."""
+        Keyword arguments:
+        job_number -- number of the job on its device
+        spool_dir -- directory the job spool is created in
+        spool_format -- image format pages are spooled as
+        priority -- ScanPriority of the job in the device queue
+        options -- option values set on the device before the job scans
+        listener -- callable called with the job when its status or pages
+                    change
+        """
         self._guid = str(uuid.uuid4())
         self._job_number = job_number
-        self._start_date = datetime.now()
-        self._job_status = JobStatus.STARTED
+        self._spool = DesanitySpool(os.path.join(spool_dir, self._guid),
+                                    spool_format)
+        self._queued_date = datetime.now()
+        self._job_status = JobStatus.QUEUED
+        self._priority = ScanPriority(priority)
+        self._options = dict(options or {})
+        self._listener = listener
+        self._progress = DesanityJobProgress()
 
     @property
     def guid(self):
@@ -63,16 +205,46 @@ class DesanityJob():
         """Return the job number assoicated with the job."""
         return self._job_number
 
+    @property
+    def pages(self):
+        """Return the spooled page handles associated with the job."""
+        return self._spool.pages
+
     @property
     def images(self):
-        """Return the scanned images associated with the job."""
-        return self._images
+        """Lazily decode the scanned images associated with the job."""
+        return (page.image for page in self._spool.pages)
+
+    @property
+    def progress(self):
+        """Return the live acquisition progress of the job."""
+        return self._progress
+
+    @property
+    def spool(self):
+        """Return the on disk spool holding the pages of the job."""
+        return self._spool
 
     @property
     def status(self):
         """Return the job status."""
         return self._job_status
 
+    @property
+    def priority(self):
+        """Return the queue priority of the job."""
+        return self._priority
+
+    @property
+    def options(self):
+        """Return the option values set before the job scans."""
+        return self._options
+
+    @property
+    def queued_date(self):
+        """Return the date the job was queued."""
+        return self._queued_date
+
     @property
     def start_date(self):
         """Return the job start date."""
@@ -89,26 +261,92 @@ class DesanityJob():
         return self._error_str
 
     def add_image(self, image):
-        """Add an image to the job."""
-        self._images.append(image)
+        """Spool an image to disk and return its page handle."""
+        page = self._spool.add_image(image)
+        self._progress.end_page()
+        self._changed()
+        return page
+
+    def reserve_page(self):
+        """Reserve the next page of the job for out of band encoding."""
+        return self._spool.reserve()
+
+    def commit_page(self, number, path, width, height, mode):
+        """Record a page encoded out of band and return its handle.
+
+        A page landing after the job finished is dropped, returning None.
+        """
+        if self._job_status not in PENDING_STATUSES:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        page = self._spool.commit(number, path, width, height, mode)
+        self._progress.end_page()
+        self._changed()
+        return page
+
+    def get_page(self, number):
+        """Return the page handle for page number, starting at 1."""
+        try:
+            return next(page for page in self._spool.pages
+                        if page.number == number)
+        except StopIteration as ex:
+            raise DesanityUnknownPage(f'Page {number} not found for job '
+                                      f'{self.guid}') from ex
+
+    def delete(self):
+        """Remove the spooled pages of the job."""
+        self._spool.delete()
+
+    def abort(self):
+        """Request that the job stops or never starts."""
+        self._progress.abort()
+
+    def mark_started(self):
+        """Mark job as acquiring."""
+        self._job_status = JobStatus.STARTED
+        self._start_date = datetime.now()
+        self._progress.start()
+        self._changed()
 
     def mark_complete(self):
         """Mark job as completed."""
         self._job_status = JobStatus.COMPLETED
         self._end_date = datetime.now()
+        self._progress.finish(self._job_status)
+        self._changed()
+
+    def mark_aborted(self):
+        """Mark job as aborted by the operator."""
+        self._job_status = JobStatus.ABORTED
+        self._end_date = datetime.now()
+        self._progress.finish(self._job_status)
+        self._changed()
 
     def mark_error(self, error_str):
         """Mark job as having errored."""
         self._job_status = JobStatus.ERROR
         self._end_date = datetime.now()
         self._error_str = error_str
+        self._progress.finish(self._job_status)
+        self._changed()
+
+    def _changed(self):
+        """Tell the listener the job status or pages changed."""
+        if self._listener is not None:
+            self._listener(self)
 
     def serialize_json(self):
         """Serialize the desanity job in json format."""
         return {
             'guid': self.guid,
             'job_number': self.job_number,
-            'images': self.images,
+            'pages': [page.serialize_json() for page in self.pages],
+            'priority': self.priority,
+            'queued_date': self.queued_date,
             'start_date': self.start_date,
             'end_date': self.end_date,
             'job_status': self.status,
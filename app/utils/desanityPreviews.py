@@ -0,0 +1,136 @@
+###############################################################################
+#  desanityPreviews.py for the desanity microservice                          #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Thumbnail and preview cache for spooled pages.
+
+Derived renderings are generated once per page and size and kept in a
+least recently used cache bounded by the total bytes it holds.
+"""
+# }}}
+
+# libraries {{{
+from io import BytesIO
+from collections import OrderedDict
+from threading import Lock
+from PIL import Image
+# }}}
+
+# desanity previews {{{
+DEFAULT_PREVIEW_SIZES = {
+    'thumbnail': 256,
+    'preview': 1024
+}
+DEFAULT_PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class DesanityPreviewCache():
+    """Byte bounded LRU cache of page thumbnails and previews."""
+
+    MIMETYPE = 'image/jpeg'
+
+    def __init__(self, max_bytes=DEFAULT_PREVIEW_CACHE_BYTES,
+                 sizes=None):
+        """Initialize the cache.
+
+        Keyword arguments:
+        max_bytes -- total size of the cached renderings
+        sizes -- mapping of rendering name to its longest edge in pixels
+        """
+        self._max_bytes = max_bytes
+        self._sizes = dict(sizes or DEFAULT_PREVIEW_SIZES)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = Lock()
+
+    @property
+    def sizes(self):
+        """Return the available rendering sizes."""
+        return dict(self._sizes)
+
+    @property
+    def stats(self):
+        """Return the cache usage counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self._max_bytes,
+                'hits': self._hits,
+                'misses': self._misses
+            }
+
+    def get(self, job, page, size):
+        """Return the encoded rendering of page at the named size.
+
+        raises: KeyError if size is not a configured rendering size.
+        """
+        edge = self._sizes[size]
+        key = (job.guid, page.number, size)
+
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return data
+            self._misses += 1
+
+        data = self._render(page, edge)
+
+        with self._lock:
+            if key not in self._entries and len(data) <= self._max_bytes:
+                self._entries[key] = data
+                self._bytes += len(data)
+                self._evict()
+
+        return data
+
+    def invalidate(self, job_guid):
+        """Drop every rendering of the pages of a job."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == job_guid]:
+                self._bytes -= len(self._entries.pop(key))
+
+    def clear(self):
+        """Drop every cached rendering."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _evict(self):
+        """Evict least recently used renderings, lock must be held."""
+        while self._bytes > self._max_bytes:
+            _, data = self._entries.popitem(last=False)
+            self._bytes -= len(data)
+
+    @staticmethod
+    def _render(page, edge):
+        """Decode page and encode a rendering no larger than edge."""
+        with Image.open(page.path) as img:
+            # let JPEG decode at a reduced scale instead of full size
+            img.draft('RGB', (edge, edge))
+            img.thumbnail((edge, edge))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+
+            buf = BytesIO()
+            img.save(buf, format='JPEG')
+
+        return buf.getvalue()
+# }}}
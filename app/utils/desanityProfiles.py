@@ -0,0 +1,246 @@
+###############################################################################
+#  desanityProfiles.py for the desanity microservice                          #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Named scan profiles.
+
+A profile is a named set of option values for a device, like "invoice
+duplex gray 300dpi", applied as one batch. Profiles are persisted as
+DeviceConfig models in redis and cached in process, a memory store is
+used when redis is not configured.
+"""
+# }}}
+
+# libraries {{{
+import json
+from threading import Lock
+from .desanityExceptions import DesanityUnknownProfile
+# }}}
+
+# desanity profiles {{{
+
+
+class DesanityProfile():
+    """A named set of option values for a device."""
+
+    def __init__(self, name, device_name, options):
+        """Initialize a profile.
+
+        Keyword arguments:
+        name -- name of the profile
+        device_name -- SANE name of the device the profile is for
+        options -- dict of option names to values
+        """
+        self._name = name
+        self._device_name = device_name
+        self._options = dict(options)
+
+    @property
+    def name(self):
+        """Return the name of the profile."""
+        return self._name
+
+    @property
+    def device_name(self):
+        """Return the SANE name of the device the profile is for."""
+        return self._device_name
+
+    @property
+    def options(self):
+        """Return the option values of the profile."""
+        return self._options
+
+    def serialize_json(self):
+        """Return the profile as a json object."""
+        return {
+            'name': self.name,
+            'device_name': self.device_name,
+            'options': self.options
+        }
+
+
+class DesanityMemoryProfileStore():
+    """Profile store kept in process memory."""
+
+    def __init__(self):
+        """Initialize the memory store."""
+        self._profiles = {}
+        self._last_used = {}
+
+    def load(self, device_name):
+        """Return the stored profiles of a device."""
+        return list(self._profiles.get(device_name, {}).values())
+
+    def save(self, profile):
+        """Store a profile, replacing one with the same name."""
+        self._profiles.setdefault(profile.device_name, {})[profile.name] = \
+            profile
+
+    def delete(self, device_name, name):
+        """Remove a stored profile."""
+        self._profiles.get(device_name, {}).pop(name, None)
+
+    def get_last_used(self, device_name):
+        """Return the name of the last profile applied to a device."""
+        return self._last_used.get(device_name)
+
+    def set_last_used(self, device_name, name):
+        """Record the last profile applied to a device."""
+        self._last_used[device_name] = name
+
+
+class DesanityRedisProfileStore():
+    """Profile store persisting profiles as redis DeviceConfig models."""
+
+    LAST_USED_KEY = 'descry:last-profile'
+
+    def __init__(self):
+        """Initialize the redis store.
+
+        redis_om is only imported here so it is only needed when profiles
+        are kept in redis, the connection is taken from REDIS_OM_URL.
+        """
+        # pylint: disable=import-outside-toplevel
+        from redis_om import Migrator
+        from app.models import DeviceConfig, DeviceConfigOption
+
+        self._config = DeviceConfig
+        self._option = DeviceConfigOption
+        Migrator().run()
+
+    def load(self, device_name):
+        """Return the stored profiles of a device."""
+        return [DesanityProfile(config.common_name, config.device_name,
+                                {opt.option_name:
+                                 self._decode(opt.option_value)
+                                 for opt in config.options})
+                for config in self._find(device_name).all()]
+
+    def save(self, profile):
+        """Store a profile, replacing one with the same name."""
+        self.delete(profile.device_name, profile.name)
+        self._config(device_name=profile.device_name,
+                     common_name=profile.name,
+                     options=[self._option(option_name=name,
+                                           option_value=json.dumps(value))
+                              for name, value in profile.options.items()]
+                     ).save()
+
+    def delete(self, device_name, name):
+        """Remove a stored profile."""
+        self._find(device_name, name).delete()
+
+    def get_last_used(self, device_name):
+        """Return the name of the last profile applied to a device."""
+        return self._config.db().hget(self.LAST_USED_KEY, device_name)
+
+    def set_last_used(self, device_name, name):
+        """Record the last profile applied to a device."""
+        self._config.db().hset(self.LAST_USED_KEY, device_name, name)
+
+    @staticmethod
+    def _decode(option_value):
+        """Return an option value stored as json.
+
+        Values stored before they were json encoded are plain strings.
+        """
+        try:
+            return json.loads(option_value)
+        except ValueError:
+            return option_value
+
+    def _find(self, device_name, name=None):
+        """Return a query for the profiles of a device."""
+        query = self._config.device_name == device_name
+        if name is not None:
+            query = query & (self._config.common_name == name)
+        return self._config.find(query)
+
+
+class DesanityProfiles():
+    """Write through cache of the profiles in a profile store."""
+
+    def __init__(self, store=None):
+        """Initialize the profile cache.
+
+        Keyword arguments:
+        store -- profile store, a memory store if not given
+        """
+        self._store = store or DesanityMemoryProfileStore()
+        self._lock = Lock()
+        self._profiles = {}
+        self._last_used = {}
+
+    def list(self, device_name):
+        """Return the profiles of a device."""
+        with self._lock:
+            return list(self._load(device_name).values())
+
+    def get(self, device_name, name):
+        """Return a profile of a device.
+
+        raises: DesanityUnknownProfile
+        """
+        with self._lock:
+            try:
+                return self._load(device_name)[name]
+            except KeyError as ex:
+                raise DesanityUnknownProfile(
+                    f'Unknown profile {name} for device {device_name}') \
+                    from ex
+
+    def save(self, profile):
+        """Store a profile, replacing one with the same name."""
+        with self._lock:
+            self._store.save(profile)
+            self._load(profile.device_name)[profile.name] = profile
+
+    def delete(self, device_name, name):
+        """Remove a profile of a device.
+
+        raises: DesanityUnknownProfile
+        """
+        with self._lock:
+            if self._load(device_name).pop(name, None) is None:
+                raise DesanityUnknownProfile(
+                    f'Unknown profile {name} for device {device_name}')
+            self._store.delete(device_name, name)
+
+    def last_used(self, device_name):
+        """Return the last profile applied to a device, None if unknown."""
+        with self._lock:
+            if device_name not in self._last_used:
+                self._last_used[device_name] = \
+                    self._store.get_last_used(device_name)
+            name = self._last_used[device_name]
+            return self._load(device_name).get(name)
+
+    def mark_used(self, profile):
+        """Record profile as the last one applied to its device."""
+        with self._lock:
+            if self._last_used.get(profile.device_name) != profile.name:
+                self._store.set_last_used(profile.device_name, profile.name)
+                self._last_used[profile.device_name] = profile.name
+
+    def _load(self, device_name):
+        """Return the cached profiles of a device, the lock must be held."""
+        if device_name not in self._profiles:
+            self._profiles[device_name] = {
+                profile.name: profile
+                for profile in self._store.load(device_name)
+            }
+        return self._profiles[device_name]
+# }}}
@@ -0,0 +1,129 @@
+###############################################################################
+#  desanityQueue.py for the desanity microservice                             #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Per device scan queue.
+
+Scans submitted while a device is busy wait in a priority queue instead
+of being turned away. Jobs of the same priority run in the order they
+were submitted.
+"""
+# }}}
+
+# libraries {{{
+import time
+import heapq
+import itertools
+from threading import Lock
+from .desanityJobs import ScanPriority
+# }}}
+
+# desanity queue {{{
+
+
+class DesanityScanQueue():
+    """Priority queue of scanning jobs, FIFO within a priority."""
+
+    def __init__(self):
+        """Initialize the queue."""
+        self._lock = Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._dequeued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def __len__(self):
+        """Return the number of queued jobs."""
+        return len(self._heap)
+
+    def put(self, job, priority=ScanPriority.NORMAL):
+        """Queue a job, returning its position starting at 1."""
+        with self._lock:
+            heapq.heappush(self._heap, (priority, next(self._seq),
+                                        time.monotonic(), job))
+            return self._position(job)
+
+    def pop(self, claim=None):
+        """Return the next job to run, None if the queue is empty.
+
+        Keyword arguments:
+        claim -- called with the job while the queue lock is still held,
+                 so the job is never seen neither queued nor claimed
+        """
+        with self._lock:
+            if not self._heap:
+                return None
+
+            _, _, queued_at, job = heapq.heappop(self._heap)
+            wait = time.monotonic() - queued_at
+            self._dequeued += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            if claim is not None:
+                claim(job)
+            return job
+
+    def remove(self, job):
+        """Remove a queued job, returning whether it was queued."""
+        with self._lock:
+            for idx, entry in enumerate(self._heap):
+                if entry[3] is job:
+                    self._heap.pop(idx)
+                    heapq.heapify(self._heap)
+                    return True
+
+            return False
+
+    def position(self, job):
+        """Return the position of a queued job, None if not queued."""
+        with self._lock:
+            return self._position(job)
+
+    @property
+    def jobs(self):
+        """Return the queued jobs in the order they will run."""
+        with self._lock:
+            return [entry[3] for entry in sorted(self._heap)]
+
+    @property
+    def stats(self):
+        """Return the queue depth and wait times in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'depth': len(self._heap),
+                'priorities': {
+                    priority.name.lower():
+                    sum(1 for entry in self._heap if entry[0] == priority)
+                    for priority in ScanPriority
+                },
+                'oldest_wait': max((now - entry[2] for entry in self._heap),
+                                   default=0.0),
+                'average_wait': self._total_wait / self._dequeued
+                if self._dequeued else 0.0,
+                'max_wait': self._max_wait,
+                'dequeued': self._dequeued
+            }
+
+    def _position(self, job):
+        """Return the position of a queued job, the lock must be held."""
+        for position, entry in enumerate(sorted(self._heap), 1):
+            if entry[3] is job:
+                return position
+
+        return None
+# }}}
@@ -0,0 +1,143 @@
+###############################################################################
+#  desanityRegistry.py for the desanity microservice                          #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Device registry indexed by guid and SANE device name.
+
+Lookups take a shared read lock and hit a dictionary, discovery takes the
+exclusive write lock only for the moment it swaps the indexes.
+"""
+# }}}
+
+# libraries {{{
+from contextlib import contextmanager
+from threading import Condition, Lock
+from .desanityExceptions import DesanityUnknownDev
+# }}}
+
+# desanity registry {{{
+
+
+class ReadWriteLock():
+    """Many readers or a single writer, writers are not starved."""
+
+    def __init__(self):
+        """Initialize the lock."""
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read_locked(self):
+        """Hold the lock shared for the duration of the block."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writer and
+                                not self._writers_waiting)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_locked(self):
+        """Hold the lock exclusively for the duration of the block."""
+        with self._cond:
+            self._writers_waiting += 1
+            self._cond.wait_for(lambda: not self._writer and
+                                self._readers == 0)
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class DesanityRegistry():
+    """Thread safe registry of DesanityDevices."""
+
+    def __init__(self, devices=None):
+        """Initialize the registry with an optional list of devices."""
+        self._lock = ReadWriteLock()
+        self._devices = []
+        self._by_guid = {}
+        self._by_name = {}
+        self._index(devices or [])
+
+    def __len__(self):
+        """Return the number of registered devices."""
+        with self._lock.read_locked():
+            return len(self._devices)
+
+    def __contains__(self, guid):
+        """Return whether a device with guid is registered."""
+        with self._lock.read_locked():
+            return guid in self._by_guid
+
+    @property
+    def devices(self):
+        """Return a snapshot list of the registered devices."""
+        with self._lock.read_locked():
+            return list(self._devices)
+
+    def get_by_guid(self, guid):
+        """Return the device registered under guid."""
+        with self._lock.read_locked():
+            dev = self._by_guid.get(guid)
+
+        if dev is None:
+            raise DesanityUnknownDev(f'Unknown device {guid}')
+
+        return dev
+
+    def get_by_name(self, name):
+        """Return the device registered under its SANE name."""
+        with self._lock.read_locked():
+            dev = self._by_name.get(name)
+
+        if dev is None:
+            raise DesanityUnknownDev(f'Unknown device {name}')
+
+        return dev
+
+    def replace(self, devices):
+        """Atomically replace the registered devices.
+
+        Returns the devices that were registered before the swap.
+        """
+        with self._lock.write_locked():
+            previous = self._devices
+            self._index(devices)
+
+        return previous
+
+    def clear(self):
+        """Remove every device, returning the removed devices."""
+        return self.replace([])
+
+    def _index(self, devices):
+        """Rebuild the lookup indexes, write lock must be held."""
+        self._devices = list(devices)
+        self._by_guid = {dev.guid: dev for dev in self._devices}
+        self._by_name = {dev.name: dev for dev in self._devices}
+# }}}
@@ -0,0 +1,185 @@
+###############################################################################
+#  desanityRetention.py for the desanity microservice                         #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Bounded retention of finished scanning jobs.
+
+Finished jobs are evicted, along with their spooled pages, once a device
+or every device together keeps more than a number of jobs, once they are
+older than a maximum age or once the spooled bytes of a device or of
+every device exceed their budget. Oldest jobs are evicted first and
+running jobs are never touched.
+"""
+# }}}
+
+# libraries {{{
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from .desanityJobs import PENDING_STATUSES
+# }}}
+
+# desanity retention {{{
+DEFAULT_RETENTION_JOBS = 50
+DEFAULT_RETENTION_AGE = 7 * 24 * 60 * 60
+DEFAULT_GC_INTERVAL = 60
+
+
+class DesanityRetention():
+    """Collector evicting finished jobs outside the retention limits."""
+
+    def __init__(self, max_jobs=DEFAULT_RETENTION_JOBS,
+                 max_age=DEFAULT_RETENTION_AGE, max_bytes=None,
+                 max_total_bytes=None, max_total_jobs=None,
+                 interval=DEFAULT_GC_INTERVAL, on_evict=None):
+        """Initialize the collector.
+
+        Keyword arguments:
+        max_jobs -- finished jobs kept per device, None for no limit
+        max_age -- seconds a finished job is kept, None for no limit
+        max_bytes -- spooled bytes kept per device, None for no limit
+        max_total_bytes -- spooled bytes kept over every device, None for
+                           no limit
+        max_total_jobs -- finished jobs kept over every device, None for
+                          no limit
+        interval -- seconds between background collections
+        on_evict -- callable called with each evicted job
+        """
+        self._max_jobs = max_jobs
+        self._max_age = max_age
+        self._max_bytes = max_bytes
+        self._max_total_bytes = max_total_bytes
+        self._max_total_jobs = max_total_jobs
+        self._interval = interval
+        self._on_evict = on_evict
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+        self._runs = 0
+        self._evicted_jobs = 0
+        self._reclaimed_bytes = 0
+        self._last_run = None
+
+    @property
+    def stats(self):
+        """Return the retention limits and what has been reclaimed."""
+        with self._lock:
+            return {
+                'max_jobs': self._max_jobs,
+                'max_age': self._max_age,
+                'max_bytes': self._max_bytes,
+                'max_total_bytes': self._max_total_bytes,
+                'max_total_jobs': self._max_total_jobs,
+                'runs': self._runs,
+                'evicted_jobs': self._evicted_jobs,
+                'reclaimed_bytes': self._reclaimed_bytes,
+                'last_run': self._last_run.isoformat() if self._last_run
+                else None
+            }
+
+    def start(self, devices):
+        """Start collecting in the background.
+
+        Keyword arguments:
+        devices -- callable returning the devices to collect
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, args=(devices,),
+                                  daemon=True, name='desanity-retention')
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background collector."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        self._stopped.set()
+        if thread is not None:
+            thread.join()
+
+    def collect(self, devices):
+        """Evict the jobs outside the retention limits.
+
+        returns: the number of evicted jobs and the bytes reclaimed
+        """
+        now = datetime.now()
+        evicted = []
+        kept = []
+
+        for device in devices:
+            # jobs are held newest first
+            finished = [job for job in device.jobs
+                        if job.status not in PENDING_STATUSES]
+            device_bytes = 0
+
+            for idx, job in enumerate(finished):
+                size = job.spool.size
+                if self._expired(job, idx, now) or \
+                   (self._max_bytes is not None and
+                        device_bytes + size > self._max_bytes):
+                    evicted.append((device, job, size))
+                else:
+                    device_bytes += size
+                    kept.append((device, job, size))
+
+        if self._max_total_bytes is not None or \
+           self._max_total_jobs is not None:
+            kept.sort(key=lambda entry: entry[1].end_date, reverse=True)
+            total_bytes = 0
+            for idx, entry in enumerate(kept):
+                total_bytes += entry[2]
+                if (self._max_total_jobs is not None and
+                        idx >= self._max_total_jobs) or \
+                   (self._max_total_bytes is not None and
+                        total_bytes > self._max_total_bytes):
+                    evicted.append(entry)
+
+        count = 0
+        reclaimed = 0
+        for device, job, size in evicted:
+            if device.evict_job(job):
+                count += 1
+                reclaimed += size
+                if self._on_evict is not None:
+                    self._on_evict(job)
+
+        with self._lock:
+            self._runs += 1
+            self._evicted_jobs += count
+            self._reclaimed_bytes += reclaimed
+            self._last_run = now
+
+        return {
+            'evicted_jobs': count,
+            'reclaimed_bytes': reclaimed
+        }
+
+    def _expired(self, job, idx, now):
+        """Return whether the job is past the count or age limits."""
+        if self._max_jobs is not None and idx >= self._max_jobs:
+            return True
+
+        return self._max_age is not None and job.end_date is not None and \
+            now - job.end_date > timedelta(seconds=self._max_age)
+
+    def _run(self, devices):
+        """Collector loop."""
+        while not self._stopped.wait(self._interval):
+            self.collect(devices())
+# }}}
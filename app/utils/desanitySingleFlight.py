@@ -0,0 +1,99 @@
+###############################################################################
+#  desanitySingleFlight.py for the desanity microservice                      #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Single flight execution of control plane operations.
+
+Concurrent calls for the same key share one in flight execution and its
+result. A successful result can also be reused for a short debounce
+window so bursts of identical requests only hit the backend once.
+"""
+# }}}
+
+# libraries {{{
+import time
+from threading import Event, Lock
+# }}}
+
+# desanity single flight {{{
+
+
+class _Flight():  # pylint: disable=too-few-public-methods
+    """A single execution shared by every caller of a key."""
+
+    def __init__(self):
+        """Initialize the flight."""
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class DesanitySingleFlight():
+    """Collapse concurrent identical calls into one execution."""
+
+    def __init__(self):
+        """Initialize the single flight group."""
+        self._lock = Lock()
+        self._flights = {}
+        self._coalesced = 0
+
+    @property
+    def coalesced(self):
+        """Return how many calls were answered by another execution."""
+        return self._coalesced
+
+    def do(self, key, func, debounce=0):
+        """Run func once for all concurrent callers of key.
+
+        Keyword arguments:
+        key -- identifies calls that may share an execution
+        func -- callable to execute
+        debounce -- seconds a successful result is reused for new calls
+
+        raises: whatever func raised, to every caller sharing the flight
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.finished_at is not None and \
+               (flight.error is not None or
+                    time.monotonic() - flight.finished_at >= debounce):
+                flight = None
+
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._coalesced += 1
+
+        if leader:
+            try:
+                flight.result = func()
+            except Exception as ex:
+                flight.error = ex
+                raise
+            finally:
+                flight.finished_at = time.monotonic()
+                flight.done.set()
+
+            return flight.result
+
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+
+        return flight.result
+# }}}
@@ -0,0 +1,228 @@
+###############################################################################
+#  desanitySpool.py for the desanity microservice                             #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""On disk spool for scanned pages.
+
+Each job gets its own spool directory holding one encoded file per page
+and a small json index describing the pages. Jobs only keep page handles
+around, the pixels are decoded from disk when a consumer asks for them.
+"""
+# }}}
+
+# libraries {{{
+import os
+import json
+import shutil
+import tempfile
+from threading import Lock
+from PIL import Image
+# }}}
+
+# desanity spool {{{
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), 'descry-spool')
+DEFAULT_SPOOL_FORMAT = 'PNG'
+
+SPOOL_FORMATS = {
+    'PNG': ('png', 'image/png'),
+    'JPEG': ('jpg', 'image/jpeg'),
+    'TIFF': ('tiff', 'image/tiff')
+}
+
+
+class DesanityPage():
+    """Handle to a single spooled page."""
+
+    def __init__(self, number, path, fmt, width, height, mode, size):
+        """Initialize a page handle."""
+        self._number = number
+        self._path = path
+        self._format = fmt
+        self._width = width
+        self._height = height
+        self._mode = mode
+        self._size = size
+
+    @property
+    def number(self):
+        """Return the page number within the job, starting at 1."""
+        return self._number
+
+    @property
+    def path(self):
+        """Return the path of the encoded page."""
+        return self._path
+
+    @property
+    def format(self):
+        """Return the encoding format of the page."""
+        return self._format
+
+    @property
+    def mimetype(self):
+        """Return the mimetype of the encoded page."""
+        return SPOOL_FORMATS[self._format][1]
+
+    @property
+    def width(self):
+        """Return the width of the page in pixels."""
+        return self._width
+
+    @property
+    def height(self):
+        """Return the height of the page in pixels."""
+        return self._height
+
+    @property
+    def mode(self):
+        """Return the PIL mode of the page."""
+        return self._mode
+
+    @property
+    def size(self):
+        """Return the size of the encoded page in bytes."""
+        return self._size
+
+    @property
+    def image(self):
+        """Decode and return the page as a PIL image."""
+        with Image.open(self._path) as img:
+            img.load()
+
+        return img
+
+    def open(self):
+        """Return a binary file object for the encoded page."""
+        return open(self._path, 'rb')  # pylint: disable=consider-using-with
+
+    def serialize_json(self):
+        """Return the page as a json object."""
+        return {
+            'number': self.number,
+            'file': os.path.basename(self.path),
+            'format': self.format,
+            'width': self.width,
+            'height': self.height,
+            'mode': self.mode,
+            'size': self.size
+        }
+
+
+class DesanitySpool():
+    """Per job on disk page spool."""
+
+    INDEX = 'index.json'
+
+    def __init__(self, path, fmt=DEFAULT_SPOOL_FORMAT):
+        """Initialize the spool rooted at path."""
+        if fmt not in SPOOL_FORMATS:
+            raise ValueError(f'Unsupported spool format {fmt}')
+
+        self._path = path
+        self._format = fmt
+        self._pages = []
+        self._reserved = 0
+        self._lock = Lock()
+
+    @classmethod
+    def load(cls, path):
+        """Reload a spool from its index on disk."""
+        with open(os.path.join(path, cls.INDEX), encoding='utf-8') as idx_fp:
+            index = json.load(idx_fp)
+
+        spool = cls(path, index['format'])
+        spool._pages = [DesanityPage(page['number'],
+                                     os.path.join(path, page['file']),
+                                     page['format'], page['width'],
+                                     page['height'], page['mode'],
+                                     page['size'])
+                        for page in index['pages']]
+        spool._reserved = max((page.number for page in spool._pages),
+                              default=0)
+        return spool
+
+    @property
+    def path(self):
+        """Return the spool directory."""
+        return self._path
+
+    @property
+    def format(self):
+        """Return the encoding format used for new pages."""
+        return self._format
+
+    @property
+    def pages(self):
+        """Return the page handles in the spool."""
+        return list(self._pages)
+
+    @property
+    def size(self):
+        """Return the number of bytes held by the spooled pages."""
+        return sum(page.size for page in self._pages)
+
+    def reserve(self):
+        """Reserve the next page number, returning it and its file path.
+
+        Pages may be encoded out of band and committed out of order, the
+        reserved number fixes the position of the page within the job.
+        """
+        with self._lock:
+            self._reserved += 1
+            number = self._reserved
+
+        os.makedirs(self._path, exist_ok=True)
+        ext = SPOOL_FORMATS[self._format][0]
+        return number, os.path.join(self._path, f'page-{number:04d}.{ext}')
+
+    def commit(self, number, path, width, height, mode):
+        """Record an encoded page file and return its page handle."""
+        page = DesanityPage(number, path, self._format, width, height, mode,
+                            os.path.getsize(path))
+
+        with self._lock:
+            self._pages.append(page)
+            self._pages.sort(key=lambda spooled: spooled.number)
+            self._write_index()
+
+        return page
+
+    def add_image(self, image):
+        """Encode a PIL image to the spool and return its page handle."""
+        number, page_path = self.reserve()
+        image.save(page_path, format=self._format)
+
+        return self.commit(number, page_path, image.width, image.height,
+                           image.mode)
+
+    def delete(self):
+        """Remove the spool and all of its pages from disk."""
+        shutil.rmtree(self._path, ignore_errors=True)
+        self._pages = []
+
+    def _write_index(self):
+        """Atomically rewrite the spool index."""
+        index = {
+            'format': self._format,
+            'pages': [page.serialize_json() for page in self._pages]
+        }
+        tmp_path = os.path.join(self._path, f'.{self.INDEX}.tmp')
+
+        with open(tmp_path, encoding='utf-8', mode='w') as idx_fp:
+            json.dump(index, idx_fp)
+
+        os.replace(tmp_path, os.path.join(self._path, self.INDEX))
+# }}}
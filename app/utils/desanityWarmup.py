@@ -0,0 +1,166 @@
+###############################################################################
+#  desanityWarmup.py for the desanity microservice                            #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Boot time warm up of configured devices.
+
+Opening a network device can take seconds, so the configured devices are
+opened at boot, all at once, and their options and parameters read ahead
+of the first scan. Each device reports how long every stage took.
+"""
+# }}}
+
+# libraries {{{
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock, Thread
+# }}}
+
+# desanity warmup {{{
+DEFAULT_WARMUP_WORKERS = 4
+
+
+class DesanityWarmup():
+    """Opens a set of devices concurrently and times each stage."""
+
+    def __init__(self, enable, wanted=None, workers=DEFAULT_WARMUP_WORKERS):
+        """Initialize the warm up.
+
+        Keyword arguments:
+        enable -- callable opening a device
+        wanted -- SANE names or guids of the devices to warm up, '*' for
+                  every device
+        workers -- devices warmed up at once
+        """
+        self._enable = enable
+        self._wanted = list(wanted or [])
+        self._workers = workers
+        self._lock = Lock()
+        self._thread = None
+        self._report = {}
+        self._started_at = None
+        self._finished_at = None
+        self._error = None
+
+    @property
+    def wanted(self):
+        """Return the names or guids of the devices to warm up."""
+        return list(self._wanted)
+
+    def serialize_json(self):
+        """Return the per device warm up timings as a json object."""
+        with self._lock:
+            return {
+                'started_at': self._started_at.isoformat()
+                if self._started_at else None,
+                'finished_at': self._finished_at.isoformat()
+                if self._finished_at else None,
+                'devices': [dict(entry) for entry in self._report.values()],
+                'error': self._error
+            }
+
+    def start(self, devices):
+        """Warm up in the background.
+
+        Keyword arguments:
+        devices -- callable returning the known devices
+        """
+        with self._lock:
+            if self._thread is not None or not self._wanted:
+                return
+
+            self._thread = Thread(target=self._run, args=(devices,),
+                                  daemon=True, name='desanity-warmup')
+            self._thread.start()
+
+    def join(self, timeout=None):
+        """Wait for a background warm up to finish."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def run(self, devices):
+        """Warm up the wanted devices concurrently.
+
+        returns: the per device timings
+        """
+        selected = [dev for dev in devices if self._selected(dev)]
+        with self._lock:
+            self._started_at = datetime.now()
+            self._finished_at = None
+            self._report = {dev.guid: {'device': dev.name, 'guid': dev.guid,
+                                       'status': 'pending'}
+                            for dev in selected}
+
+        if selected:
+            with ThreadPoolExecutor(max_workers=self._workers,
+                                    thread_name_prefix='desanity-warmup') \
+                    as pool:
+                list(pool.map(self._warm, selected))
+
+        with self._lock:
+            self._finished_at = datetime.now()
+
+        return self.serialize_json()['devices']
+
+    def _run(self, devices):
+        """Background warm up."""
+        try:
+            self.run(devices())
+        except Exception as ex:  # pylint: disable=broad-except
+            # discovery failed, there is nothing to warm up
+            with self._lock:
+                self._error = str(ex) or type(ex).__name__
+                if self._started_at is not None:
+                    self._finished_at = datetime.now()
+
+    def _selected(self, dev):
+        """Return whether a device is to be warmed up."""
+        return '*' in self._wanted or dev.name in self._wanted or \
+            dev.guid in self._wanted
+
+    def _warm(self, dev):
+        """Open a device and read its options and parameters."""
+        timings = {}
+        status = 'ready'
+        error = None
+        began = time.monotonic()
+
+        try:
+            if not dev.enabled:
+                self._stage(timings, 'open', self._enable, dev)
+            self._stage(timings, 'options', lambda: dev.options)
+            self._stage(timings, 'parameters', lambda: dev.parameters)
+        except Exception as ex:  # pylint: disable=broad-except
+            # python-sane errors reading an option are not wrapped
+            status = 'error'
+            error = str(ex) or type(ex).__name__
+
+        timings['total'] = time.monotonic() - began
+        with self._lock:
+            self._report[dev.guid].update(status=status, error=error,
+                                          timings=timings)
+
+    @staticmethod
+    def _stage(timings, name, func, *args):
+        """Run a warm up stage, recording its duration in seconds."""
+        began = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            timings[name] = time.monotonic() - began
+# }}}
@@ -0,0 +1,130 @@
+###############################################################################
+#  desanityWorker.py for the desanity microservice                            #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Per device command worker.
+
+SANE handles are not thread safe. Each enabled device is owned by one
+long lived thread running the device commands, option reads and writes,
+parameters and scans, one at a time in the order they were submitted.
+Commands issued from the worker itself run inline. The thread starts
+with the first command and runs until the device is closed.
+"""
+# }}}
+
+# libraries {{{
+from concurrent.futures import Future
+from queue import SimpleQueue
+from threading import Lock, Thread, get_ident
+# }}}
+
+# desanity worker {{{
+
+
+class DesanityDeviceWorker():
+    """Thread running the commands of a device in order."""
+
+    def __init__(self, name):
+        """Initialize the worker.
+
+        Keyword arguments:
+        name -- name of the worker thread
+        """
+        self._name = name
+        self._lock = Lock()
+        self._commands = SimpleQueue()
+        self._thread = None
+        self._ident = None
+        self._executed = 0
+
+    @property
+    def running(self):
+        """Return whether the worker thread is running."""
+        return self._thread is not None
+
+    @property
+    def stats(self):
+        """Return the pending and executed command counts."""
+        return {
+            'running': self.running,
+            'pending': self._commands.qsize(),
+            'executed': self._executed
+        }
+
+    def start(self):
+        """Start the worker thread unless it is running."""
+        with self._lock:
+            self._start()
+
+    def stop(self):
+        """Stop the worker once the commands already submitted have run."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._commands.put(None)
+
+        if thread.ident != get_ident():
+            thread.join()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a command, returning the Future of its result."""
+        future = Future()
+        with self._lock:
+            self._start()
+            self._commands.put((future, func, args, kwargs))
+
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Run a command on the worker and return its result.
+
+        raises: whatever the command raised
+        """
+        if self._ident == get_ident():
+            return func(*args, **kwargs)
+
+        return self.submit(func, *args, **kwargs).result()
+
+    def _start(self):
+        """Start the worker thread if needed, the lock must be held."""
+        if self._thread is not None:
+            return
+
+        self._commands = SimpleQueue()
+        self._thread = Thread(target=self._run, args=(self._commands,),
+                              daemon=True, name=self._name)
+        self._thread.start()
+
+    def _run(self, commands):
+        """Run commands until stopped."""
+        self._ident = get_ident()
+        while True:
+            command = commands.get()
+            if command is None:
+                return
+
+            future, func, args, kwargs = command
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as ex:  # pylint: disable=broad-except
+                future.set_exception(ex)
+            finally:
+                self._executed += 1
+# }}}
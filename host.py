@@ -0,0 +1,55 @@
+###############################################################################
+#  host.py for archivist descry microservices                                 #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Module DocString ## {{{
+"""Entry point for the descry device host process.
+
+Owns the SANE handles and serves them to the API workers configured with
+the same DEVICE_HOST address.
+"""
+# }}}
+
+
+# host # {{{
+import os
+from flask import Config
+from app import Configs
+from app.utils import desanity
+from app.utils.desanityHost import DesanityHost, DEFAULT_HOST_ADDRESS
+
+if __name__ == "__main__":
+    configType = os.environ.get('APPCONFIG') or "DEV"
+    config = Config(os.getcwd())
+    try:
+        config.from_object(Configs[configType])
+    except KeyError:
+        print(f"Unknown configuration type {configType}")
+
+    # the host runs SANE itself rather than forwarding to a host
+    address = config.pop('DEVICE_HOST', None) or DEFAULT_HOST_ADDRESS
+    desanity.configure(config)
+    if config.get('DISCOVERY_BACKGROUND'):
+        desanity.start_discovery()
+    desanity.start_warmup()
+    desanity.start_handle_pool()
+    desanity.start_health()
+    if config.get('JOB_GC_BACKGROUND'):
+        desanity.start_retention()
+
+    DesanityHost(desanity, address,
+                 config.get('DEVICE_HOST_AUTHKEY')).serve_forever()
+
+# }}}
@@ -19,6 +19,7 @@
 # }}}
 
 # Libraries {{{
+import sane
 from PIL import Image
 # }}}
 
@@ -144,6 +145,12 @@ class MockBrotherDev():
                                                  4, None, None)
     }
 
+    def __init__(self, pages=3):
+        """Initialize the mock device with pages loaded in the feeder."""
+        self._pages = pages
+        self._cur_page = 0
+        self._cancelled = False
+
     def __getitem__(self, item):
         """Return property."""
         # attr = next(filter(lambda x: x[1] == item, brother_options), None)
@@ -177,6 +184,35 @@ class MockBrotherDev():
         """Mock multi scan method."""
         return MockBrotherIterator()
 
+    def start(self):
+        """Mock start of a page acquisition."""
+        if self._cur_page >= self._pages:
+            raise sane._sane.error('Document feeder out of documents')
+
+        self._cur_page += 1
+        self._cancelled = False
+
+    def snap(self, no_cancel=False, progress=None):
+        """Mock read loop, reporting progress every scanline."""
+        # pylint: disable=unused-argument
+        with Image.open(f"tests/data/lorem{self._cur_page}.png") as img:
+            img.load()
+
+        for line in range(1, img.height + 1):
+            if self._cancelled:
+                raise sane._sane.error('Operation was cancelled')
+            if progress is not None:
+                progress(line, img.height)
+
+        return img
+
+    def cancel(self):
+        """Mock cancel of the current acquisition."""
+        self._cancelled = True
+
+    def close(self):
+        """Mock close of the device handle."""
+
     # def __setattr__(self, name, value):
     #     """Mock set sane device option."""
     #     idx = list(map(lambda opt: opt[2], brother_options)).index(name)
@@ -195,6 +231,28 @@ class MockBrotherDev():
     #         raise SaneError('Value not in range')
 
 
+class MockBrotherReloadDev(MockBrotherDev):
+    """A mocked dev where setting the source reloads the options."""
+
+    def __setattr__(self, name, value):
+        """Set an option, rebuilding the options like python-sane does."""
+        if name == 'source':
+            # the flatbed only geometry goes away when feeding from the ADF
+            self.__dict__['_opt'] = {key: opt for key, opt
+                                     in self._opt.items() if key != 'br_y'}
+        self.__dict__[name] = value
+
+
+class MockBrotherReadOnlyDev(MockBrotherDev):
+    """A mocked dev where the mode can not be set by software."""
+
+    def __setattr__(self, name, value):
+        """Set an option, refusing the mode like python-sane does."""
+        if name == 'mode':
+            raise AttributeError("option can't be set by software: mode")
+        self.__dict__[name] = value
+
+
 class MockBrotherIterator():
     """Mock Iterator for ADF Scans."""
 
@@ -214,6 +272,7 @@ class MockBrotherIterator():
         with Image.open(f"tests/data/lorem{self._cur_page}.png") as img:
             img.load()
 
+        self._cur_page += 1
         return img
 
 
@@ -0,0 +1,69 @@
+###############################################################################
+#  test_app_startup.py for archivist descry microservice unit tests           #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Startup tests for the descry application, run in fresh interpreters."""
+# }}}
+
+# Libraries {{{
+import subprocess
+import sys
+# }}}
+
+# startup tests {{{
+STARTUP = """
+import sys
+import sane
+sane.init = lambda: sys.exit('sane.init called')
+from app import create_app, Configs
+app = create_app(Configs['TESTING']())
+"""
+
+
+def run_fresh(code):
+    """Run code in a fresh interpreter, returning the completed process."""
+    return subprocess.run([sys.executable, '-c', code], capture_output=True,
+                          text=True, check=False)
+
+
+def test_startup_is_lazy():
+    """
+    GIVEN a fresh interpreter
+    WHEN the application is imported and created
+    SHOULD not initialize SANE
+    SHOULD not import the optional docs and spec dependencies
+    """
+    proc = run_fresh(STARTUP + """
+assert 'flask_swagger_ui' not in sys.modules, 'flask_swagger_ui imported'
+assert 'yaml' not in sys.modules, 'yaml imported'
+""")
+
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_sane_initialized_on_first_access():
+    """
+    GIVEN a freshly created application
+    WHEN the devices are first listed
+    SHOULD initialize SANE
+    """
+    proc = run_fresh(STARTUP + """
+app.test_client().get('/api/v1/devices')
+""")
+
+    assert 'sane.init called' in proc.stderr
+
+# }}}
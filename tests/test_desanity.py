@@ -23,6 +23,9 @@ import sane
 from app.utils import DesanityDevice
 from app.utils.desanityExceptions import DesanitySaneException
 from app.utils.desanityExceptions import DesanityUnknownDev
+from app.utils.desanityExceptions import DesanityNoCompatibleDevice
+from app.utils.desanityRegistry import DesanityRegistry
+from tests.mocks.mockBrother import MockBrotherDev
 SaneError = sane._sane.error
 # from app.utils import desanity, DesanityUnknownDev
 # from .config import sane_devices
@@ -85,7 +88,7 @@ def test_refresh_devices(mock_sane_get_devices):
     """
     GIVEN an initialized desanity object
     WHEN get_devices is called
-    SHOULD see delete_devices is called
+    SHOULD not delete the existing devices
     SHOULD see that devices property is set with the appropriate objects
     """
     mock_sane_get_devices.return_value = mock_sane_devices
@@ -94,12 +97,79 @@ def test_refresh_devices(mock_sane_get_devices):
     desanity._delete_devices = mock.Mock()
 
     devs = desanity.refresh_devices()
-    desanity._delete_devices.assert_called_once()
+    desanity._delete_devices.assert_not_called()
+    del desanity._delete_devices
     assert isinstance(devs, list)
     assert len(devs) == 3
     assert all(map(lambda it: isinstance(it, DesanityDevice), devs))
 
 
+@mock.patch.object(sane, "get_devices")
+def test_refresh_devices_diff(mock_sane_get_devices):
+    """
+    GIVEN an initialized desanity object with discovered devices
+    WHEN get_devices reports one device removed and one added
+    SHOULD keep the unchanged devices and their state
+    SHOULD keep the removed device for DISCOVERY_MISSES refreshes
+    SHOULD then close the removed device
+    SHOULD derive the same guid for the same device
+    """
+    from app.utils import desanity
+
+    desanity.initialize()
+    mock_sane_get_devices.return_value = mock_sane_devices
+    brother, camera, airscan = desanity.refresh_devices()
+    camera._sane_device = mock.Mock()
+
+    new_device = ('epson2:net:172.17.1.30', 'Epson', 'WF-3640',
+                  'flatbed scanner')
+    mock_sane_get_devices.return_value = [mock_sane_devices[0],
+                                          mock_sane_devices[2], new_device]
+    devs = desanity.refresh_devices()
+
+    assert devs[0] is brother
+    assert devs[1] is airscan
+    assert devs[2].name == new_device[0]
+    assert devs[3] is camera
+    assert camera.enabled is True
+
+    devs = desanity.refresh_devices()
+
+    assert camera not in devs
+    assert camera.enabled is False
+    assert DesanityDevice(*mock_sane_devices[0]).guid == brother.guid
+
+
+@mock.patch.object(sane, "get_devices")
+def test_refresh_devices_missing_busy(mock_sane_get_devices):
+    """
+    GIVEN an initialized desanity object with a device running a job
+    WHEN get_devices stops reporting the device
+    SHOULD keep the device open while it has jobs
+    SHOULD close it on the next refresh once it is idle
+    """
+    from app.utils import desanity
+
+    desanity.initialize()
+    mock_sane_get_devices.return_value = mock_sane_devices
+    _, camera, _ = desanity.refresh_devices()
+    camera._sane_device = mock.Mock()
+
+    mock_sane_get_devices.return_value = [mock_sane_devices[0]]
+    with mock.patch.object(DesanityDevice, "load",
+                           new_callable=mock.PropertyMock, return_value=1):
+        for _ in range(3):
+            devs = desanity.refresh_devices()
+
+    assert camera in devs
+    assert camera.enabled is True
+
+    devs = desanity.refresh_devices()
+
+    assert camera not in devs
+    assert camera.enabled is False
+
+
 @mock.patch.object(sane, "get_devices")
 def test_refresh_devices_sane_error(mock_sane_get_devices):
     """
@@ -162,3 +232,92 @@ def test_refresh_unknown_device(mock_sane_get_devices):
         error_found = True
 
     assert error_found
+
+
+@mock.patch.object(sane, "open")
+def test_dispatch_scan(mock_sane_open, tmp_path):
+    """
+    GIVEN a pool of enabled and disabled devices
+    WHEN a scan is dispatched with required capabilities
+    SHOULD queue it on the least loaded compatible device
+    SHOULD set the required options for the job
+    """
+    from app.utils import desanity
+
+    mock_sane_open.side_effect = lambda name: MockBrotherDev()
+    busy, idle, disabled = [DesanityDevice(f"brother4:net1;dev{idx}",
+                                           "Brother", "*MFC-L2700DW",
+                                           "BROTHER_MFC-L2700DW_series",
+                                           str(tmp_path))
+                            for idx in range(3)]
+    busy.enable()
+    idle.enable()
+
+    requirements = {'source': 'ADF', 'resolution': 300}
+    with mock.patch.object(desanity, "_registry",
+                           DesanityRegistry([busy, idle, disabled])), \
+            mock.patch.object(DesanityDevice, "_dispatch"):
+        busy.scan()
+        dev, job, position = desanity.dispatch_scan(requirements)
+
+    assert dev is idle
+    assert position == 1
+    assert job.options == requirements
+
+
+@mock.patch.object(sane, "open")
+def test_dispatch_scan_cold_cache(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled device whose options are not loaded yet
+    WHEN a scan is dispatched
+    SHOULD load the options before taking the dispatch lock
+    SHOULD not report support while the options are not loaded
+    """
+    from app.utils import desanity
+
+    mock_sane_open.side_effect = lambda name: MockBrotherDev()
+    dev = DesanityDevice("brother4:net1;dev0", "Brother", "*MFC-L2700DW",
+                         "BROTHER_MFC-L2700DW_series", str(tmp_path))
+    dev.enable()
+    dev._invalidate_options()
+    assert not dev.supports({'resolution': 300})
+
+    loads = []
+    load_options = dev._locked_load_options
+
+    def locked_load_options():
+        loads.append(desanity._dispatch_lock.locked())
+        return load_options()
+
+    with mock.patch.object(desanity, "_registry", DesanityRegistry([dev])), \
+            mock.patch.object(dev, "_locked_load_options",
+                              side_effect=locked_load_options), \
+            mock.patch.object(DesanityDevice, "_dispatch"):
+        chosen, _, _ = desanity.dispatch_scan({'resolution': 300})
+
+    assert chosen is dev
+    assert loads == [False]
+
+
+@mock.patch.object(sane, "open")
+def test_dispatch_scan_incompatible(mock_sane_open, tmp_path):
+    """
+    GIVEN a pool of enabled devices
+    WHEN no device supports the required capabilities
+    SHOULD raise a DesanityNoCompatibleDevice
+    """
+    from app.utils import desanity
+
+    mock_sane_open.return_value = MockBrotherDev()
+    dev = DesanityDevice("brother4:net1;dev0", "Brother", "*MFC-L2700DW",
+                         "BROTHER_MFC-L2700DW_series", str(tmp_path))
+    dev.enable()
+
+    with mock.patch.object(desanity, "_registry", DesanityRegistry([dev])):
+        error_found = False
+        try:
+            desanity.dispatch_scan({'resolution': 1200})
+        except DesanityNoCompatibleDevice:
+            error_found = True
+
+    assert error_found
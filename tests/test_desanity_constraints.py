@@ -0,0 +1,129 @@
+###############################################################################
+#  test_desanity_constraints.py for archivist descry microservice unit tests  #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for desanity option constraint validation."""
+# }}}
+
+# Libraries {{{
+import pytest
+from app.utils.desanityExceptions import DesanityOptionInvalidValue
+from app.utils.desanityConstraints import compile_validator
+from app.utils.desanityConstraints import TYPE_BOOL, TYPE_INT, TYPE_FIXED
+from app.utils.desanityConstraints import TYPE_STRING
+# }}}
+
+# desanityConstraints unit tests {{{
+
+
+def test_range_quantized():
+    """
+    GIVEN a validator compiled from a stepped range
+    WHEN a value inside the range is validated
+    SHOULD return the value converted and quantized to the step
+    """
+    validator = compile_validator('brightness', {
+        'type': TYPE_INT,
+        'constraints': {'min': -100, 'max': 100, 'step': 5}
+    })
+
+    assert validator('12') == 10
+    assert validator(13) == 15
+    assert validator(100) == 100
+
+
+def test_range_rejected():
+    """
+    GIVEN a validator compiled from a range
+    WHEN a value outside the range or of the wrong type is validated
+    SHOULD raise a DesanityOptionInvalidValue
+    """
+    validator = compile_validator('tl_x', {
+        'type': TYPE_FIXED,
+        'constraints': {'min': 0.0, 'max': 215.9, 'step': 0.0}
+    })
+
+    assert validator('10.5') == 10.5
+
+    with pytest.raises(DesanityOptionInvalidValue):
+        validator(300)
+
+    with pytest.raises(DesanityOptionInvalidValue):
+        validator('wide')
+
+
+def test_list_membership():
+    """
+    GIVEN validators compiled from word and value lists
+    WHEN values are validated
+    SHOULD accept listed values converted to the list type
+    SHOULD reject values not in the list
+    """
+    mode = compile_validator('mode', {
+        'type': TYPE_STRING,
+        'constraints': ['Color', 'Gray']
+    })
+    resolution = compile_validator('resolution', {
+        'type': TYPE_INT,
+        'constraints': [100, 200, 300]
+    })
+
+    assert mode('Gray') == 'Gray'
+    assert resolution('200') == 200
+
+    with pytest.raises(DesanityOptionInvalidValue):
+        mode('Lineart')
+
+    with pytest.raises(DesanityOptionInvalidValue):
+        resolution(150)
+
+
+def test_int_not_truncated():
+    """
+    GIVEN a validator compiled from an int option
+    WHEN a string holding a fractional number is validated
+    SHOULD reject it instead of truncating it
+    SHOULD accept strings of integral numbers
+    """
+    resolution = compile_validator('resolution', {
+        'type': TYPE_INT,
+        'constraints': [100, 200, 300]
+    })
+
+    assert resolution('300.0') == 300
+
+    with pytest.raises(DesanityOptionInvalidValue):
+        resolution('300.7')
+
+
+def test_bool():
+    """
+    GIVEN a validator compiled from a bool option
+    WHEN values are validated
+    SHOULD accept common spellings of true and false
+    """
+    validator = compile_validator('negative', {
+        'type': TYPE_BOOL,
+        'constraints': None
+    })
+
+    assert validator('true') is True
+    assert validator('0') is False
+
+    with pytest.raises(DesanityOptionInvalidValue):
+        validator('maybe')
+
+# }}}
@@ -19,13 +19,19 @@
 # }}}
 
 # Libraries {{{
+import threading
+from concurrent.futures import Future
 from unittest import mock
+import pytest
 from collections import UserDict
 import sane
-from tests.mocks.mockBrother import MockBrotherDev
-from app.utils import DesanityDevice, DevStatus
+from tests.mocks.mockBrother import MockBrotherDev, MockBrotherReloadDev
+from tests.mocks.mockBrother import MockBrotherReadOnlyDev
+from app.utils import DesanityDevice, DevStatus, JobStatus, ScanPriority
 from app.utils.desanityExceptions import DesanitySaneException
 from app.utils.desanityExceptions import DesanityDeviceNotEnabled
+from app.utils.desanityExceptions import DesanityOptionInvalidValue
+from app.utils.desanityExceptions import DesanityOptionUnsettable
 
 SaneError = sane._sane.error
 # }}}
@@ -194,6 +200,406 @@ def test_get_options(mock_sane_open):
     assert len(options.keys()) == 15
     assert dev.option
 
+
+@mock.patch.object(sane, "open")
+def test_options_cached(mock_sane_open):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN the options are read more than once
+    SHOULD only read them from the SANE handle once
+    SHOULD only read back the option that was set
+    SHOULD read them all again after the device is reopened
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    mock_sane_open.return_value = MockBrotherDev()
+
+    dev.enable()
+    with mock.patch.object(dev, "_parse_option",
+                           wraps=dev._parse_option) as parse_option:
+        first = dev.options
+        assert dev.options is first
+        parse_option_calls = parse_option.call_count
+
+        dev.set_option('resolution', 200)
+        assert dev.options is not first
+        assert dev.options['resolution']['value'] == 200
+        assert parse_option.call_count == parse_option_calls + 1
+
+        dev.enable()
+        dev.options
+        assert parse_option.call_count == 2 * parse_option_calls + 1
+
+
+@mock.patch.object(sane, "open")
+def test_set_option_delta(mock_sane_open):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN an option is set without SANE reloading the options
+    SHOULD return a versioned delta holding only that option
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    mock_sane_open.return_value = MockBrotherDev()
+
+    dev.enable()
+    version = dev.options_version
+    delta = dev.set_option('resolution', 200)
+
+    assert delta['base_version'] == version
+    assert delta['version'] == version + 1
+    assert list(delta['changed']) == ['resolution']
+    assert delta['removed'] == []
+
+
+@mock.patch.object(sane, "open")
+def test_set_option_reload(mock_sane_open):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN an option is set and SANE reloads the options
+    SHOULD report options that changed or became inactive
+    SHOULD leave unaffected options out of the delta
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    mock_sane_open.return_value = MockBrotherReloadDev()
+
+    dev.enable()
+    assert 'br_y' in dev.options
+    delta = dev.set_option('source', 'ADF')
+
+    assert sorted(delta['changed']) == ['source']
+    assert delta['removed'] == ['br_y']
+    assert 'br_y' not in dev.options
+
+
+@mock.patch.object(sane, "open")
+def test_set_options_batch(mock_sane_open):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN a batch of options is set
+    SHOULD write options that reload the others first
+    SHOULD report failing options without stopping the batch
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    mock_sane_open.return_value = MockBrotherReloadDev()
+
+    dev.enable()
+    with mock.patch.object(dev, "_write_option",
+                           wraps=dev._write_option) as write_option:
+        delta = dev.set_options({'brightness': 10.0, 'gamma': 2.0,
+                                 'source': 'ADF'})
+
+    assert [call.args[0] for call in write_option.call_args_list] == \
+        ['source', 'brightness', 'gamma']
+    assert sorted(delta['changed']) == ['brightness', 'source']
+    assert delta['removed'] == ['br_y']
+    assert list(delta['errors']) == ['gamma']
+
+
+@mock.patch.object(sane, "open")
+def test_set_option_read_only(mock_sane_open):
+    """
+    GIVEN an enabled DesanityDevice with a read only option
+    WHEN the read only option is set alone or in a batch
+    SHOULD raise a DesanityOptionUnsettable for the single option
+    SHOULD report it in the batch errors and still set the others
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    mock_sane_open.return_value = MockBrotherReadOnlyDev()
+
+    dev.enable()
+    with pytest.raises(DesanityOptionUnsettable):
+        dev.set_option('mode', 'Gray')
+
+    delta = dev.set_options({'mode': 'Gray', 'resolution': 200})
+
+    assert list(delta['errors']) == ['mode']
+    assert list(delta['changed']) == ['resolution']
+    assert dev.options['resolution']['value'] == 200
+
+
+@mock.patch.object(sane, "open")
+def test_set_option_invalid(mock_sane_open):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN an option is set to a value outside its constraints
+    SHOULD raise a DesanityOptionInvalidValue without writing to the device
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    sane_dev = MockBrotherDev()
+    mock_sane_open.return_value = sane_dev
+
+    dev.enable()
+    with pytest.raises(DesanityOptionInvalidValue):
+        dev.set_option('resolution', 150)
+
+    assert 'resolution' not in vars(sane_dev)
+
+
+@mock.patch.object(sane, "open")
+def test_scan_spools_pages(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN a scan runs
+    SHOULD spool each page to disk
+    SHOULD mark the job complete
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev()
+
+    dev.enable()
+    job = dev._get_next_job()
+    dev._start_scan(job)
+
+    assert len(job.pages) == 3
+    assert job.spool.path.startswith(str(tmp_path))
+    assert job.status == JobStatus.COMPLETED
+
+
+@mock.patch.object(sane, "open")
+def test_scan_reports_progress(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN a scan runs
+    SHOULD report scanlines read for each page on the job progress
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev(pages=1)
+
+    dev.enable()
+    job = dev._get_next_job()
+    dev._start_scan(job)
+
+    progress = job.progress.serialize_json()
+    assert progress['page'] == 1
+    assert progress['pages'] == 1
+    assert progress['lines'] == progress['total_lines']
+    assert progress['status'] == JobStatus.COMPLETED
+
+
+@mock.patch.object(sane, "open")
+def test_scan_error_waits_for_pages(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice with a page still encoding
+    WHEN the acquisition of the next page fails
+    SHOULD wait for the page in flight before failing the job
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev()
+    dev.enable()
+    job = dev._get_next_job()
+
+    encoding = Future()
+
+    def acquire(job):
+        yield mock.Mock()
+        threading.Timer(0.2, encoding.set_result, (None,)).start()
+        raise SaneError('Error during device I/O')
+
+    with mock.patch.object(dev, "_acquire", side_effect=acquire), \
+            mock.patch.object(dev._encoder, "submit",
+                              return_value=encoding):
+        with pytest.raises(SaneError):
+            dev._start_scan(job)
+
+    assert encoding.done()
+    assert job.status == JobStatus.ERROR
+
+
+@mock.patch.object(sane, "open")
+def test_scan_abort(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN a scan is aborted mid page
+    SHOULD cancel the acquisition
+    SHOULD mark the job aborted
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev()
+
+    dev.enable()
+    job = dev._get_next_job()
+    update = job.progress.update
+
+    def abort_midway(lines, total_lines):
+        update(lines, total_lines)
+        if lines == total_lines // 2:
+            job.abort()
+
+    job.progress.update = abort_midway
+    dev._start_scan(job)
+
+    assert job.status == JobStatus.ABORTED
+    assert len(job.pages) == 0
+
+
+@mock.patch.object(sane, "open")
+def test_scan_queued(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN scans are submitted while the device is busy
+    SHOULD queue them instead of refusing them
+    SHOULD run them back to back, highest priority first
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.side_effect = lambda name: MockBrotherDev(pages=1)
+    dev.enable()
+
+    started = []
+    with mock.patch.object(dev, "_dispatch"):
+        first, position = dev.scan()
+        assert position == 1
+        low, _ = dev.scan(ScanPriority.LOW)
+        urgent, position = dev.scan(ScanPriority.HIGH)
+        assert position == 1
+        assert dev.queue_stats['depth'] == 3
+
+    with mock.patch.object(dev, "_start_scan",
+                           side_effect=lambda job: started.append(job)):
+        for _ in range(3):
+            dev._run_next()
+
+    assert started == [urgent, first, low]
+    assert dev.queue_stats['depth'] == 0
+
+
+@mock.patch.object(sane, "open")
+def test_abort_queued_job(mock_sane_open, tmp_path):
+    """
+    GIVEN a DesanityDevice with a queued job
+    WHEN the queued job is aborted
+    SHOULD remove it from the queue and mark it aborted
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev()
+    dev.enable()
+
+    with mock.patch.object(dev, "_dispatch"):
+        job, _ = dev.scan()
+        assert job.status == JobStatus.QUEUED
+        dev.abort_job(job.guid)
+
+    assert job.status == JobStatus.ABORTED
+    assert dev.queue_position(job) is None
+
+
+@mock.patch.object(sane, "open")
+def test_disable_aborts_queue(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice with a running scan and queued scans
+    WHEN the device is disabled
+    SHOULD abort the queued scans instead of running them
+    SHOULD abort the running scan and close the device
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev(pages=3)
+    dev.enable()
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def acquire(job):
+        started.set()
+        release.wait()
+        yield from ()
+
+    with mock.patch.object(dev, "_acquire", side_effect=acquire):
+        running, _ = dev.scan()
+        queued = [dev.scan()[0] for _ in range(3)]
+        started.wait()
+        # the running scan notices the abort between pages
+        threading.Timer(0.1, release.set).start()
+        dev.disable()
+
+    assert running.status == JobStatus.ABORTED
+    assert all(job.status == JobStatus.ABORTED for job in queued)
+    assert not dev.enabled
+
+
+@mock.patch.object(sane, "open")
+def test_disable_aborts_claimed_job(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice whose next job left the queue
+    WHEN the device is disabled before the job starts scanning
+    SHOULD abort the job instead of starting it
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev()
+    dev.enable()
+
+    with mock.patch.object(dev, "_dispatch"):
+        job, _ = dev.scan()
+
+    use_handle = dev._use_handle
+
+    def disable_first():
+        dev.disable()
+        return use_handle()
+
+    with mock.patch.object(dev, "_use_handle", side_effect=disable_first), \
+            mock.patch.object(dev, "_start_scan") as start_scan:
+        dev._run_next()
+
+    start_scan.assert_not_called()
+    assert job.status == JobStatus.ABORTED
+
+
+@mock.patch.object(sane, "open")
+def test_scan_options_error(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN writing the options of a queued scan fails unexpectedly
+    SHOULD mark the job as errored instead of leaving it queued
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev(pages=1)
+    dev.enable()
+
+    with mock.patch.object(dev, "_write_options",
+                           side_effect=RuntimeError('handle lost')):
+        job, _ = dev.scan(options={'resolution': 200})
+        dev.worker.call(lambda: None)
+
+    assert job.status == JobStatus.ERROR
+    assert job.error_str == 'handle lost'
+
+
+@mock.patch.object(sane, "open")
+def test_worker_serializes_calls(mock_sane_open, tmp_path):
+    """
+    GIVEN an enabled DesanityDevice
+    WHEN an option is set while scans are queued
+    SHOULD run the option write after the scans on the device worker
+    SHOULD not start a thread per scan
+    """
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    mock_sane_open.return_value = MockBrotherDev(pages=1)
+    dev.enable()
+    threads = threading.active_count()
+
+    release = threading.Event()
+    dev.worker.submit(release.wait)
+    first, _ = dev.scan()
+    second, _ = dev.scan()
+    setter = threading.Thread(target=dev.set_option,
+                              args=('resolution', 200))
+    setter.start()
+    assert threading.active_count() == threads + 1
+
+    release.set()
+    setter.join()
+
+    assert first.status == JobStatus.COMPLETED
+    assert second.status == JobStatus.COMPLETED
+    assert dev.sane_device.resolution == 200
+
 # get options
 # set option
-# scan
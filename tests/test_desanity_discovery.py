@@ -0,0 +1,181 @@
+###############################################################################
+#  test_desanity_discovery.py for archivist descry microservice unit tests    #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity background discovery."""
+# }}}
+
+# Libraries {{{
+from threading import Event
+from unittest import mock
+import pytest
+from app.utils import DesanityDevice
+from app.utils.desanityExceptions import DesanitySaneException
+from app.utils.desanityDiscovery import DesanityDiscovery
+# }}}
+
+# desanityDiscovery unit tests {{{
+
+
+def discovered():
+    """Return a discovered device list."""
+    return [DesanityDevice("brother4:net1;dev0", "Brother", "*MFC-L2700DW",
+                           "BROTHER_MFC-L2700DW_series")]
+
+
+def test_refresh(tmp_path):
+    """
+    GIVEN a DesanityDiscovery
+    WHEN refresh is called
+    SHOULD cache the discovered devices
+    SHOULD no longer be stale
+    """
+    discovery = DesanityDiscovery(discovered, 300,
+                                  str(tmp_path / "devices.json"))
+    assert discovery.stale
+
+    discovery.refresh()
+
+    assert not discovery.stale
+    assert discovery.devices[0]['name'] == "brother4:net1;dev0"
+
+
+def test_stale_after_ttl(tmp_path):
+    """
+    GIVEN a DesanityDiscovery with a zero ttl
+    WHEN refresh is called
+    SHOULD be stale right away
+    """
+    discovery = DesanityDiscovery(discovered, 0,
+                                  str(tmp_path / "devices.json"))
+
+    discovery.refresh()
+
+    assert discovery.stale
+
+
+def test_load_persisted(tmp_path):
+    """
+    GIVEN a discovery result persisted by one DesanityDiscovery
+    WHEN another DesanityDiscovery loads the cache file
+    SHOULD answer with the persisted devices without discovering
+    """
+    cache_path = str(tmp_path / "devices.json")
+    DesanityDiscovery(discovered, 300, cache_path).refresh()
+
+    refresh = mock.Mock()
+    restarted = DesanityDiscovery(refresh, 300, cache_path)
+    devices = restarted.load()
+
+    refresh.assert_not_called()
+    assert devices[0]['guid'] == discovered()[0].guid
+    assert not restarted.stale
+
+
+@pytest.mark.parametrize('cache', ['[]', '{}', '{"devices": 1}',
+                                   '{"devices": [], "refreshed_at": 1}'])
+def test_load_malformed(tmp_path, cache):
+    """
+    GIVEN a cache file holding valid json of the wrong shape
+    WHEN a DesanityDiscovery loads the cache file
+    SHOULD treat it as a cache miss
+    """
+    cache_path = tmp_path / "devices.json"
+    cache_path.write_text(cache, encoding='utf-8')
+
+    discovery = DesanityDiscovery(discovered, 300, str(cache_path))
+
+    assert discovery.load() == []
+    assert discovery.stale
+
+
+def test_refresh_error(tmp_path):
+    """
+    GIVEN a DesanityDiscovery
+    WHEN discovery raises a desanity exception
+    SHOULD record the error and keep the previous result
+    """
+    refresh = mock.Mock(side_effect=[discovered(),
+                                     DesanitySaneException('io error')])
+    discovery = DesanityDiscovery(refresh, 300,
+                                  str(tmp_path / "devices.json"))
+
+    discovery.refresh()
+    discovery.refresh()
+
+    state = discovery.serialize_json()
+    assert state['error'] == 'io error'
+    assert len(state['devices']) == 1
+
+
+def test_trigger(tmp_path):
+    """
+    GIVEN a DesanityDiscovery without a background loop
+    WHEN trigger is called
+    SHOULD return before discovery finishes and run it in the background
+    """
+    release = Event()
+    done = Event()
+
+    def slow_refresh():
+        release.wait(1)
+        done.set()
+        return discovered()
+
+    discovery = DesanityDiscovery(slow_refresh, 300,
+                                  str(tmp_path / "devices.json"))
+    discovery.trigger()
+
+    assert not done.is_set()
+    release.set()
+    assert done.wait(1)
+
+
+def test_background_survives_errors(tmp_path):
+    """
+    GIVEN a background DesanityDiscovery
+    WHEN a discovery fails with an unexpected error
+    SHOULD record the error and keep discovering when triggered
+    """
+    done = Event()
+    calls = []
+
+    def flaky_refresh():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError('cache directory is read only')
+        done.set()
+        return discovered()
+
+    discovery = DesanityDiscovery(flaky_refresh, 300,
+                                  str(tmp_path / "devices.json"))
+    discovery.start()
+    try:
+        for _ in range(100):
+            if discovery.serialize_json()['error'] is not None:
+                break
+            done.wait(0.01)
+        assert discovery.serialize_json()['error'] == \
+            'cache directory is read only'
+
+        discovery.trigger()
+        assert done.wait(1)
+    finally:
+        discovery.stop()
+
+    assert discovery.serialize_json()['error'] is None
+
+# }}}
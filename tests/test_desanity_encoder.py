@@ -0,0 +1,113 @@
+###############################################################################
+#  test_desanity_encoder.py for archivist descry microservice unit tests      #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity page encoding pool."""
+# }}}
+
+# Libraries {{{
+import os
+from PIL import Image
+from app.utils.desanityEncoder import DesanityEncoder
+from app.utils.desanityJobs import DesanityJob
+# }}}
+
+# desanityEncoder unit tests {{{
+
+
+def load_page(number):
+    """Return a decoded test page."""
+    with Image.open(f"tests/data/lorem{number}.png") as img:
+        img.load()
+
+    return img
+
+
+def test_submit_inline(tmp_path):
+    """
+    GIVEN an encoder without worker processes
+    WHEN a page is submitted
+    SHOULD encode and commit the page before returning
+    """
+    encoder = DesanityEncoder(0)
+    job = DesanityJob(1, str(tmp_path))
+
+    future = encoder.submit(job, load_page(1))
+
+    assert future.done()
+    assert future.result().number == 1
+    assert len(job.pages) == 1
+    assert encoder.stats['completed'] == 1
+
+
+def test_submit_pool(tmp_path):
+    """
+    GIVEN an encoder with worker processes
+    WHEN several pages are submitted
+    SHOULD commit every page in acquisition order
+    SHOULD drain the encoding stage
+    """
+    encoder = DesanityEncoder(2, max_pending=2)
+    job = DesanityJob(1, str(tmp_path))
+
+    futures = [encoder.submit(job, load_page(number))
+               for number in (1, 2, 3)]
+    pages = [future.result() for future in futures]
+    encoder.shutdown()
+
+    assert [page.number for page in pages] == [1, 2, 3]
+    assert [page.number for page in job.pages] == [1, 2, 3]
+    assert all(os.path.getsize(page.path) == page.size for page in pages)
+
+    stats = encoder.stats
+    assert stats['encoding'] == 0
+    assert stats['waiting'] == 0
+    assert stats['completed'] == 3
+
+
+def test_submit_failure(tmp_path):
+    """
+    GIVEN an encoder
+    WHEN a page fails to encode
+    SHOULD raise from the returned future
+    SHOULD count the failure
+    """
+    encoder = DesanityEncoder(0)
+    job = DesanityJob(1, str(tmp_path), "JPEG")
+
+    future = encoder.submit(job, load_page(1).convert("RGBA"))
+
+    assert future.exception() is not None
+    assert encoder.stats['failed'] == 1
+
+
+def test_submit_finished_job(tmp_path):
+    """
+    GIVEN an encoder and a job that already failed
+    WHEN a page of the job finishes encoding
+    SHOULD drop the page instead of committing it
+    """
+    encoder = DesanityEncoder(0)
+    job = DesanityJob(1, str(tmp_path))
+    job.mark_error('acquisition failed')
+
+    future = encoder.submit(job, load_page(1))
+
+    assert future.result() is None
+    assert job.pages == []
+    assert os.listdir(job.spool.path) == []
+
+# }}}
@@ -0,0 +1,356 @@
+###############################################################################
+#  test_desanity_federation.py for archivist descry microservice unit tests   #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the federation gateway, nodes run as local processes."""
+# }}}
+
+# Libraries {{{
+import json
+import multiprocessing
+import time
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import pytest
+from app.appfactory import create_app
+from app.config import TestConfig
+from app.utils import desanity, federation
+from app.utils.desanityFederation import DesanityFederation
+from app.utils.desanityFederation import DesanityNodePool
+from app.utils.desanityExceptions import DesanityNodeUnavailable
+from app.utils.desanityExceptions import DesanityUnknownDev
+# }}}
+
+# desanityFederation unit tests {{{
+
+
+def run_node(name, accepts_scans, ports):
+    """Serve a stub Descry node owning a single device.
+
+    http.server is used rather than the werkzeug development server, which
+    closes every connection, so keep-alive can be observed.
+    """
+    received = []
+
+    class NodeHandler(BaseHTTPRequestHandler):
+        """Stub of the node device routes."""
+
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Answer device and option requests."""
+            url = urlsplit(self.path)
+            if url.path == '/api/v1/devices':
+                self.reply(200, {'devices': [{'name': f'{name}:scanner',
+                                              'guid': name}]})
+            elif url.path == '/api/v1/received':
+                self.reply(200, {'received': received})
+            elif url.path.endswith('/live'):
+                self.stream()
+            elif url.path.endswith('/scan'):
+                # queue the scan, then drop the connection unanswered
+                received.append(url.path)
+                self.close_connection = True
+            else:
+                self.reply(200, {'node': name, 'path': url.path,
+                                 'query': url.query})
+
+        def do_PUT(self):  # pylint: disable=invalid-name
+            """Echo the body of option requests."""
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            self.reply(200, {'node': name, 'body': json.loads(body)})
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            """Answer pool scans."""
+            self.rfile.read(int(self.headers['Content-Length']))
+            received.append(self.path)
+            if self.path.endswith('/slow/scan'):
+                # longer than the gateway waits
+                time.sleep(1)
+            if accepts_scans:
+                self.reply(202, {'node': name})
+            else:
+                self.reply(409, {'ErrMsg': 'No compatible device'})
+
+        def stream(self):
+            """Send two events with a pause longer than a request timeout."""
+            events = [b'event: progress\ndata: 1\n\n',
+                      b'event: progress\ndata: 2\n\n']
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Content-Length',
+                             str(sum(len(event) for event in events)))
+            self.end_headers()
+            self.wfile.write(events[0])
+            self.wfile.flush()
+            time.sleep(0.6)
+            self.wfile.write(events[1])
+
+        def reply(self, code, body):
+            """Send a json reply."""
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            """Keep the test output quiet."""
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), NodeHandler)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+@pytest.fixture(name='nodes')
+def fixture_nodes():
+    """Start two Descry nodes in their own processes."""
+    ctx = multiprocessing.get_context('fork')
+    ports = ctx.Queue()
+    procs = [ctx.Process(target=run_node, args=(name, accepts, ports),
+                         daemon=True)
+             for name, accepts in (('node-a', False), ('node-b', True))]
+    urls = []
+    for proc in procs:
+        proc.start()
+        urls.append(f'http://127.0.0.1:{ports.get(timeout=10)}/api/v1')
+
+    # ports arrive in the order the nodes came up, ask them who they are
+    probe = DesanityFederation(urls)
+    nodes = {dev['guid']: dev['node'] for dev in probe.devices()}
+    probe.close()
+
+    yield procs, nodes
+
+    for proc in procs:
+        proc.kill()
+        proc.join()
+
+
+@pytest.fixture(name='gateway')
+def fixture_gateway(nodes):
+    """Test client of a gateway federating the nodes."""
+    procs, urls = nodes
+
+    class GatewayConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """Gateway test configuration."""
+
+        FEDERATION_NODES = list(urls.values())
+
+    yield create_app(GatewayConfig()).test_client(), procs, urls
+
+    federation.close()
+    federation.configure({})
+
+
+def test_federation_devices(nodes):
+    """
+    GIVEN a federation of two nodes
+    WHEN the devices are listed twice
+    SHOULD return the devices of both nodes with their owning node
+    SHOULD cache the registries and reuse the node connections
+    """
+    _, urls = nodes
+    fed = DesanityFederation(list(urls.values()), ttl=0)
+
+    devices = fed.devices()
+    assert sorted(dev['guid'] for dev in devices) == ['node-a', 'node-b']
+    assert all(dev['node'] == urls[dev['guid']] for dev in devices)
+
+    fed.devices()
+    for node in fed.stats['nodes']:
+        assert node['connections']['created'] == 1
+        assert node['connections']['reused'] == 1
+
+    fed.close()
+
+
+def test_federation_unknown_device(nodes):
+    """
+    GIVEN a federation of two nodes
+    WHEN an unknown device is looked up twice within the ttl
+    SHOULD refresh the registries for the first lookup only
+    SHOULD refresh them again once they expire
+    """
+    _, urls = nodes
+    fed = DesanityFederation(list(urls.values()), ttl=60)
+    fed.devices()
+
+    with mock.patch.object(fed, 'refresh', wraps=fed.refresh) as refresh:
+        for _ in range(2):
+            with pytest.raises(DesanityUnknownDev):
+                fed.owner('node-c')
+        assert refresh.call_count == 1
+
+        fed._refreshed -= 60
+        with pytest.raises(DesanityUnknownDev):
+            fed.owner('node-c')
+        assert refresh.call_count == 2
+
+    fed.close()
+
+
+def test_gateway_no_local_devices():
+    """
+    GIVEN a gateway configuration with background features enabled
+    WHEN the app is created
+    SHOULD not start any of the local SANE machinery
+    """
+    class GatewayConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """Gateway with background features."""
+
+        FEDERATION_NODES = ['http://127.0.0.1:1/api/v1']
+        DISCOVERY_BACKGROUND = True
+        JOB_GC_BACKGROUND = True
+
+    starts = ['start_discovery', 'start_warmup', 'start_handle_pool',
+              'start_health', 'start_retention']
+    with mock.patch.multiple(desanity, **{name: mock.DEFAULT
+                                          for name in starts}) as started:
+        create_app(GatewayConfig())
+
+    federation.configure({})
+    assert not any(start.called for start in started.values())
+
+
+def test_node_pool_no_replay(nodes):
+    """
+    GIVEN a pooled connection to a node
+    WHEN a scan request times out on a reused connection
+    SHOULD not send the scan to the node again
+    """
+    _, urls = nodes
+    pool = DesanityNodePool(urls['node-b'], timeout=0.3)
+    pool.request('GET', '/received').read()
+
+    with pytest.raises(DesanityNodeUnavailable):
+        pool.request('POST', '/devices/slow/scan', b'{}',
+                     {'Content-Type': 'application/json'})
+
+    time.sleep(1)
+    received = pool.request('GET', '/received').json()['received']
+    assert received == ['/api/v1/devices/slow/scan']
+    pool.close()
+
+
+def test_node_pool_no_replay_get(nodes):
+    """
+    GIVEN a pooled connection to a node
+    WHEN the node drops the connection after receiving a GET scan
+    SHOULD not send the scan to the node again
+    """
+    _, urls = nodes
+    pool = DesanityNodePool(urls['node-b'], timeout=2)
+    pool.request('GET', '/received').read()
+
+    with pytest.raises(DesanityNodeUnavailable):
+        pool.request('GET', '/devices/node-b/scan')
+
+    received = pool.request('GET', '/received').json()['received']
+    assert received == ['/api/v1/devices/node-b/scan']
+    assert pool.stats['reused'] == 1
+    pool.close()
+
+
+def test_node_pool_stream(nodes):
+    """
+    GIVEN a pooled connection to a node
+    WHEN a streamed body pauses longer than the request timeout
+    SHOULD keep relaying the stream up to the stream timeout
+    SHOULD apply the request timeout again once the connection is reused
+    """
+    _, urls = nodes
+    pool = DesanityNodePool(urls['node-b'], timeout=0.3, stream_timeout=5)
+
+    resp = pool.request('GET', '/devices/node-b/jobs/1/live')
+    assert b''.join(resp.iter_content()) == \
+        b'event: progress\ndata: 1\n\nevent: progress\ndata: 2\n\n'
+
+    assert pool.request('GET', '/received').json()['received'] == []
+    assert pool.stats['reused'] == 1
+    with pytest.raises(DesanityNodeUnavailable):
+        pool.request('POST', '/devices/slow/scan', b'{}',
+                     {'Content-Type': 'application/json'})
+    pool.close()
+
+
+def test_gateway_routes_to_owner(gateway):
+    """
+    GIVEN a gateway federating two nodes
+    WHEN devices are listed and device requests are made
+    SHOULD list every device in one namespace
+    SHOULD forward each request, query and body to the owning node
+    """
+    client, _, urls = gateway
+
+    resp = client.get('/api/v1/devices')
+    assert resp.status_code == 200
+    assert {dev['guid']: dev['node'] for dev in resp.json['devices']} == urls
+
+    resp = client.get('/api/v1/devices/node-b/options?full=1')
+    assert resp.status_code == 200
+    assert resp.json == {'node': 'node-b', 'query': 'full=1',
+                         'path': '/api/v1/devices/node-b/options'}
+
+    resp = client.put('/api/v1/devices/node-a/options',
+                      json={'resolution': 300})
+    assert resp.json['node'] == 'node-a'
+    assert resp.json['body'] == {'resolution': 300}
+
+    resp = client.get('/api/v1/devices/node-c/options')
+    assert resp.status_code == 404
+
+
+def test_gateway_pool_scan(gateway):
+    """
+    GIVEN a gateway where only one node can take a scan
+    WHEN a pool scan is requested
+    SHOULD queue it on the node accepting it
+    """
+    client, _, _ = gateway
+
+    resp = client.post('/api/v1/devices/scan', json={'requirements': {}})
+
+    assert resp.status_code == 202
+    assert resp.json['node'] == 'node-b'
+
+
+def test_gateway_node_down(gateway):
+    """
+    GIVEN a gateway federating two nodes
+    WHEN a node goes down
+    SHOULD keep listing its last known devices
+    SHOULD answer 502 for requests to its devices
+    """
+    client, procs, urls = gateway
+    client.get('/api/v1/devices')
+
+    for proc in procs:
+        proc.kill()
+        proc.join()
+    federation.refresh()
+
+    resp = client.get('/api/v1/devices')
+    assert len(resp.json['devices']) == 2
+    assert all(node['error'] for node in
+               client.get('/api/v1/backend/federation').json['nodes'])
+
+    resp = client.get('/api/v1/devices/node-a/options')
+    assert resp.status_code == 502
+
+# }}}
@@ -0,0 +1,124 @@
+###############################################################################
+#  test_desanity_handles.py for archivist descry microservice unit tests      #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity idle handle pool."""
+# }}}
+
+# Libraries {{{
+from unittest import mock
+import sane
+from tests.mocks.mockBrother import MockBrotherDev
+from app.utils import DesanityDevice, JobStatus
+from app.utils.desanityHandles import DesanityHandlePool
+# }}}
+
+# desanityHandles unit tests {{{
+
+
+@mock.patch.object(sane, "open")
+def test_park_and_reopen(mock_sane_open):
+    """
+    GIVEN an enabled DesanityDevice with an option set
+    WHEN its idle handle is parked and the device is used again
+    SHOULD close the handle and keep the device enabled
+    SHOULD reopen the handle with the option value written back
+    SHOULD count the reopen as a miss and later uses as hits
+    """
+    handles = []
+    mock_sane_open.side_effect = \
+        lambda name: handles.append(MockBrotherDev()) or handles[-1]
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    dev.enable()
+    dev.set_option('resolution', 100)
+
+    assert not dev.park(60)
+    assert dev.park(0)
+    assert dev.enabled and dev.parked
+    assert dev.sane_device is None
+    assert dev.options['resolution']['value'] == 100
+
+    dev.parameters
+    dev.parameters
+
+    assert mock_sane_open.call_count == 2
+    assert not dev.parked
+    assert dev.sane_device is handles[1]
+    assert handles[1].resolution == 100
+    assert dev.handle_stats['misses'] == 1
+    assert dev.handle_stats['hits'] == 2
+    assert dev.handle_stats['parks'] == 1
+
+    dev.park(0)
+    dev.disable()
+    assert not dev.enabled and not dev.parked
+
+
+@mock.patch.object(sane, "open")
+def test_sweep(mock_sane_open, tmp_path):
+    """
+    GIVEN an idle and a disabled device
+    WHEN the pool sweeps them
+    SHOULD park the idle handle only
+    SHOULD report the open handles, hits and misses
+    """
+    mock_sane_open.side_effect = lambda name: MockBrotherDev(pages=1)
+    idle, disabled = [DesanityDevice(name, "ACME Corp", "B", "ABCDEF",
+                                     str(tmp_path))
+                      for name in ('idle', 'disabled')]
+    idle.enable()
+    pool = DesanityHandlePool(0)
+
+    assert DesanityHandlePool().sweep([idle, disabled]) == 0
+    assert pool.sweep([idle, disabled]) == 1
+    assert pool.sweep([idle, disabled]) == 0
+
+    # the scan reopens the parked handle
+    job, _ = idle.scan()
+    idle.worker.call(lambda: None)
+
+    stats = pool.serialize_json([idle, disabled])
+    assert job.status == JobStatus.COMPLETED
+    assert stats['parked'] == 1 and stats['sweeps'] == 2
+    assert stats['open'] == 1
+    assert stats['misses'] == 1 and stats['hits'] == 0
+    assert stats['hit_ratio'] == 0
+    assert stats['errors'] == {}
+
+
+@mock.patch.object(sane, "open")
+def test_sweep_error(mock_sane_open):
+    """
+    GIVEN two idle devices, one failing to read its options
+    WHEN the pool sweeps them
+    SHOULD park the other device and report the error of the failing one
+    """
+    mock_sane_open.side_effect = lambda name: MockBrotherDev()
+    failing, idle = [DesanityDevice(name, "ACME Corp", "B", "ABCDEF")
+                     for name in ('failing', 'idle')]
+    failing.enable()
+    idle.enable()
+    pool = DesanityHandlePool(0)
+
+    with mock.patch.object(failing, "_load_options",
+                           side_effect=sane._sane.error('I/O error')):
+        assert pool.sweep([failing, idle]) == 1
+
+    assert idle.parked and not failing.parked
+    assert pool.serialize_json([failing, idle])['errors'] == \
+        {failing.guid: 'I/O error'}
+
+# }}}
@@ -0,0 +1,137 @@
+###############################################################################
+#  test_desanity_health.py for archivist descry microservice unit tests       #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity device health prober."""
+# }}}
+
+# Libraries {{{
+from datetime import datetime, timedelta
+from unittest import mock
+import sane
+from tests.mocks.mockBrother import MockBrotherDev
+from app.utils import DesanityDevice
+from app.utils.desanityHealth import DesanityHealth
+
+SaneError = sane._sane.error
+# }}}
+
+# desanityHealth unit tests {{{
+
+
+@mock.patch.object(sane, "open")
+def test_probe_backoff(mock_sane_open):
+    """
+    GIVEN an enabled device that stops answering
+    WHEN it is probed until it answers again
+    SHOULD double the interval between probes with every failure
+    SHOULD go back to the base interval and record the latency once
+           the device answers
+    """
+    mock_sane_open.return_value = MockBrotherDev()
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    dev.enable()
+    health = DesanityHealth(10, 35)
+
+    intervals = []
+    with mock.patch.object(MockBrotherDev, "get_parameters",
+                           side_effect=SaneError('Error during device I/O')):
+        for _ in range(3):
+            assert health.probe([dev], force=True) == 1
+            status = health.status(dev.guid)
+            intervals.append(
+                (datetime.fromisoformat(status['next_probe']) -
+                 datetime.fromisoformat(status['last_probe']))
+                .total_seconds())
+
+    assert intervals == [20, 35, 35]
+    assert status['reachable'] is False
+    assert status['failures'] == 3
+    assert status['error'] == 'Error during device I/O'
+    assert status['last_seen'] is None
+    # not due yet
+    assert health.probe([dev]) == 0
+
+    health.probe([dev], force=True)
+    status = health.status(dev.guid)
+
+    assert status['reachable'] is True
+    assert status['source'] == 'handle'
+    assert status['failures'] == 0
+    assert status['latency'] >= 0
+    assert datetime.fromisoformat(status['next_probe']) - \
+        datetime.fromisoformat(status['last_probe']) == timedelta(seconds=10)
+    mock_sane_open.assert_called_once()
+
+
+@mock.patch.object(sane, "open")
+def test_probe_open_handle(mock_sane_open):
+    """
+    GIVEN an enabled device
+    WHEN it is probed
+    SHOULD ask the open handle for its parameters instead of reopening it
+    SHOULD forget devices that are gone
+    """
+    mock_sane_open.return_value = MockBrotherDev()
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    dev.enable()
+    health = DesanityHealth()
+
+    with mock.patch.object(MockBrotherDev, "get_parameters") as params:
+        health.probe([dev])
+        params.assert_called_once()
+
+    mock_sane_open.assert_called_once()
+    assert health.status(dev.guid)['reachable'] is True
+
+    health.probe([])
+    assert health.serialize_json() == {}
+
+
+@mock.patch.object(sane, "open")
+def test_probe_without_handle(mock_sane_open):
+    """
+    GIVEN a parked device and a disabled device
+    WHEN they are probed repeatedly
+    SHOULD not open either device
+    SHOULD report them reachable while the last discovery lists them
+    SHOULD keep the state unknown when there was no discovery
+    """
+    mock_sane_open.return_value = MockBrotherDev()
+    parked, disabled = [DesanityDevice(name, "ACME Corp", "B", "ABCDEF")
+                        for name in ('parked', 'disabled')]
+    parked.enable()
+    assert parked.park(0)
+    discovered_at = datetime.now() - timedelta(minutes=1)
+    listing = None
+    health = DesanityHealth(listed=lambda: listing)
+
+    health.probe([parked, disabled], force=True)
+    assert health.status(disabled.guid)['reachable'] is None
+
+    listing = ({'parked'}, discovered_at)
+    for _ in range(3):
+        health.probe([parked, disabled], force=True)
+
+    mock_sane_open.assert_called_once()
+    assert parked.parked and not disabled.enabled
+    status = health.status(parked.guid)
+    assert status['reachable'] is True
+    assert status['source'] == 'discovery'
+    assert status['last_seen'] == discovered_at.isoformat()
+    assert health.status(disabled.guid)['reachable'] is False
+
+# }}}
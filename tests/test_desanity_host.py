@@ -0,0 +1,205 @@
+###############################################################################
+#  test_desanity_host.py for archivist descry microservice unit tests         #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity device host."""
+# }}}
+
+# Libraries {{{
+import os
+import stat
+from unittest import mock
+import pytest
+import sane
+from tests.mocks.mockBrother import MockBrotherDev
+from app.utils import DesanityDevice, JobStatus, PENDING_STATUSES
+from app.utils.desanityExceptions import DesanityUnknownDev
+from app.utils.desanityExceptions import DesanityUnknownJob
+from app.utils.desanityExceptions import DesanityHostUnavailable
+from app.utils.desanityRegistry import DesanityRegistry
+from app.utils.desanityHost import DesanityHost, DesanityHostClient
+from app.utils.desanityHost import authkey_path
+from app.utils import desanity
+from app.appfactory import create_app
+from app.config import TestConfig
+# }}}
+
+# desanityHost unit tests {{{
+
+
+class HostedDevices(DesanityRegistry):
+    """Stands in for the Desanity served by the host."""
+
+    def get_device_by_guid(self, guid):
+        """Return a registered device by guid."""
+        return self.get_by_guid(guid)
+
+    def initialize(self):
+        """Return a SANE version."""
+        return "1.0.0"
+
+    def refresh_devices(self):
+        """Keep the registered devices."""
+        return self.devices
+
+    def get_job_states(self, device_guid):
+        """Return the states the device published to its job store."""
+        return self.get_by_guid(device_guid)._job_store.list(device_guid)
+
+    def get_job_state(self, device_guid, job_id):
+        """Return a state the device published by guid or job number."""
+        store = self.get_by_guid(device_guid)._job_store
+        return store.get(job_id) or store.find(device_guid, int(job_id))
+
+
+@pytest.fixture(name='host')
+def fixture_host(tmp_path):
+    """Serve an enabled mock device from a device host."""
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    with mock.patch.object(sane, "open",
+                           side_effect=lambda name: MockBrotherDev(pages=1)):
+        dev.enable()
+
+    device_host = DesanityHost(HostedDevices([dev]),
+                               str(tmp_path / 'host.sock'), 'secret')
+    device_host.start()
+    yield dev, DesanityHostClient(str(tmp_path / 'host.sock'), 'secret')
+    device_host.stop()
+
+
+def test_remote_device_options(host):
+    """
+    GIVEN a device served by a device host
+    WHEN its options are read and set through a remote device
+    SHOULD run the SANE calls on the host device
+    """
+    dev, client = host
+    devices = client.call('devices', refresh=True)
+    assert devices == [dev.serialize_json()]
+
+    remote = client.device((dev.name, dev.vendor, dev.model,
+                            dev.device_type))
+    assert remote.guid == dev.guid
+    assert remote.enabled
+    assert remote.options == dev.options
+
+    delta = remote.set_option('resolution', 200)
+
+    assert list(delta['changed']) == ['resolution']
+    assert dev.sane_device.resolution == 200
+    assert remote.options_version == dev.options_version
+
+
+def test_remote_device_scan(host):
+    """
+    GIVEN a device served by a device host
+    WHEN a scan is queued through a remote device
+    SHOULD follow the job progress and read its pages from the spool
+    """
+    dev, client = host
+    remote = client.device((dev.name, dev.vendor, dev.model,
+                            dev.device_type))
+
+    job, position = remote.scan()
+    assert position == 1
+
+    version, progress = None, {'status': JobStatus.QUEUED}
+    while progress['status'] in PENDING_STATUSES:
+        version, progress = job.progress.wait(version, timeout=5)
+
+    job = remote.get_job(str(job.job_number))
+    assert job.status == JobStatus.COMPLETED
+    assert job.get_page(1).path == dev.get_job(job.guid).get_page(1).path
+
+
+def test_remote_errors(host):
+    """
+    GIVEN a device host
+    WHEN a command fails on the host or the host is gone
+    SHOULD raise the desanity exception of the failure in the client
+    """
+    dev, client = host
+
+    with pytest.raises(DesanityUnknownJob):
+        client.call('job', guid=dev.guid, job_id='42')
+
+    with pytest.raises(DesanityUnknownDev):
+        client.call('status', guid='not-a-device')
+
+    gone = DesanityHostClient('/nonexistent/descry-host.sock')
+    with pytest.raises(DesanityHostUnavailable):
+        gone.call('devices')
+
+
+def test_job_routes_through_host(host, tmp_path):
+    """
+    GIVEN an API worker configured with a device host and a memory job
+          store
+    WHEN a scan is queued through the worker and its status is requested
+    SHOULD answer the status of the job from the host
+    """
+    dev, _ = host
+
+    class HostConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """API worker of the device host."""
+
+        DEVICE_HOST = str(tmp_path / 'host.sock')
+        DEVICE_HOST_AUTHKEY = 'secret'
+
+    client = create_app(HostConfig()).test_client()
+    try:
+        desanity.refresh_devices()
+        job_id = client.get(f'/api/v1/devices/{dev.guid}/scan').json['jobId']
+
+        resp = client.get(f'/api/v1/devices/{dev.guid}/jobs/{job_id}')
+        assert resp.status_code == 200
+        assert resp.json['job_number'] == job_id
+
+        resp = client.get(f'/api/v1/devices/{dev.guid}/jobs')
+        assert resp.json['jobs'] == [dev.jobs[0].guid]
+    finally:
+        create_app(TestConfig())
+        desanity._delete_devices()
+
+
+def test_generated_authkey(tmp_path):
+    """
+    GIVEN a device host started without an authkey
+    WHEN clients connect
+    SHOULD share a generated key and the socket with its own user only
+    SHOULD serve clients reading the shared key
+    SHOULD refuse clients with another key
+    """
+    address = str(tmp_path / 'host.sock')
+    device_host = DesanityHost(HostedDevices([]), address)
+    device_host.start()
+
+    try:
+        assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(authkey_path(address)).st_mode) == 0o600
+        assert DesanityHostClient(address).call('initialize') == "1.0.0"
+
+        with pytest.raises(DesanityHostUnavailable):
+            DesanityHostClient(address, 'guessed').call('initialize')
+        # the host keeps serving after refusing a client
+        assert DesanityHostClient(address).call('initialize') == "1.0.0"
+    finally:
+        device_host.stop()
+
+    assert not os.path.exists(authkey_path(address))
+
+# }}}
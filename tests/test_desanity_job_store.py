@@ -0,0 +1,77 @@
+###############################################################################
+#  test_desanity_job_store.py for archivist descry microservice unit tests    #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity shared job state."""
+# }}}
+
+# Libraries {{{
+from PIL import Image
+from app.utils import DesanityDevice, JobStatus
+from app.utils.desanityJobStore import DesanityMemoryJobStore
+# }}}
+
+# desanityJobStore unit tests {{{
+
+
+def test_store_lookup():
+    """
+    GIVEN a DesanityMemoryJobStore holding job states
+    WHEN states are looked up by guid, job number and device
+    SHOULD return copies of the stored states
+    """
+    store = DesanityMemoryJobStore()
+    store.save({'guid': 'a', 'device': 'dev', 'job_number': 1})
+    store.save({'guid': 'b', 'device': 'dev', 'job_number': 2})
+
+    assert store.get('a')['job_number'] == 1
+    assert store.find('dev', 2)['guid'] == 'b'
+    assert [state['guid'] for state in store.list('dev')] == ['b', 'a']
+
+    store.get('a')['job_number'] = 5
+    store.delete('b')
+
+    assert store.get('a')['job_number'] == 1
+    assert store.get('b') is None
+
+
+def test_device_publishes_jobs(tmp_path):
+    """
+    GIVEN a DesanityDevice publishing to a job store
+    WHEN a job is queued, spools a page, finishes and is evicted
+    SHOULD keep the stored state of the job current
+    """
+    store = DesanityMemoryJobStore()
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path), job_store=store)
+
+    job = dev._get_next_job()
+    assert store.get(job.guid)['status'] == JobStatus.QUEUED
+
+    with Image.open("tests/data/lorem1.png") as img:
+        img.load()
+    job.add_image(img)
+    job.mark_complete()
+
+    state = store.get(job.guid)
+    assert state['device'] == dev.guid
+    assert state['status'] == JobStatus.COMPLETED
+    assert state['pages'] == 1
+
+    dev.evict_job(job)
+    assert store.get(job.guid) is None
+
+# }}}
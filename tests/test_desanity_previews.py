@@ -0,0 +1,112 @@
+###############################################################################
+#  test_desanity_previews.py for archivist descry microservice unit tests     #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity preview cache."""
+# }}}
+
+# Libraries {{{
+from io import BytesIO
+import pytest
+from PIL import Image
+from app.utils.desanityPreviews import DesanityPreviewCache
+from app.utils.desanityJobs import DesanityJob
+# }}}
+
+# desanityPreviews unit tests {{{
+
+
+@pytest.fixture(name='job')
+def fixture_job(tmp_path):
+    """Job holding the three test pages."""
+    job = DesanityJob(1, str(tmp_path))
+    for number in (1, 2, 3):
+        with Image.open(f"tests/data/lorem{number}.png") as img:
+            img.load()
+        job.add_image(img)
+
+    return job
+
+
+def test_get_renders_once(job):
+    """
+    GIVEN a DesanityPreviewCache
+    WHEN the same rendering is requested twice
+    SHOULD render it once and serve the second request from the cache
+    """
+    cache = DesanityPreviewCache(sizes={'thumbnail': 64})
+    page = job.get_page(1)
+
+    first = cache.get(job, page, 'thumbnail')
+    second = cache.get(job, page, 'thumbnail')
+
+    assert first is second
+    assert max(Image.open(BytesIO(first)).size) <= 64
+    assert cache.stats['misses'] == 1
+    assert cache.stats['hits'] == 1
+
+
+def test_get_unknown_size(job):
+    """
+    GIVEN a DesanityPreviewCache
+    WHEN an unconfigured size is requested
+    SHOULD raise a KeyError
+    """
+    cache = DesanityPreviewCache()
+
+    with pytest.raises(KeyError):
+        cache.get(job, job.get_page(1), 'poster')
+
+
+def test_evicts_by_bytes(job):
+    """
+    GIVEN a DesanityPreviewCache with room for two renderings
+    WHEN a third rendering is cached
+    SHOULD evict the least recently used rendering
+    """
+    sizing = DesanityPreviewCache(sizes={'thumbnail': 64})
+    size = max(len(sizing.get(job, page, 'thumbnail')) for page in job.pages)
+    cache = DesanityPreviewCache(max_bytes=size * 2,
+                                 sizes={'thumbnail': 64})
+
+    cache.get(job, job.get_page(1), 'thumbnail')
+    cache.get(job, job.get_page(2), 'thumbnail')
+    cache.get(job, job.get_page(1), 'thumbnail')
+    cache.get(job, job.get_page(3), 'thumbnail')
+
+    assert cache.stats['entries'] == 2
+    assert cache.stats['bytes'] <= size * 2
+
+    cache.get(job, job.get_page(1), 'thumbnail')
+    assert cache.stats['hits'] == 2
+
+
+def test_invalidate(job):
+    """
+    GIVEN a DesanityPreviewCache holding renderings of a job
+    WHEN the job is invalidated
+    SHOULD drop every rendering of the job
+    """
+    cache = DesanityPreviewCache()
+    cache.get(job, job.get_page(1), 'thumbnail')
+    cache.get(job, job.get_page(1), 'preview')
+
+    cache.invalidate(job.guid)
+
+    assert cache.stats['entries'] == 0
+    assert cache.stats['bytes'] == 0
+
+# }}}
@@ -0,0 +1,140 @@
+###############################################################################
+#  test_desanity_profiles.py for archivist descry microservice unit tests     #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for desanity scan profiles."""
+# }}}
+
+# Libraries {{{
+import sys
+from types import SimpleNamespace
+from unittest import mock
+import pytest
+import sane
+from tests.mocks.mockBrother import MockBrotherDev
+from app.utils import DesanityDevice
+from app.utils.desanity import Desanity
+from app.utils.desanityExceptions import DesanityUnknownProfile
+from app.utils.desanityProfiles import DesanityProfiles, DesanityProfile
+from app.utils.desanityProfiles import DesanityMemoryProfileStore
+from app.utils.desanityProfiles import DesanityRedisProfileStore
+# }}}
+
+# desanityProfiles unit tests {{{
+
+
+def invoice():
+    """Return an invoice scan profile."""
+    return DesanityProfile("invoice", "aScanner",
+                           {"mode": "Gray", "resolution": "300"})
+
+
+def test_profiles_cached():
+    """
+    GIVEN DesanityProfiles backed by a store
+    WHEN profiles of a device are read more than once
+    SHOULD only load them from the store once
+    """
+    store = DesanityMemoryProfileStore()
+    store.save(invoice())
+    store = mock.Mock(wraps=store)
+    profiles = DesanityProfiles(store)
+
+    assert profiles.get("aScanner", "invoice").options["mode"] == "Gray"
+    assert [profile.name for profile in profiles.list("aScanner")] == \
+        ["invoice"]
+
+    store.load.assert_called_once_with("aScanner")
+
+
+def test_profiles_delete():
+    """
+    GIVEN DesanityProfiles holding a profile
+    WHEN the profile is deleted
+    SHOULD remove it from the cache and the store
+    SHOULD raise a DesanityUnknownProfile when deleted again
+    """
+    store = DesanityMemoryProfileStore()
+    profiles = DesanityProfiles(store)
+    profiles.save(invoice())
+
+    profiles.delete("aScanner", "invoice")
+
+    assert store.load("aScanner") == []
+    with pytest.raises(DesanityUnknownProfile):
+        profiles.delete("aScanner", "invoice")
+
+
+def test_redis_store_round_trip():
+    """
+    GIVEN a redis profile store
+    WHEN a profile holding typed and list values is saved and loaded
+    SHOULD store every value as a json string
+    SHOULD load the values back with their types
+    """
+    saved = []
+
+    class DeviceConfig(SimpleNamespace):
+        """Stands in for the redis DeviceConfig model."""
+
+        def save(self):
+            """Keep the model in memory."""
+            saved.append(self)
+
+    models = mock.Mock(DeviceConfig=DeviceConfig,
+                       DeviceConfigOption=SimpleNamespace)
+    with mock.patch.dict(sys.modules, {'redis_om': mock.Mock(),
+                                       'app.models': models}):
+        store = DesanityRedisProfileStore()
+
+    options = {"mode": "Gray", "resolution": 300, "batch": True,
+               "area": [0, 0, 215.9, 279.4]}
+    with mock.patch.object(store, "_find",
+                           return_value=mock.Mock(all=lambda: saved)):
+        store.save(DesanityProfile("invoice", "aScanner", options))
+        profile, = store.load("aScanner")
+
+    assert all(isinstance(opt.option_value, str)
+               for opt in saved[0].options)
+    assert profile.options == options
+
+
+@mock.patch.object(sane, "open")
+def test_enable_restores_last_profile(mock_sane_open):
+    """
+    GIVEN a profile applied to a device
+    WHEN the device is enabled again
+    SHOULD apply the last used profile in a single batch
+    """
+    desanity = Desanity()
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF")
+    mock_sane_open.return_value = MockBrotherDev()
+    desanity.profiles.save(invoice())
+
+    dev.enable()
+    desanity.apply_profile(dev, "invoice")
+
+    mock_sane_open.return_value = MockBrotherDev()
+    with mock.patch.object(dev, "set_options",
+                           wraps=dev.set_options) as set_options:
+        restored = desanity.enable_device(dev)
+
+    set_options.assert_called_once_with(invoice().options)
+    assert restored['profile'] == "invoice"
+    assert dev.options['resolution']['value'] == 300
+    assert dev.options['mode']['value'] == "Gray"
+
+# }}}
@@ -0,0 +1,81 @@
+###############################################################################
+#  test_desanity_queue.py for archivist descry microservice unit tests        #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity scan queue."""
+# }}}
+
+# Libraries {{{
+from app.utils import ScanPriority
+from app.utils.desanityQueue import DesanityScanQueue
+# }}}
+
+# desanityQueue unit tests {{{
+
+
+def test_priority_order():
+    """
+    GIVEN a DesanityScanQueue
+    WHEN jobs of different priorities are queued
+    SHOULD pop higher priorities first and keep FIFO order within one
+    SHOULD report the position of each queued job
+    """
+    queue = DesanityScanQueue()
+    assert queue.put("low", ScanPriority.LOW) == 1
+    assert queue.put("first") == 1
+    assert queue.put("second") == 2
+    assert queue.put("urgent", ScanPriority.HIGH) == 1
+
+    assert queue.position("low") == 4
+    assert queue.jobs == ["urgent", "first", "second", "low"]
+    assert [queue.pop() for _ in range(5)] == \
+        ["urgent", "first", "second", "low", None]
+
+
+def test_remove():
+    """
+    GIVEN a DesanityScanQueue holding jobs
+    WHEN a queued job is removed
+    SHOULD no longer pop or position it
+    """
+    queue = DesanityScanQueue()
+    queue.put("first")
+    queue.put("second")
+
+    assert queue.remove("first")
+    assert not queue.remove("first")
+    assert queue.position("first") is None
+    assert queue.pop() == "second"
+
+
+def test_stats():
+    """
+    GIVEN a DesanityScanQueue
+    WHEN jobs are queued and popped
+    SHOULD report the depth per priority and the wait times
+    """
+    queue = DesanityScanQueue()
+    queue.put("first")
+    queue.put("urgent", ScanPriority.HIGH)
+    queue.pop()
+
+    stats = queue.stats
+    assert stats['depth'] == 1
+    assert stats['priorities'] == {'high': 0, 'normal': 1, 'low': 0}
+    assert stats['dequeued'] == 1
+    assert stats['max_wait'] >= stats['average_wait'] >= 0
+
+# }}}
@@ -0,0 +1,108 @@
+###############################################################################
+#  test_desanity_registry.py for archivist descry microservice unit tests     #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity device registry."""
+# }}}
+
+# Libraries {{{
+from threading import Thread, Event
+import pytest
+from app.utils import DesanityDevice
+from app.utils.desanityExceptions import DesanityUnknownDev
+from app.utils.desanityRegistry import DesanityRegistry, ReadWriteLock
+# }}}
+
+# desanityRegistry unit tests {{{
+
+
+def make_devices():
+    """Return a pair of devices."""
+    return [DesanityDevice("brother4:net1;dev0", "Brother", "*MFC-L2700DW",
+                           "BROTHER_MFC-L2700DW_series"),
+            DesanityDevice("v4l:/dev/video0", "Noname",
+                           "Integrated Camera: Integrated C",
+                           "virtual device")]
+
+
+def test_lookup():
+    """
+    GIVEN a DesanityRegistry holding devices
+    WHEN a device is looked up by guid or name
+    SHOULD return the registered device
+    """
+    devices = make_devices()
+    registry = DesanityRegistry(devices)
+
+    assert registry.get_by_guid(devices[0].guid) is devices[0]
+    assert registry.get_by_name("v4l:/dev/video0") is devices[1]
+    assert devices[1].guid in registry
+    assert len(registry) == 2
+
+
+def test_lookup_unknown():
+    """
+    GIVEN a DesanityRegistry
+    WHEN an unknown guid or name is looked up
+    SHOULD raise a DesanityUnknownDev
+    """
+    registry = DesanityRegistry(make_devices())
+
+    with pytest.raises(DesanityUnknownDev):
+        registry.get_by_guid("not-a-guid")
+
+    with pytest.raises(DesanityUnknownDev):
+        registry.get_by_name("epson5:net1;dev0")
+
+
+def test_replace():
+    """
+    GIVEN a DesanityRegistry holding devices
+    WHEN the devices are replaced
+    SHOULD return the previous devices
+    SHOULD resolve the new devices
+    """
+    old = make_devices()
+    new = make_devices()
+    registry = DesanityRegistry(old)
+
+    assert registry.replace(new) == old
+    assert registry.get_by_name("brother4:net1;dev0") is new[0]
+    assert registry.get_by_guid(old[1].guid) is new[1]
+
+
+def test_writer_waits_for_readers():
+    """
+    GIVEN a ReadWriteLock held by a reader
+    WHEN a writer asks for the lock
+    SHOULD wait until the reader releases it
+    """
+    lock = ReadWriteLock()
+    acquired = Event()
+
+    def writer():
+        with lock.write_locked():
+            acquired.set()
+
+    with lock.read_locked():
+        thread = Thread(target=writer)
+        thread.start()
+        assert not acquired.wait(0.1)
+
+    thread.join(1)
+    assert acquired.is_set()
+
+# }}}
@@ -0,0 +1,145 @@
+###############################################################################
+#  test_desanity_retention.py for archivist descry microservice unit tests    #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity job retention."""
+# }}}
+
+# Libraries {{{
+import os
+from datetime import datetime, timedelta
+from PIL import Image
+from app.utils import DesanityDevice
+from app.utils.desanityRetention import DesanityRetention
+# }}}
+
+# desanityRetention unit tests {{{
+
+
+def make_device(tmp_path, name, jobs):
+    """Return a device holding finished jobs of one page, newest first."""
+    dev = DesanityDevice(name, "ACME Corp", "B", "ABCDEF", str(tmp_path))
+    with Image.open("tests/data/lorem1.png") as img:
+        img.load()
+
+    for _ in range(jobs):
+        job = dev._get_next_job()
+        job.add_image(img)
+        job.mark_complete()
+
+    return dev
+
+
+def test_collect_by_count(tmp_path):
+    """
+    GIVEN a device holding more finished jobs than retained
+    WHEN the collector runs
+    SHOULD evict the oldest jobs and their spools
+    SHOULD report the bytes reclaimed
+    """
+    dev = make_device(tmp_path, "aScanner", 3)
+    oldest = dev.jobs[-1]
+    size = oldest.spool.size
+
+    result = DesanityRetention(max_jobs=2).collect([dev])
+
+    assert result == {'evicted_jobs': 1, 'reclaimed_bytes': size}
+    assert oldest not in dev.jobs
+    assert not os.path.exists(oldest.spool.path)
+
+
+def test_collect_by_age(tmp_path):
+    """
+    GIVEN a device holding a job finished before the retention age
+    WHEN the collector runs
+    SHOULD evict only that job
+    """
+    dev = make_device(tmp_path, "aScanner", 2)
+    old = dev.jobs[-1]
+    old._end_date = datetime.now() - timedelta(hours=2)
+
+    result = DesanityRetention(max_age=3600).collect([dev])
+
+    assert result['evicted_jobs'] == 1
+    assert len(dev.jobs) == 1
+    assert old not in dev.jobs
+
+
+def test_collect_by_bytes(tmp_path):
+    """
+    GIVEN devices whose spools exceed the per device and global budgets
+    WHEN the collector runs
+    SHOULD evict the oldest jobs until every budget is met
+    """
+    first = make_device(tmp_path, "aScanner", 3)
+    second = make_device(tmp_path, "anotherScanner", 1)
+    page_bytes = first.jobs[0].spool.size
+
+    retention = DesanityRetention(max_bytes=2 * page_bytes,
+                                  max_total_bytes=2 * page_bytes)
+    retention.collect([first, second])
+
+    assert len(first.jobs) + len(second.jobs) == 2
+    assert second.jobs
+    assert retention.stats['evicted_jobs'] == 2
+    assert retention.stats['reclaimed_bytes'] == 2 * page_bytes
+
+
+def test_collect_by_total_count(tmp_path):
+    """
+    GIVEN devices holding more finished jobs together than retained
+    WHEN the collector runs
+    SHOULD evict the oldest jobs over every device
+    """
+    first = make_device(tmp_path, "aScanner", 2)
+    second = make_device(tmp_path, "anotherScanner", 2)
+    oldest = first.jobs[-1]
+    oldest._end_date = datetime.now() - timedelta(minutes=1)
+
+    result = DesanityRetention(max_total_jobs=3).collect([first, second])
+
+    assert result['evicted_jobs'] == 1
+    assert oldest not in first.jobs
+    assert len(second.jobs) == 2
+
+
+def test_collect_skips_pending(tmp_path):
+    """
+    GIVEN a device holding a queued job
+    WHEN the collector runs with no jobs retained
+    SHOULD leave the queued job alone
+    """
+    dev = make_device(tmp_path, "aScanner", 1)
+    queued = dev._get_next_job()
+
+    DesanityRetention(max_jobs=0).collect([dev])
+
+    assert dev.jobs == [queued]
+
+
+def test_jobs_per_device(tmp_path):
+    """
+    GIVEN two devices
+    WHEN a job is created on one of them
+    SHOULD not show up on the other
+    """
+    first = make_device(tmp_path, "aScanner", 1)
+    second = make_device(tmp_path, "anotherScanner", 0)
+
+    assert len(first.jobs) == 1
+    assert second.jobs == []
+
+# }}}
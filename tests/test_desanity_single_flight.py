@@ -0,0 +1,111 @@
+###############################################################################
+#  test_desanity_single_flight.py for archivist descry unit tests             #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for desanity single flight execution."""
+# }}}
+
+# Libraries {{{
+import time
+from threading import Event, Thread
+from unittest import mock
+import pytest
+from app.utils.desanitySingleFlight import DesanitySingleFlight
+# }}}
+
+# desanitySingleFlight unit tests {{{
+
+
+def test_concurrent_calls_share_execution():
+    """
+    GIVEN a DesanitySingleFlight
+    WHEN several callers run the same key concurrently
+    SHOULD execute the function once and hand every caller its result
+    """
+    flights = DesanitySingleFlight()
+    release = Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(1)
+        return "1.0.0"
+
+    results = []
+    threads = [Thread(target=lambda: results.append(flights.do("init",
+                                                               slow)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(1000):
+        if flights.coalesced == 3:
+            break
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(1)
+
+    assert len(calls) == 1
+    assert results == ["1.0.0"] * 4
+
+
+def test_debounce_reuses_result():
+    """
+    GIVEN a DesanitySingleFlight
+    WHEN a key is called again within the debounce window
+    SHOULD reuse the previous result
+    """
+    flights = DesanitySingleFlight()
+    func = mock.Mock(return_value="1.0.0")
+
+    flights.do("init", func, debounce=60)
+    flights.do("init", func, debounce=60)
+
+    func.assert_called_once()
+
+
+def test_no_debounce_runs_again():
+    """
+    GIVEN a DesanitySingleFlight
+    WHEN a key is called again after the previous call finished
+    WHEN no debounce window is set
+    SHOULD execute the function again
+    """
+    flights = DesanitySingleFlight()
+    func = mock.Mock(return_value="1.0.0")
+
+    flights.do("init", func)
+    flights.do("init", func)
+
+    assert func.call_count == 2
+
+
+def test_errors_are_not_debounced():
+    """
+    GIVEN a DesanitySingleFlight
+    WHEN a call fails
+    SHOULD raise the error
+    SHOULD execute the function again on the next call
+    """
+    flights = DesanitySingleFlight()
+    func = mock.Mock(side_effect=[RuntimeError("busy"), "1.0.0"])
+
+    with pytest.raises(RuntimeError):
+        flights.do("init", func, debounce=60)
+
+    assert flights.do("init", func, debounce=60) == "1.0.0"
+
+# }}}
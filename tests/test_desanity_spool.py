@@ -0,0 +1,116 @@
+###############################################################################
+#  test_desanity_spool.py for archivist descry microservice unit tests        #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity page spool."""
+# }}}
+
+# Libraries {{{
+import os
+from PIL import Image
+from app.utils.desanitySpool import DesanitySpool, DesanityPage
+from app.utils.desanityJobs import DesanityJob
+# }}}
+
+# desanitySpool unit tests {{{
+
+
+def load_page(number):
+    """Return a decoded test page."""
+    with Image.open(f"tests/data/lorem{number}.png") as img:
+        img.load()
+
+    return img
+
+
+def test_add_image(tmp_path):
+    """
+    GIVEN a DesanitySpool
+    WHEN add_image is called
+    SHOULD write the encoded page to the spool directory
+    SHOULD return a page handle describing the page
+    """
+    spool = DesanitySpool(str(tmp_path / "job"))
+    page = spool.add_image(load_page(1))
+
+    assert isinstance(page, DesanityPage)
+    assert page.number == 1
+    assert os.path.exists(page.path)
+    assert page.size == os.path.getsize(page.path)
+    assert os.path.exists(tmp_path / "job" / DesanitySpool.INDEX)
+
+
+def test_page_lazy_image(tmp_path):
+    """
+    GIVEN a spooled page
+    WHEN image is accessed
+    SHOULD decode the page from disk
+    """
+    original = load_page(2)
+    spool = DesanitySpool(str(tmp_path / "job"))
+    page = spool.add_image(original)
+
+    assert page.image.size == original.size
+    assert page.image.mode == original.mode
+
+
+def test_load(tmp_path):
+    """
+    GIVEN a spool with pages written to disk
+    WHEN load is called on the spool directory
+    SHOULD restore the page handles from the index
+    """
+    spool = DesanitySpool(str(tmp_path / "job"), "JPEG")
+    spool.add_image(load_page(1).convert("RGB"))
+    spool.add_image(load_page(2).convert("RGB"))
+
+    loaded = DesanitySpool.load(str(tmp_path / "job"))
+
+    assert loaded.format == "JPEG"
+    assert [page.number for page in loaded.pages] == [1, 2]
+    assert loaded.size == spool.size
+
+
+def test_delete(tmp_path):
+    """
+    GIVEN a spool with pages written to disk
+    WHEN delete is called
+    SHOULD remove the spool directory
+    """
+    spool = DesanitySpool(str(tmp_path / "job"))
+    spool.add_image(load_page(1))
+
+    spool.delete()
+
+    assert not os.path.exists(tmp_path / "job")
+    assert spool.pages == []
+
+
+def test_jobs_do_not_share_pages(tmp_path):
+    """
+    GIVEN two DesanityJobs
+    WHEN an image is added to one job
+    SHOULD not show up in the other job
+    """
+    job_a = DesanityJob(1, str(tmp_path))
+    job_b = DesanityJob(2, str(tmp_path))
+
+    job_a.add_image(load_page(1))
+
+    assert len(job_a.pages) == 1
+    assert len(job_b.pages) == 0
+
+# }}}
@@ -0,0 +1,114 @@
+###############################################################################
+#  test_desanity_warmup.py for archivist descry microservice unit tests       #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity boot time warm up."""
+# }}}
+
+# Libraries {{{
+import time
+from unittest import mock
+import sane
+from tests.mocks.mockBrother import MockBrotherDev
+from app.utils import DesanityDevice
+from app.utils.desanityWarmup import DesanityWarmup
+# }}}
+
+# desanityWarmup unit tests {{{
+
+
+def slow_open(name):
+    """Open a mock device the way a slow network device opens."""
+    if name == 'broken':
+        raise sane._sane.error('Invalid argument')
+    time.sleep(0.2)
+    return MockBrotherDev(pages=1)
+
+
+@mock.patch.object(sane, "open", side_effect=slow_open)
+def test_warmup_opens_concurrently(mock_sane_open, tmp_path):
+    """
+    GIVEN three configured devices that each take a while to open
+    WHEN the warm up runs
+    SHOULD open them concurrently and load their options
+    SHOULD report the time taken by every stage of every device
+    """
+    devices = [DesanityDevice(name, "ACME Corp", "B", "ABCDEF",
+                              str(tmp_path))
+               for name in ('scan-a', 'scan-b', 'scan-c', 'unwanted')]
+    warmup = DesanityWarmup(lambda dev: dev.enable(),
+                            ['scan-a', 'scan-b', devices[2].guid])
+
+    began = time.monotonic()
+    report = warmup.run(devices)
+
+    assert time.monotonic() - began < 0.5
+    assert mock_sane_open.call_count == 3
+    assert not devices[3].enabled
+    assert all(dev.enabled and dev._options is not None
+               for dev in devices[:3])
+    for entry in report:
+        assert entry['status'] == 'ready'
+        assert entry['timings']['open'] >= 0.2
+        assert set(entry['timings']) == {'open', 'options', 'parameters',
+                                         'total'}
+
+
+@mock.patch.object(sane, "open", side_effect=slow_open)
+def test_warmup_reports_errors(mock_sane_open, tmp_path):
+    """
+    GIVEN a configured device failing to open
+    WHEN the warm up runs
+    SHOULD report the error of that device and warm up the others
+    """
+    devices = [DesanityDevice(name, "ACME Corp", "B", "ABCDEF",
+                              str(tmp_path))
+               for name in ('broken', 'scan-a')]
+    warmup = DesanityWarmup(lambda dev: dev.enable(), ['*'])
+
+    report = {entry['device']: entry for entry in warmup.run(devices)}
+
+    assert report['broken']['status'] == 'error'
+    assert report['broken']['error'] == 'Invalid argument'
+    assert report['scan-a']['status'] == 'ready'
+    assert mock_sane_open.call_count == 2
+
+
+@mock.patch.object(sane, "open", side_effect=slow_open)
+def test_warmup_reports_raw_errors(mock_sane_open, tmp_path):
+    """
+    GIVEN a configured device raising a raw SANE error reading its options
+    WHEN the warm up runs in the background
+    SHOULD report the error of that device and finish the warm up
+    """
+    devices = [DesanityDevice(name, "ACME Corp", "B", "ABCDEF",
+                              str(tmp_path))
+               for name in ('failing', 'scan-a')]
+    warmup = DesanityWarmup(lambda dev: dev.enable(), ['*'])
+
+    with mock.patch.object(devices[0], "_load_options",
+                           side_effect=sane._sane.error('I/O error')):
+        warmup.start(lambda: devices)
+        warmup.join(5)
+
+    state = warmup.serialize_json()
+    report = {entry['device']: entry for entry in state['devices']}
+    assert state['finished_at'] is not None
+    assert report['failing']['status'] == 'error'
+    assert report['failing']['error'] == 'I/O error'
+    assert report['scan-a']['status'] == 'ready'
+
+# }}}
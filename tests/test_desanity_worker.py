@@ -0,0 +1,71 @@
+###############################################################################
+#  test_desanity_worker.py for archivist descry microservice unit tests       #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""Unit tests for the desanity device worker."""
+# }}}
+
+# Libraries {{{
+from threading import Event, current_thread
+import pytest
+from app.utils.desanityWorker import DesanityDeviceWorker
+# }}}
+
+# desanityWorker unit tests {{{
+
+
+def test_commands_in_order():
+    """
+    GIVEN a DesanityDeviceWorker
+    WHEN commands are submitted from several threads
+    SHOULD run them one at a time, in order, on the worker thread
+    """
+    worker = DesanityDeviceWorker('test-worker')
+    release = Event()
+    ran = []
+
+    blocked = worker.submit(release.wait)
+    futures = [worker.submit(lambda n=n: ran.append(
+        (n, current_thread().name))) for n in range(5)]
+    release.set()
+
+    assert blocked.result() is True
+    for future in futures:
+        future.result()
+    assert ran == [(n, 'test-worker') for n in range(5)]
+    assert worker.stats['executed'] == 6
+
+    worker.stop()
+    assert not worker.running
+
+
+def test_call_inline_and_errors():
+    """
+    GIVEN a DesanityDeviceWorker
+    WHEN a command calls the worker again or raises
+    SHOULD run the nested command inline
+    SHOULD raise the error in the caller
+    """
+    worker = DesanityDeviceWorker('test-worker')
+
+    assert worker.call(lambda: worker.call(lambda: 42)) == 42
+
+    with pytest.raises(ZeroDivisionError):
+        worker.call(lambda: 1 / 0)
+
+    worker.stop()
+
+# }}}
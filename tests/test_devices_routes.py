@@ -21,7 +21,10 @@
 # libraries # {{
 import pytest
 import sane
+from PIL import Image
 from app.utils.desanity import desanity
+from app.utils import DesanityDevice
+from app.utils.desanityRegistry import DesanityRegistry
 from app.appfactory import create_app
 from app.config import TestConfig
 from .config import sane_devices
@@ -147,4 +150,268 @@ def test_get_open_device_unknown(test_client, mocker):
     assert f"Sane device {device_name} not found" in resp.json['ErrMsg']
 
 
+@pytest.fixture(name='scanned_device')
+def fixture_scanned_device(mocker, tmp_path):
+    """Device with a single completed job holding one page."""
+    dev = DesanityDevice("aScanner", "ACME Corp", "B", "ABCDEF",
+                         str(tmp_path))
+    job = dev._get_next_job()
+    with Image.open("tests/data/lorem1.png") as img:
+        img.load()
+    job.add_image(img)
+    job.mark_complete()
+
+    mocker.patch.object(desanity, "_registry", DesanityRegistry([dev]))
+    return dev, job
+
+
+def test_get_job_page(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/jobs/{job}/pages/{n} is invoked
+    WHEN the page exists
+    SHOULD return the encoded page with its length and range support
+    """
+    dev, job = scanned_device
+    page = job.get_page(1)
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/jobs/{job.guid}'
+                           '/pages/1')
+
+    assert resp.status_code == 200
+    assert resp.mimetype == 'image/png'
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+    assert int(resp.headers['Content-Length']) == page.size
+
+
+def test_get_job_page_range(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/jobs/{job}/pages/{n} is invoked with a Range header
+    SHOULD return only the requested bytes
+    """
+    dev, job = scanned_device
+    with job.get_page(1).open() as page_fp:
+        page_fp.seek(100)
+        expected = page_fp.read(100)
+
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/jobs/'
+                           f'{job.job_number}/pages/1',
+                           headers={'Range': 'bytes=100-199'})
+
+    assert resp.status_code == 206
+    assert resp.data == expected
+
+
+def test_get_job_page_unknown(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/jobs/{job}/pages/{n} is invoked
+    WHEN the page does not exist
+    SHOULD return a 404
+    """
+    dev, job = scanned_device
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/jobs/{job.guid}'
+                           '/pages/2')
+
+    assert resp.status_code == 404
+
+
+def test_get_job_page_preview(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/jobs/{job}/pages/{n}/thumbnail is invoked
+    SHOULD return a JPEG thumbnail of the page
+    """
+    dev, job = scanned_device
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/jobs/{job.guid}'
+                           '/pages/1/thumbnail')
+
+    assert resp.status_code == 200
+    assert resp.mimetype == 'image/jpeg'
+
+
+def test_delete_job(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/jobs/{job} is deleted
+    SHOULD remove the job and invalidate its cached previews
+    """
+    dev, job = scanned_device
+    desanity.previews.clear()
+    test_client.get(f'/api/v1/devices/{dev.guid}/jobs/{job.guid}'
+                    '/pages/1/thumbnail')
+    resp = test_client.delete(f'/api/v1/devices/{dev.guid}/jobs/{job.guid}')
+
+    assert resp.status_code == 200
+    assert job not in dev.jobs
+    assert desanity.previews.stats['entries'] == 0
+
+
+def test_stream_job_progress(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/jobs/{job}/live is invoked
+    WHEN the job has finished
+    SHOULD stream the final progress event and close the stream
+    """
+    dev, job = scanned_device
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/jobs/{job.guid}'
+                           '/live')
+
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/event-stream'
+    assert b'"pages": 1' in resp.data
+    assert b'"status": 1' in resp.data
+
+
+def test_abort_finished_job(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/jobs/{job}/abort is invoked
+    WHEN the job has finished
+    SHOULD return a 409
+    """
+    dev, job = scanned_device
+    resp = test_client.put(f'/api/v1/devices/{dev.guid}/jobs/{job.guid}'
+                           '/abort')
+
+    assert resp.status_code == 409
+
+
+def test_set_device_options(test_client, scanned_device, mocker):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/options is patched with a batch of options
+    SHOULD return the options delta and the final options
+    """
+    dev, _ = scanned_device
+    mocker.patch.object(sane, "open", return_value=MockBrotherDev())
+    dev.enable()
+
+    resp = test_client.patch(f'/api/v1/devices/{dev.guid}/options',
+                             json={'options': {'resolution': 200,
+                                               'gamma': 2.0}})
+
+    assert resp.status_code == 200
+    assert list(resp.json['changed']) == ['resolution']
+    assert 'gamma' in resp.json['errors']
+    assert resp.json['options']['resolution']['value'] == 200
+
+
+def test_set_device_options_invalid(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/options is patched without an options object
+    SHOULD return a 400
+    """
+    dev, _ = scanned_device
+    resp = test_client.patch(f'/api/v1/devices/{dev.guid}/options',
+                             json={'resolution': 200})
+
+    assert resp.status_code == 400
+
+
+def test_save_and_apply_profile(test_client, scanned_device, mocker):
+    """
+    GIVEN a descry client
+    WHEN a scan profile is saved and applied to an enabled device
+    SHOULD set every option of the profile in one call
+    """
+    dev, _ = scanned_device
+    mocker.patch.object(sane, "open", return_value=MockBrotherDev())
+    dev.enable()
+
+    resp = test_client.put(f'/api/v1/devices/{dev.guid}/profiles/invoice',
+                           json={'options': {'resolution': '200',
+                                             'mode': 'Gray'}})
+    assert resp.status_code == 200
+
+    resp = test_client.put(f'/api/v1/devices/{dev.guid}/profiles/invoice'
+                           '/apply')
+
+    assert resp.status_code == 200
+    assert resp.json['profile'] == 'invoice'
+    assert resp.json['errors'] == {}
+    assert resp.json['options']['resolution']['value'] == 200
+    assert resp.json['options']['mode']['value'] == 'Gray'
+
+
+def test_apply_unknown_profile(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN an unknown scan profile is applied
+    SHOULD return a 404
+    """
+    dev, _ = scanned_device
+    resp = test_client.put(f'/api/v1/devices/{dev.guid}/profiles/nothing'
+                           '/apply')
+
+    assert resp.status_code == 404
+
+
+def test_scan_unknown_priority(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/scan is invoked with an unknown priority
+    SHOULD return a 400
+    """
+    dev, _ = scanned_device
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/scan'
+                           '?priority=urgent')
+
+    assert resp.status_code == 400
+
+
+def test_get_queue(test_client, scanned_device):
+    """
+    GIVEN a descry client
+    WHEN /devices/{guid}/queue is invoked
+    SHOULD return the queue depth and wait times
+    """
+    dev, _ = scanned_device
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/queue')
+
+    assert resp.status_code == 200
+    assert resp.json['depth'] == 0
+    assert resp.json['jobs'] == []
+
+
+def test_get_job_state(test_client, scanned_device, mocker):
+    """
+    GIVEN a descry client sharing a job store with another worker
+    WHEN /devices/{guid}/jobs/{job} is invoked for a job of that worker
+    SHOULD return the status of the job from the job store
+    """
+    dev, job = scanned_device
+    mocker.patch.object(desanity, "_job_store", dev._job_store)
+
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/jobs/'
+                           f'{job.job_number}')
+
+    assert resp.status_code == 200
+    assert resp.json['guid'] == job.guid
+    assert resp.json['pages'] == 1
+
+    resp = test_client.get(f'/api/v1/devices/{dev.guid}/jobs')
+    assert resp.json['jobs'] == [job.guid]
+
+
+def test_get_devices_health(test_client, scanned_device, mocker):
+    """
+    GIVEN a descry client with a probed device
+    WHEN /devices is invoked
+    SHOULD list the cached health of the device without calling SANE
+    """
+    dev, _ = scanned_device
+    mock_sane_open = mocker.patch.object(sane, "open")
+    mock_sane_open.return_value = MockBrotherDev()
+    dev.enable()
+    desanity.health.probe([dev])
+
+    resp = test_client.get('/api/v1/devices')
+
+    assert resp.status_code == 200
+    assert resp.json['devices'][0]['health']['reachable'] is True
+    mock_sane_open.assert_called_once()
+
 # }}}